@@ -0,0 +1,54 @@
+"""
+Lazily initialized Groq clients shared by the AI endpoints.
+
+The groq SDK (and the httpx/pydantic stack underneath it) is only imported the
+first time a request actually needs the LLM, so gunicorn workers boot without
+paying for it. The client is reused afterwards so its connection pool is too.
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+# AsyncGroq's connection pool is bound to the event loop that created it
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_groq_client():
+    """Return the shared Groq client, or None when GROQ_API_KEY is not configured"""
+    global _client, _client_key
+    api_key = settings.GROQ_API_KEY
+    if not api_key:
+        return None
+
+    if _client is None or _client_key != api_key:
+        with _client_lock:
+            if _client is None or _client_key != api_key:
+                from groq import Groq
+                _client = Groq(api_key=api_key)
+                _client_key = api_key
+                logger.info("Groq client initialized")
+    return _client
+
+
+def get_async_groq_client():
+    """Return an AsyncGroq client for the running event loop, or None when not configured"""
+    api_key = settings.GROQ_API_KEY
+    if not api_key:
+        return None
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.api_key != api_key:
+        from groq import AsyncGroq
+        client = AsyncGroq(api_key=api_key)
+        _async_clients[loop] = client
+        logger.info("AsyncGroq client initialized")
+    return client
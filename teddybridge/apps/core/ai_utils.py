@@ -0,0 +1,22 @@
+"""
+Shared helpers for prompts sent to the LLM (token estimation and budgeting)
+"""
+
+# Rough characters-per-token ratio for English text with the Groq-hosted models.
+# Good enough for budgeting; we never need an exact count.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for a prompt fragment"""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text, max_tokens, suffix='...'):
+    """Trim text so that it fits within max_tokens (estimated)"""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(suffix))
+    return text[:max_chars].rstrip() + suffix
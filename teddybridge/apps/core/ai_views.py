@@ -2,242 +2,113 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Avg, Count, Q
-from groq import Groq
-from django.conf import settings
-from .models import User, Doctor, Patient, DoctorReview, DoctorPatientLink
+from .ai_client import get_groq_client
+from .teddy_context import get_user_context
+from .teddy_memory import get_conversation, build_chat_messages, record_turn, stored_conversation_id
+from .models import TeddyConversation
 import json
+import logging
 
-def get_groq_client():
-    if settings.GROQ_API_KEY:
-        return Groq(api_key=settings.GROQ_API_KEY)
+logger = logging.getLogger(__name__)
+
+TEDDY_MODEL = "openai/gpt-oss-120b"
+
+def _get_chat_body(request):
+    """Read the chat payload from the request body (raises on malformed input)"""
+    if hasattr(request, 'data'):
+        return request.data
+    return json.loads(request.body) if request.body else {}
+
+def _get_chat_user(request):
+    """Return the authenticated user, or None for guests (landing page)"""
+    try:
+        user = request.user
+        if user and user.is_authenticated and hasattr(user, 'role'):
+            return user
+    except Exception as e:
+        logger.warning(f"Error checking authentication: {str(e)}")
     return None
 
+def prepare_chat(user, message, conversation_id=None):
+    """
+    Load the context snapshot and conversation and build the model messages.
+
+    Returns (snapshot, conversation, messages, metrics). Guests stay stateless
+    (conversation is None); raises TeddyConversation.DoesNotExist when a
+    signed-in user passes an id that is not theirs.
+    """
+    # Precomputed per-user context (single cache read, rebuilt only after invalidation)
+    snapshot = get_user_context(user)
+    conversation = None
+    if user:
+        conversation = get_conversation(user, conversation_id)
+        if not conversation:
+            raise TeddyConversation.DoesNotExist()
+    messages, metrics = build_chat_messages(snapshot['system_prompt'], message, conversation)
+    return snapshot, conversation, messages, metrics
+
+def finish_chat(conversation, message, ai_response, metrics, usage=None):
+    """Store the turn (signed-in users) and return the usage block for the response"""
+    prompt_tokens = getattr(usage, 'prompt_tokens', None) or metrics['promptTokens']
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    if conversation:
+        completion_tokens = record_turn(conversation, message, ai_response, prompt_tokens, completion_tokens)
+    return {
+        'promptTokens': prompt_tokens,
+        'completionTokens': completion_tokens,
+        'historyTokens': metrics['historyTokens'],
+        'summaryTokens': metrics['summaryTokens'],
+        'historyTurns': metrics['historyTurns'],
+    }
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @csrf_exempt
 def teddy_ai_chat(request):
     """Teddy AI Assistant chat endpoint with full context about TeddyBridge"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     # Wrap entire function in try-except for better error handling
     try:
-        # Allow unauthenticated users (for landing page)
-        try:
-            is_authenticated = hasattr(request, 'user') and hasattr(request.user, 'is_authenticated') and request.user.is_authenticated
-        except Exception as e:
-            logger.warning(f"Error checking authentication: {str(e)}")
-            is_authenticated = False
-        
         # Get message from request body
         try:
-            if hasattr(request, 'data'):
-                message = request.data.get('message')
-            else:
-                import json
-                body = json.loads(request.body) if request.body else {}
-                message = body.get('message')
+            body = _get_chat_body(request)
+            message = body.get('message')
+            conversation_id = body.get('conversationId')
         except Exception as e:
             logger.error(f"Error parsing request data: {str(e)}")
             return Response({'error': 'Invalid request format'}, status=status.HTTP_400_BAD_REQUEST)
-        
+
         if not message:
             return Response({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
-        
+
         groq_client = get_groq_client()
         if not groq_client:
             return Response({'error': 'AI service not configured'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-        
-        # Build context based on user role
-        context_info = ""
-        doctor_recommendations = ""
-        user_role = "guest"
-        
-        if is_authenticated:
-            try:
-                user = request.user
-                if not user or not hasattr(user, 'role'):
-                    is_authenticated = False
-                    user_role = "guest"
-                else:
-                    user_role = user.role
-            except Exception as e:
-                logger.error(f"Error accessing user in teddy_ai_chat: {str(e)}")
-                is_authenticated = False
-                user_role = "guest"
-        
-        if is_authenticated and user_role in ['patient', 'doctor']:
-            if user_role == 'patient':
-                try:
-                    patient = user.patient_profile
-                except Patient.DoesNotExist:
-                    patient = Patient.objects.create(user=user)
-                
-                # Get linked doctors with reviews
-                links = DoctorPatientLink.objects.filter(patient=patient).select_related('doctor__user')
-                doctor_ids = [link.doctor.id for link in links]
-                
-                # Get review data for recommendations
-                reviews_data = DoctorReview.objects.filter(doctor_id__in=doctor_ids).values('doctor_id').annotate(
-                    avg_rating=Avg('rating'),
-                    review_count=Count('id')
-                )
-                reviews_dict = {str(r['doctor_id']): {'avgRating': float(r['avg_rating']) if r['avg_rating'] else None, 'reviewCount': r['review_count']} for r in reviews_data}
-                
-                # Build doctor recommendations context
-                doctors_list = []
-                for link in links:
-                    doctor_id_str = str(link.doctor.id)
-                    review_info = reviews_dict.get(doctor_id_str, {'avgRating': None, 'reviewCount': 0})
-                    doctors_list.append({
-                        'name': link.doctor.user.name,
-                        'specialty': link.doctor.specialty or 'General',
-                        'avgRating': review_info['avgRating'],
-                        'reviewCount': review_info['reviewCount'],
-                        'bio': link.doctor.bio or '',
-                    })
-                
-                if doctors_list:
-                    doctor_recommendations = "\n\nAvailable Doctors with Reviews (use these for recommendations):\n"
-                    # Sort by rating (highest first)
-                    doctors_sorted = sorted(doctors_list, key=lambda x: x['avgRating'] or 0, reverse=True)
-                    for doc in doctors_sorted:
-                        rating_text = f"{doc['avgRating']:.1f} stars" if doc['avgRating'] else "No ratings yet"
-                        review_text = f"{doc['reviewCount']} review{'s' if doc['reviewCount'] != 1 else ''}"
-                        doctor_recommendations += f"- **{doc['name']}** ({doc['specialty']}): {rating_text} from {review_text}"
-                        if doc['bio']:
-                            doctor_recommendations += f"\n  Bio: {doc['bio'][:150]}"
-                        doctor_recommendations += "\n"
-                    
-                    # Add recommendation guidance
-                    doctor_recommendations += "\nWhen recommending doctors:\n"
-                    doctor_recommendations += "- Prioritize doctors with higher ratings (4+ stars)\n"
-                    doctor_recommendations += "- Consider specialty match with patient's medical needs\n"
-                    doctor_recommendations += "- Mention review count for credibility\n"
-                    doctor_recommendations += "- Encourage patients to read reviews and leave their own after consultations\n"
-                
-                # Safely handle medical_conditions
-                medical_conditions_str = 'None specified'
-                if patient.medical_conditions:
-                    if isinstance(patient.medical_conditions, list):
-                        medical_conditions_str = ', '.join(patient.medical_conditions) if patient.medical_conditions else 'None specified'
-                    else:
-                        medical_conditions_str = str(patient.medical_conditions)
-                
-                context_info = f"""
-Patient Information:
-- Name: {user.name}
-- Email: {user.email}
-- Linked Doctors: {len(doctors_list)}
-- Medical Conditions: {medical_conditions_str}
-"""
-                
-            elif user_role == 'doctor':
-                try:
-                    doctor = user.doctor_profile
-                except Doctor.DoesNotExist:
-                    doctor = Doctor.objects.create(user=user)
-                
-                # Get patient count and stats
-                patient_count = DoctorPatientLink.objects.filter(doctor=doctor).count()
-                
-                # Get review stats
-                review_stats = DoctorReview.objects.filter(doctor=doctor).aggregate(
-                    avg_rating=Avg('rating'),
-                    total_reviews=Count('id')
-                )
-                
-                # Format average rating
-                avg_rating_str = f"{review_stats['avg_rating']:.1f}" if review_stats['avg_rating'] is not None else 'N/A'
-                
-                context_info = f"""
-Doctor Information:
-- Name: {user.name}
-- Email: {user.email}
-- Specialty: {doctor.specialty or 'Not specified'}
-- License Number: {doctor.license_number or 'Not specified'}
-- Total Patients: {patient_count}
-- Average Rating: {avg_rating_str} stars
-- Total Reviews: {review_stats['total_reviews']}
-"""
-        else:
-            # Guest user (landing page)
-            context_info = """
-Guest User:
-- Not logged in
-- Can provide general information about TeddyBridge
-- Should encourage registration/login for personalized features
-"""
-        
-        # Build comprehensive system prompt
-        system_prompt = f"""You are Teddy, the AI assistant for TeddyBridge - a healthcare platform that connects patients with specialized doctors for joint replacement consultations and PROMS (Patient-Reported Outcome Measures) tracking.
 
-PLATFORM KNOWLEDGE:
-- TeddyBridge is a peer-to-peer healthcare platform
-- PROMSBridge is the patient-facing side for PROMS tracking
-- Doctors can connect with peers for consultations
-- Patients can link to doctors via QR codes
-- The platform supports automated PROMS assessments (Pre, Post, and follow-up)
-- HIPAA-compliant video consultations are available
-- Review and recommendation system allows patients to rate doctors
-
-{context_info}
-
-{doctor_recommendations if doctor_recommendations else ''}
-
-CAPABILITIES:
-1. For Patients:
-   - Help find and recommend doctors based on medical needs and reviews
-   - Explain how to link with doctors via QR code
-   - Guide on PROMS assessments
-   - Answer questions about the platform
-
-2. For Doctors:
-   - Help manage patient relationships
-   - Explain PROMS monitoring features
-   - Guide on peer-to-peer consultations
-   - Help understand review feedback
-
-IMPORTANT GUIDELINES:
-- Always be helpful, professional, and empathetic
-- Use review ratings and feedback when recommending doctors to patients
-- When recommending doctors, prioritize those with higher ratings (4+ stars) and more reviews
-- Consider specialty match when suggesting doctors
-- Encourage patients to read reviews and leave their own after consultations
-- Provide accurate information about platform features
-- If asked about medical advice, recommend consulting with a doctor
-- Be concise but thorough in responses
-- For patients: Help them understand how to link with doctors via QR code
-- For doctors: Help them understand PROMS monitoring and patient management features
-
-REVIEW SYSTEM:
-- Patients can rate doctors from 1-5 stars
-- Reviews help other patients make informed decisions
-- Doctors can see their average ratings and review counts
-- Use review data to provide personalized recommendations
+        try:
+            snapshot, conversation, messages, metrics = prepare_chat(_get_chat_user(request), message, conversation_id)
+        except TeddyConversation.DoesNotExist:
+            return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
+        user_role = snapshot['role']
 
-Current user role: {user_role}
-"""
-        
         try:
             response = groq_client.chat.completions.create(
-                model="openai/gpt-oss-120b",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message}
-                ],
+                model=TEDDY_MODEL,
+                messages=messages,
                 temperature=0.7,
                 max_tokens=1500
             )
-            
-            ai_response = response.choices[0].message.content
-            
+
+            ai_response = response.choices[0].message.content or ''
+            usage = finish_chat(conversation, message, ai_response, metrics, getattr(response, 'usage', None))
+
             return Response({
                 'success': True,
                 'response': ai_response,
-                'role': user_role
+                'role': user_role,
+                'conversationId': str(conversation.id) if conversation else None,
+                'usage': usage,
             })
         except Exception as e:
             logger.error(f"Error in Groq API call: {str(e)}")
@@ -255,3 +126,138 @@ Current user role: {user_role}
             'error': f'An unexpected error occurred: {str(outer_error)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def sse_event(event, data):
+    """Format a single Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _relay_chat_stream(completion_stream, user_role, message, metrics, conversation=None):
+    """
+    Relay model tokens to the client as SSE frames.
+
+    The generator is pull-based: the server only asks for the next frame once the
+    previous one has been written to the socket, so we never read from the model
+    faster than the client consumes (backpressure). If the client disconnects the
+    server closes the generator, which closes the upstream stream and cancels
+    generation instead of paying for tokens nobody will read.
+    """
+    completed = False
+    parts = []
+    usage = None
+    try:
+        yield sse_event('start', {
+            'role': user_role,
+            'conversationId': stored_conversation_id(conversation),
+        })
+        for chunk in completion_stream:
+            # Groq reports usage on the final chunk
+            x_groq = getattr(chunk, 'x_groq', None)
+            if x_groq is not None and getattr(x_groq, 'usage', None):
+                usage = x_groq.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield sse_event('token', {'delta': delta})
+        completed = True
+
+        yield sse_event('done', {
+            'success': True,
+            'role': user_role,
+            'conversationId': str(conversation.id) if conversation else None,
+            'usage': finish_chat(conversation, message, ''.join(parts), metrics, usage),
+        })
+    except GeneratorExit:
+        logger.info("Teddy chat stream closed by client, cancelling generation")
+        raise
+    except Exception as e:
+        logger.error(f"Error while streaming Groq response: {str(e)}")
+        yield sse_event('error', {'error': f'Failed to get AI response: {str(e)}'})
+    finally:
+        if not completed:
+            completion_stream.close()
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@csrf_exempt
+def teddy_ai_chat_stream(request):
+    """Streaming variant of teddy_ai_chat that relays tokens as Server-Sent Events"""
+    try:
+        body = _get_chat_body(request)
+        message = body.get('message')
+        conversation_id = body.get('conversationId')
+    except Exception as e:
+        logger.error(f"Error parsing request data: {str(e)}")
+        return Response({'error': 'Invalid request format'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not message:
+        return Response({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    groq_client = get_groq_client()
+    if not groq_client:
+        return Response({'error': 'AI service not configured'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    try:
+        snapshot, conversation, messages, metrics = prepare_chat(_get_chat_user(request), message, conversation_id)
+    except TeddyConversation.DoesNotExist:
+        return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        completion_stream = groq_client.chat.completions.create(
+            model=TEDDY_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1500,
+            stream=True
+        )
+    except Exception as e:
+        logger.error(f"Error opening Groq stream: {str(e)}")
+        return Response({'error': f'Failed to get AI response: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    response = StreamingHttpResponse(
+        _relay_chat_stream(completion_stream, snapshot['role'], message, metrics, conversation),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx/Render proxies from buffering the stream
+    return response
+
+@api_view(['GET'])
+def get_teddy_conversation(request, conversation_id):
+    """Return the stored turns of a Teddy conversation with token totals"""
+    if not request.user.is_authenticated:
+        return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        conversation = TeddyConversation.objects.get(id=conversation_id, user=request.user)
+    except TeddyConversation.DoesNotExist:
+        return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    messages = []
+    prompt_total = 0
+    completion_total = 0
+    for msg in conversation.messages.all():
+        prompt_total += msg.prompt_tokens or 0
+        completion_total += msg.completion_tokens or 0
+        messages.append({
+            'id': str(msg.id),
+            'role': msg.role,
+            'content': msg.content,
+            'summarized': msg.summarized,
+            'promptTokens': msg.prompt_tokens,
+            'completionTokens': msg.completion_tokens,
+            'createdAt': msg.created_at.isoformat(),
+        })
+
+    return Response({
+        'id': str(conversation.id),
+        'summary': conversation.summary,
+        'messages': messages,
+        'usage': {
+            'promptTokens': prompt_total,
+            'completionTokens': completion_total,
+            'summaryTokens': conversation.summary_tokens,
+        },
+        'createdAt': conversation.created_at.isoformat(),
+        'updatedAt': conversation.updated_at.isoformat(),
+    })
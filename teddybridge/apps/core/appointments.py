@@ -0,0 +1,323 @@
+"""
+Shared appointment, meeting and call note list queries.
+
+Every appointment list on the doctor and patient side is built here:
+- scoped to one doctor or patient, filtered by status group and date range;
+- projected with .values() onto the columns the API returns (related names
+  included), so one page costs one query;
+- per-row flags such as hasNotes come from Exists() annotations;
+- paginated with keyset cursors on (time, id);
+- run on each of the viewer's shards and merged (see sharding.py), which
+  only matters for patients whose doctors are on different shards.
+
+The list bodies keep their historical shape (a JSON array). The cursor for
+the next page is sent in the X-Next-Cursor header, which is absent on the
+last page.
+"""
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime, time, timedelta
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.response import Response
+from .avatars import avatar_variant
+from .models import CallNote, Meeting
+from .sharding import scatter
+
+UPCOMING_STATUSES = ['scheduled', 'in_progress']
+STATUS_GROUPS = {
+    'completed': ['completed'],
+    'pending': UPCOMING_STATUSES,
+    'upcoming': UPCOMING_STATUSES,
+    'cancelled': ['cancelled'],
+}
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+MEETING_FIELDS = (
+    'id', 'title', 'status', 'scheduled_at', 'started_at', 'ended_at', 'meeting_url', 'created_at', 'has_transcript',
+)
+# The other party's columns, per viewer role
+COUNTERPART_FIELDS = {
+    'doctor': ('patient_id', 'patient__user__name', 'patient__user__avatar_url'),
+    'patient': ('doctor_id', 'doctor__specialty', 'doctor__user__name', 'doctor__user__avatar_url'),
+}
+NOTE_FIELDS = (
+    'id', 'meeting_id', 'chief_complaint', 'hpi', 'past_medical_history', 'medications', 'allergies',
+    'exam_observations', 'assessment', 'plan', 'urgent_flags', 'follow_up_questions', 'is_edited', 'created_at',
+    'meeting__created_at', 'meeting__patient__user__name', 'meeting__patient__user__avatar_url',
+)
+
+
+class QueryParamError(ValueError):
+    """A list query parameter the client has to fix (400)"""
+
+
+def parse_limit(params, default, maximum=MAX_PAGE_SIZE):
+    try:
+        limit = int(params.get('limit', default))
+    except (TypeError, ValueError):
+        raise QueryParamError('limit must be a number')
+    return min(max(limit, 1), maximum)
+
+
+def parse_statuses(value):
+    """Statuses for a ?status= value: a group (completed/pending/upcoming/cancelled), one status, or all (None)"""
+    if not value or value == 'all':
+        return None
+    if value in STATUS_GROUPS:
+        return STATUS_GROUPS[value]
+    if value in dict(Meeting.STATUS_CHOICES):
+        return [value]
+    raise QueryParamError(f'Unknown status: {value}')
+
+
+def _parse_bound(value, end_of_day):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise QueryParamError(f'Invalid date: {value}')
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_date_range(params):
+    """(start, end) from ?from= / ?to= (ISO dates or datetimes, both inclusive); either may be None"""
+    try:
+        start = _parse_bound(params['from'], end_of_day=False) if params.get('from') else None
+        end = _parse_bound(params['to'], end_of_day=True) if params.get('to') else None
+    except ValueError as e:
+        raise QueryParamError(str(e))
+    return start, end
+
+
+def period_range(period, now=None):
+    """The ?filter= windows of the upcoming-appointment widgets: today, week, month or all"""
+    now = now or timezone.now()
+    if period == 'today':
+        return now.replace(hour=0, minute=0, second=0, microsecond=0), now.replace(hour=23, minute=59, second=59, microsecond=999999)
+    if period == 'week':
+        return now - timedelta(days=7), None
+    if period == 'month':
+        return now - timedelta(days=30), None
+    return None, None
+
+
+def appointments(doctor=None, patient=None, statuses=None, start=None, end=None, with_notes=False):
+    """
+    Meetings for a doctor and/or patient, annotated with sort_at.
+
+    sort_at is the scheduled time, or the creation time for unscheduled
+    meetings, so every row has a cursor position.
+    """
+    meetings = Meeting.objects.all()
+    if doctor is not None:
+        meetings = meetings.filter(doctor=doctor)
+    if patient is not None:
+        meetings = meetings.filter(patient=patient)
+    if statuses:
+        meetings = meetings.filter(status__in=statuses)
+    if start:
+        meetings = meetings.filter(scheduled_at__gte=start)
+    if end:
+        meetings = meetings.filter(scheduled_at__lte=end)
+    meetings = meetings.annotate(sort_at=Coalesce('scheduled_at', 'created_at'))
+    if with_notes:
+        meetings = meetings.annotate(has_notes=Exists(CallNote.objects.filter(meeting=OuterRef('pk'))))
+    return meetings
+
+
+def appointment_rows(meetings, viewer):
+    """Project meetings onto the columns serialize_appointment needs for 'doctor' or 'patient' viewers"""
+    fields = MEETING_FIELDS + COUNTERPART_FIELDS[viewer] + ('sort_at',)
+    if 'has_notes' in meetings.query.annotations:
+        fields += ('has_notes',)
+    return meetings.values(*fields)
+
+
+def note_rows(doctor):
+    return CallNote.objects.filter(meeting__doctor=doctor).values(*NOTE_FIELDS)
+
+
+def _encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        payload = {'d': value.isoformat(), 'id': str(row_id)}
+    else:
+        payload = {'v': value, 'id': str(row_id)}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        row_id = uuid.UUID(payload['id'])
+        value = parse_datetime(payload['d']) if 'd' in payload else payload['v']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise QueryParamError('Invalid cursor')
+    if value is None or isinstance(value, (dict, list)):
+        raise QueryParamError('Invalid cursor')
+    return value, row_id
+
+
+def paginate(rows, sort_field, limit, cursor=None, descending=True):
+    """
+    One keyset page of a .values() queryset ordered by (sort_field, id).
+
+    sort_field must be non-null on every row (a datetime, number or string).
+    Returns (rows, next_cursor).
+    """
+    if cursor:
+        value, row_id = _decode_cursor(cursor)
+        if descending:
+            rows = rows.filter(Q(**{f'{sort_field}__lt': value}) | Q(**{sort_field: value, 'id__lt': row_id}))
+        else:
+            rows = rows.filter(Q(**{f'{sort_field}__gt': value}) | Q(**{sort_field: value, 'id__gt': row_id}))
+    prefix = '-' if descending else ''
+    page = list(rows.order_by(f'{prefix}{sort_field}', f'{prefix}id')[:limit + 1])
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, _encode_cursor(page[-1][sort_field], page[-1]['id'])
+
+
+def merge_pages(pages, sort_field, limit, descending=True):
+    """One page from paginate() results of several shards, with a cursor that continues all of them"""
+    if len(pages) == 1:
+        return pages[0]
+    rows = sorted(
+        (row for page, _ in pages for row in page), key=lambda row: (row[sort_field], row['id']), reverse=descending,
+    )
+    more = len(rows) > limit or any(next_cursor for _, next_cursor in pages)
+    page = rows[:limit]
+    if not more or not page:
+        return page, None
+    return page, _encode_cursor(page[-1][sort_field], page[-1]['id'])
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def serialize_appointment(row, viewer, specialty=None):
+    """API shape of an appointment row; specialty is the doctor's own for doctor viewers"""
+    data = {
+        'id': str(row['id']),
+        'appointmentId': f"AP{row['id'].hex[:8].upper()}",
+        'title': row['title'],
+        'status': row['status'],
+        'scheduledAt': _isoformat(row['scheduled_at']),
+        'startedAt': _isoformat(row['started_at']),
+        'endedAt': _isoformat(row['ended_at']),
+        'meetingUrl': row['meeting_url'],
+        'isOnline': bool(row['meeting_url'] and row['meeting_url'].strip()),
+        'hasTranscript': row['has_transcript'],
+        'createdAt': _isoformat(row['created_at']),
+    }
+    if viewer == 'doctor':
+        data.update({
+            'patientName': row['patient__user__name'] or 'Unknown',
+            'patientAvatar': avatar_variant(row['patient__user__avatar_url'], 48),
+            'patientId': str(row['patient_id']) if row['patient_id'] else None,
+            'specialty': specialty,
+        })
+    else:
+        data.update({
+            'doctorName': row['doctor__user__name'],
+            'doctorAvatar': avatar_variant(row['doctor__user__avatar_url'], 48),
+            'doctorId': str(row['doctor_id']),
+            'specialty': row['doctor__specialty'],
+        })
+    if 'has_notes' in row:
+        data['hasNotes'] = row['has_notes']
+    return data
+
+
+def serialize_note(row):
+    return {
+        'id': str(row['id']),
+        'meetingId': str(row['meeting_id']),
+        'patientName': row['meeting__patient__user__name'] or 'Unknown',
+        'patientAvatar': avatar_variant(row['meeting__patient__user__avatar_url'], 48),
+        'meetingDate': row['meeting__created_at'].isoformat(),
+        'chiefComplaint': row['chief_complaint'] or '',
+        'hpi': row['hpi'] or '',
+        'pastMedicalHistory': row['past_medical_history'] or '',
+        'medications': row['medications'] or '',
+        'allergies': row['allergies'] or '',
+        'examObservations': row['exam_observations'] or '',
+        'assessment': row['assessment'] or '',
+        'plan': row['plan'] or '',
+        'urgentFlags': row['urgent_flags'] or [],
+        'followUpQuestions': row['follow_up_questions'] or [],
+        'isEdited': row['is_edited'],
+        'createdAt': row['created_at'].isoformat(),
+    }
+
+
+def appointment_page(params, viewer, default_limit, specialty=None, sort_field='sort_at', descending=True, **filters):
+    """
+    One serialized page of appointments for a list endpoint.
+
+    filters go to appointments(); ?from=/?to= override its date range, and
+    ?limit=/?cursor= select the page. Returns (items, next_cursor) and raises
+    QueryParamError for bad parameters.
+    """
+    start, end = parse_date_range(params)
+    filters['start'] = start or filters.get('start')
+    filters['end'] = end or filters.get('end')
+    limit = parse_limit(params, default_limit)
+    rows, next_cursor = merge_pages(scatter(lambda: paginate(
+        appointment_rows(appointments(**filters), viewer), sort_field, limit, params.get('cursor'), descending=descending,
+    )), sort_field, limit, descending)
+    return [serialize_appointment(row, viewer, specialty) for row in rows], next_cursor
+
+
+def list_response(items, next_cursor):
+    response = Response(items)
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+
+def appointment_statistics(period, pending_key, doctor=None, patient=None):
+    """
+    Chart buckets for the last week/month (daily) or year (monthly), counted in the database.
+
+    pending_key names the scheduled/in-progress count ('pending' for doctors, 'upcoming' for patients).
+    """
+    days = {'weekly': 7, 'yearly': 365}.get(period, 30)
+    bucket = TruncMonth('scheduled_at') if period == 'yearly' else TruncDate('scheduled_at')
+    date_format = '%Y-%m' if period == 'yearly' else '%Y-%m-%d'
+
+    start = timezone.now() - timedelta(days=days)
+
+    def count_buckets():
+        return list(appointments(doctor=doctor, patient=patient, start=start).annotate(
+            bucket=bucket
+        ).values('bucket').annotate(
+            completed=Count('id', filter=Q(status='completed')),
+            pending=Count('id', filter=Q(status__in=UPCOMING_STATUSES)),
+            cancelled=Count('id', filter=Q(status='cancelled')),
+        ).order_by('bucket'))
+
+    # Buckets from several shards are added up
+    totals = {}
+    for rows in scatter(count_buckets):
+        for row in rows:
+            counts = totals.setdefault(row['bucket'], {'completed': 0, 'pending': 0, 'cancelled': 0})
+            for key in counts:
+                counts[key] += row[key]
+
+    return [{
+        'date': bucket_start.strftime(date_format),
+        'completed': counts['completed'],
+        pending_key: counts['pending'],
+        'cancelled': counts['cancelled'],
+    } for bucket_start, counts in sorted(totals.items())]
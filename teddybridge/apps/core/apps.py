@@ -5,6 +5,9 @@ class CoreConfig(AppConfig):
     name = 'teddybridge.apps.core'
     
     def ready(self):
+        # Register model signal handlers
+        from . import signals
+        
         # Start background tasks when Django starts
         from .background_tasks import start_background_tasks
         import os
@@ -0,0 +1,191 @@
+"""
+Async (ASGI) variants of the core endpoints that mostly wait on external services.
+
+Under uvicorn workers these views await Groq and Firebase instead of blocking a
+worker, so one worker can hold hundreds of outbound requests at once. ORM and
+session access goes through sync_to_async. They replace the sync views in the
+URLconf when DJANGO_ASYNC_VIEWS is enabled (see DEPLOYMENT_GUIDE.md).
+"""
+import asyncio
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.http import JsonResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from .ai_client import get_async_groq_client
+from .ai_views import TEDDY_MODEL, prepare_chat, finish_chat, sse_event
+from .models import TeddyConversation
+from .teddy_memory import stored_conversation_id
+from .views import login_with_firebase_bearer, current_user_payload
+
+logger = logging.getLogger(__name__)
+
+
+async def get_request_user(request):
+    """Resolve the session user without running the ORM on the event loop"""
+    return await sync_to_async(get_user)(request)
+
+
+def parse_json_body(request):
+    """Read a JSON request body (raises ValueError on malformed input)"""
+    return json.loads(request.body) if request.body else {}
+
+
+async def _get_chat_request(request):
+    """Shared request handling for both chat endpoints; returns (error_response, chat_args)"""
+    try:
+        body = parse_json_body(request)
+        message = body.get('message')
+        conversation_id = body.get('conversationId')
+    except Exception as e:
+        logger.error(f"Error parsing request data: {str(e)}")
+        return JsonResponse({'error': 'Invalid request format'}, status=400), None
+
+    if not message:
+        return JsonResponse({'error': 'Message is required'}, status=400), None
+
+    user = await get_request_user(request)
+    # Guests (landing page) chat without a stored conversation
+    if not (user.is_authenticated and hasattr(user, 'role')):
+        user = None
+    return None, (user, message, conversation_id)
+
+
+async def teddy_ai_chat(request):
+    """Async teddy_ai_chat: same request and response shape as ai_views.teddy_ai_chat"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    error, chat_args = await _get_chat_request(request)
+    if error:
+        return error
+    user, message, conversation_id = chat_args
+
+    groq_client = get_async_groq_client()
+    if not groq_client:
+        return JsonResponse({'error': 'AI service not configured'}, status=503)
+
+    try:
+        snapshot, conversation, messages, metrics = await sync_to_async(prepare_chat)(user, message, conversation_id)
+    except TeddyConversation.DoesNotExist:
+        return JsonResponse({'error': 'Conversation not found'}, status=404)
+
+    try:
+        response = await groq_client.chat.completions.create(
+            model=TEDDY_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1500
+        )
+        ai_response = response.choices[0].message.content or ''
+        usage = await sync_to_async(finish_chat)(conversation, message, ai_response, metrics, getattr(response, 'usage', None))
+
+        return JsonResponse({
+            'success': True,
+            'response': ai_response,
+            'role': snapshot['role'],
+            'conversationId': str(conversation.id) if conversation else None,
+            'usage': usage,
+        })
+    except Exception as e:
+        logger.error(f"Error in Groq API call: {str(e)}")
+        return JsonResponse({'error': f'Failed to get AI response: {str(e)}'}, status=500)
+
+
+async def _relay_chat_stream(completion_stream, user_role, message, metrics, conversation=None):
+    """Async counterpart of ai_views._relay_chat_stream; disconnects cancel the upstream stream"""
+    completed = False
+    parts = []
+    usage = None
+    try:
+        yield sse_event('start', {
+            'role': user_role,
+            'conversationId': stored_conversation_id(conversation),
+        })
+        async for chunk in completion_stream:
+            # Groq reports usage on the final chunk
+            x_groq = getattr(chunk, 'x_groq', None)
+            if x_groq is not None and getattr(x_groq, 'usage', None):
+                usage = x_groq.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield sse_event('token', {'delta': delta})
+        completed = True
+
+        usage_payload = await sync_to_async(finish_chat)(conversation, message, ''.join(parts), metrics, usage)
+        yield sse_event('done', {
+            'success': True,
+            'role': user_role,
+            'conversationId': str(conversation.id) if conversation else None,
+            'usage': usage_payload,
+        })
+    except (GeneratorExit, asyncio.CancelledError):
+        logger.info("Teddy chat stream closed by client, cancelling generation")
+        raise
+    except Exception as e:
+        logger.error(f"Error while streaming Groq response: {str(e)}")
+        yield sse_event('error', {'error': f'Failed to get AI response: {str(e)}'})
+    finally:
+        if not completed:
+            await completion_stream.close()
+
+
+async def teddy_ai_chat_stream(request):
+    """Async teddy_ai_chat_stream: relays tokens as Server-Sent Events"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    error, chat_args = await _get_chat_request(request)
+    if error:
+        return error
+    user, message, conversation_id = chat_args
+
+    groq_client = get_async_groq_client()
+    if not groq_client:
+        return JsonResponse({'error': 'AI service not configured'}, status=503)
+
+    try:
+        snapshot, conversation, messages, metrics = await sync_to_async(prepare_chat)(user, message, conversation_id)
+    except TeddyConversation.DoesNotExist:
+        return JsonResponse({'error': 'Conversation not found'}, status=404)
+
+    try:
+        completion_stream = await groq_client.chat.completions.create(
+            model=TEDDY_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1500,
+            stream=True
+        )
+    except Exception as e:
+        logger.error(f"Error opening Groq stream: {str(e)}")
+        return JsonResponse({'error': f'Failed to get AI response: {str(e)}'}, status=500)
+
+    response = StreamingHttpResponse(
+        _relay_chat_stream(completion_stream, snapshot['role'], message, metrics, conversation),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx/Render proxies from buffering the stream
+    return response
+
+
+async def get_current_user(request):
+    """Async get_current_user: Firebase verification runs off the event loop"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    # Token verification may fetch Google's signing keys, so it runs in a worker thread
+    if not await sync_to_async(login_with_firebase_bearer)(request):
+        # User doesn't exist in Django yet - return 401 to trigger registration
+        return JsonResponse({'error': 'User not found. Please register first.'}, status=401)
+
+    user = await get_request_user(request)
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+
+    data, status_code = await sync_to_async(current_user_payload)(user)
+    return JsonResponse(data, status=status_code)
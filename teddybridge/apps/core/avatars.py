@@ -0,0 +1,136 @@
+"""
+Avatar image pipeline.
+
+An upload is validated by actually decoding it with Pillow, not by trusting
+its content type. It is re-encoded as a metadata-free WebP master, stored
+under the SHA-256 of the uploaded bytes. Square 48/128/512 px WebP variants
+are generated off the request thread. A missing variant is rendered on first
+request. Files are content-addressed, so they never change once written and
+are served with immutable cache headers.
+
+API responses store the master URL in User.avatar_url. They pick the variant
+that fits each context with avatar_variant(url, size).
+"""
+import hashlib
+import logging
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+AVATAR_DIR = 'avatars'
+AVATAR_SIZES = (48, 128, 512)
+AVATAR_MASTER_MAX_SIZE = 1024
+AVATAR_MAX_PIXELS = 40_000_000  # Refuse decompression bombs before resizing
+AVATAR_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+AVATAR_WEBP_QUALITY = 82
+
+# Matches content-addressed masters and variants: <digest>.webp / <digest>_<size>.webp
+AVATAR_FILENAME_RE = re.compile(r'^(?P<digest>[0-9a-f]{32})(?:_(?P<size>\d+))?\.webp$')
+_AVATAR_URL_RE = re.compile(r'^(?P<prefix>.*/' + AVATAR_DIR + r'/)(?P<digest>[0-9a-f]{32})(?:_\d+)?\.webp$')
+
+# Variant generation runs off the request thread
+_variant_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='avatar-variants')
+
+
+class AvatarError(ValueError):
+    pass
+
+
+def avatar_path(digest, size=None):
+    filename = f"{digest}_{size}.webp" if size else f"{digest}.webp"
+    return os.path.join(settings.MEDIA_ROOT, AVATAR_DIR, filename)
+
+
+def avatar_variant(url, size):
+    """URL of the `size` px variant of a stored avatar; other URLs (legacy files, Google photos) pass through"""
+    if not url:
+        return url
+    match = _AVATAR_URL_RE.match(url)
+    if not match:
+        return url
+    return f"{match.group('prefix')}{match.group('digest')}_{size}.webp"
+
+
+def _open_image(data):
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(BytesIO(data)) as probe:
+            if probe.format not in AVATAR_FORMATS:
+                raise AvatarError('Unsupported image format')
+            if probe.width * probe.height > AVATAR_MAX_PIXELS:
+                raise AvatarError('Image dimensions too large')
+            probe.verify()
+        # verify() leaves the image unusable, so decode again for real
+        image = Image.open(BytesIO(data))
+        image.load()
+    except AvatarError:
+        raise
+    except Exception:
+        raise AvatarError('File is not a valid image')
+    # Apply the EXIF rotation before the metadata is dropped
+    image = ImageOps.exif_transpose(image)
+    return image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+
+def _save_webp(image, path):
+    # Unique per call: the background renderer and an on-demand request can write the same variant at once
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        # No exif/icc_profile arguments: the re-encoded file carries no metadata
+        image.save(tmp_path, format='WEBP', quality=AVATAR_WEBP_QUALITY, method=4)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Content-addressed, so another writer's complete file is as good as ours
+        if not os.path.exists(path):
+            raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def store_avatar(uploaded_file):
+    """Validate and store an uploaded avatar, returning its content digest"""
+    data = b''.join(uploaded_file.chunks())
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    master = avatar_path(digest)
+    if os.path.exists(master):
+        return digest
+
+    image = _open_image(data)
+    image.thumbnail((AVATAR_MASTER_MAX_SIZE, AVATAR_MASTER_MAX_SIZE))
+    os.makedirs(os.path.dirname(master), exist_ok=True)
+    _save_webp(image, master)
+    return digest
+
+
+def render_variant(digest, size):
+    """Write one square variant from the master; returns its path (None if the master is missing)"""
+    from PIL import Image, ImageOps
+    path = avatar_path(digest, size)
+    if os.path.exists(path):
+        return path
+    master = avatar_path(digest)
+    if not os.path.exists(master):
+        return None
+    with Image.open(master) as image:
+        image.load()
+        variant = ImageOps.fit(image, (size, size), method=Image.LANCZOS)
+    _save_webp(variant, path)
+    return path
+
+
+def _render_variants(digest):
+    for size in AVATAR_SIZES:
+        try:
+            render_variant(digest, size)
+        except Exception as e:
+            logger.error(f"Failed to render {size}px avatar variant for {digest}: {str(e)}")
+
+
+def render_variants_in_background(digest):
+    _variant_executor.submit(_render_variants, digest)
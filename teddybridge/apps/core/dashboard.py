@@ -0,0 +1,55 @@
+"""
+Dashboard bundles.
+
+A dashboard page used to call half a dozen endpoints on load. Each call
+repeated authentication, the session write and the profile lookup. The
+/api/doctor/dashboard and /api/patient/dashboard endpoints run the same
+section functions in one request, against one resolved profile.
+
+- ?sections=a,b picks sections (default: all of them).
+- A section's own query parameters are prefixed with its name, e.g.
+  ?stats.period=week&upcomingAppointments.filter=today.
+- Each section's value has the same shape as its standalone endpoint.
+  Cursors of paginated sections are collected under nextCursors.
+"""
+from .appointments import QueryParamError
+
+
+def requested_sections(params, available):
+    value = params.get('sections')
+    if not value:
+        return list(available)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise QueryParamError(f"Unknown section(s): {', '.join(unknown)} (expected {', '.join(available)})")
+    return names
+
+
+def section_params(params, name):
+    prefix = f'{name}.'
+    return {key[len(prefix):]: params.get(key) for key in params if key.startswith(prefix)}
+
+
+def build_dashboard(params, available, paged, profile, user):
+    """
+    Run the requested sections and return the response body.
+
+    available maps section names to functions of (profile, user, params).
+    Sections named in paged return (items, next_cursor). A bad parameter
+    raises QueryParamError, prefixed with the section name.
+    """
+    body, cursors = {}, {}
+    for name in requested_sections(params, available):
+        try:
+            result = available[name](profile, user, section_params(params, name))
+        except QueryParamError as e:
+            raise QueryParamError(f'{name}: {e}')
+        if name in paged:
+            result, next_cursor = result
+            if next_cursor:
+                cursors[name] = next_cursor
+        body[name] = result
+    if cursors:
+        body['nextCursors'] = cursors
+    return body
@@ -0,0 +1,162 @@
+"""
+Read replica routing with read-your-writes stickiness.
+
+When DATABASE_REPLICA_URLS is set (see settings.py), each URL becomes a
+replica alias ('replica1', 'replica2', ...) and ReplicaRouter is
+installed:
+- Writes always go to the primary ('default').
+- Reads go to the primary, unless the current context opted into a
+  replica. ReplicaRoutingMiddleware does that for safe-method requests
+  (GET/HEAD/OPTIONS); reporting code outside requests uses replica_reads().
+- Once anything in the context writes, or inside a transaction, reads go
+  back to the primary, so a request never reads around its own writes.
+- After a request that wrote, the session is pinned to the primary for
+  REPLICA_STICKY_SECONDS, so the client's next reads cannot observe
+  replication lag (read-your-writes).
+
+Each request picks one replica, so all its reads see a single snapshot.
+Background threads start without a routing context and use the primary.
+
+For local testing, point DATABASE_REPLICA_URLS at a second SQLite file.
+`manage.py benchmark_replica_routing` copies the primary into it and
+measures a mixed read/write load with and without routing.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_SESSION_KEY = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class _Routing:
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+_routing = ContextVar('db_routing', default=None)
+
+
+def replica_aliases():
+    return list(settings.REPLICA_DATABASES)
+
+
+def _enter(replica):
+    return _routing.set(_Routing(replica))
+
+
+@contextmanager
+def replica_reads():
+    """Send reads in this block to a replica (the primary if none are configured); also a decorator"""
+    aliases = replica_aliases()
+    token = _enter(random.choice(aliases) if aliases else None)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Send reads in this block to the primary, e.g. right after a write made elsewhere"""
+    token = _enter(None)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+def wrote_in_context():
+    routing = _routing.get()
+    return routing is not None and routing.wrote
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.replica is None or routing.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route reads of safe-method requests to a replica unless the session is pinned to the primary.
+
+    Goes right after SessionMiddleware: the session itself is loaded
+    before routing starts, so it always comes from the primary. Runs
+    natively under ASGI too, so async views are not pushed into a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        aliases = replica_aliases()
+        if not aliases:
+            return self.get_response(request)
+
+        token = _enter(_request_replica(request, aliases))
+        try:
+            response = self.get_response(request)
+            wrote = wrote_in_context()
+        finally:
+            _routing.reset(token)
+        _pin_after_write(request, wrote)
+        return response
+
+    async def __acall__(self, request):
+        aliases = replica_aliases()
+        if not aliases:
+            return await self.get_response(request)
+
+        # The session (and later the user) load from the database
+        token = _enter(await sync_to_async(_request_replica)(request, aliases))
+        try:
+            response = await self.get_response(request)
+            wrote = wrote_in_context()
+        finally:
+            _routing.reset(token)
+        await sync_to_async(_pin_after_write)(request, wrote)
+        return response
+
+
+def _request_replica(request, aliases):
+    """The replica for this request's reads, or None for the primary"""
+    pinned = request.session.get(STICKY_SESSION_KEY, 0) > time.time()
+    return random.choice(aliases) if request.method in SAFE_METHODS and not pinned else None
+
+
+def _pin_after_write(request, wrote):
+    """Read the user's own writes from the primary for REPLICA_STICKY_SECONDS"""
+    user = getattr(request, 'user', None)
+    if (wrote or request.method not in SAFE_METHODS) and user is not None and user.is_authenticated:
+        request.session[STICKY_SESSION_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
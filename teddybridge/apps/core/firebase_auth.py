@@ -1,10 +1,11 @@
 """
 Firebase Authentication utilities for Django backend
+
+firebase_admin (and the google-cloud stack it pulls in) is imported on first
+use rather than at module import, so workers boot without it.
 """
 import os
 import logging
-import firebase_admin
-from firebase_admin import credentials, auth
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,9 @@ def initialize_firebase():
     global _firebase_app
     if _firebase_app is None:
         try:
+            import firebase_admin
+            from firebase_admin import credentials
+
             # Try to get Firebase credentials from environment
             firebase_creds_json = os.getenv('FIREBASE_CREDENTIALS_JSON')
             cred = None
@@ -99,6 +103,9 @@ def verify_firebase_token(id_token):
     Returns:
         dict: Decoded token claims, or None if verification fails
     """
+    import firebase_admin
+    from firebase_admin import auth
+
     try:
         if _firebase_app is False:
             logger.warning("Firebase Admin SDK not initialized, cannot verify token")
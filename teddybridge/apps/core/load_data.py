@@ -0,0 +1,227 @@
+"""
+Synthetic data for load tests and query budgets.
+
+seed_load_data() writes a realistic clinic with bulk_create only:
+doctors with skewed panel sizes, patients (some linked to two doctors),
+meetings across statuses over the past six months and the next month,
+notes for completed visits, surveys and responses, PROMS scores, chat
+threads, social posts with likes and comments, and notifications.
+
+Everything is derived from one random seed, so the same arguments give
+the same shape every time. Timestamps are spread over time rather than
+all "now", so recent-first lists and date filters behave like production.
+
+bulk_create skips signals: nothing is written to the change log, cache
+versions are not bumped, and with sharding on the rows land on the
+default database (run rebalance_shards afterwards). Note search entries
+are written explicitly, unless index_notes is False.
+
+Used by manage.py seed_load_data and check_query_budgets.
+"""
+import random
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from .models import (
+    CallNote, ChatMessage, Doctor, DoctorPatientLink, DoctorReview, Meeting, Notification, Patient, Post, PostComment,
+    PostLike, PromsScore, Survey, SurveyResponse, User,
+)
+from .note_search import index_note
+
+FIRST_NAMES = ['Ava', 'Ben', 'Chloe', 'Daniel', 'Ella', 'Finn', 'Grace', 'Hugo', 'Isla', 'Jack', 'Lena', 'Max', 'Noa', 'Omar', 'Priya', 'Sam']
+LAST_NAMES = ['Adler', 'Brooks', 'Cohen', 'Diaz', 'Evans', 'Fischer', 'Gupta', 'Haddad', 'Ito', 'Klein', 'Levi', 'Moreau', 'Novak', 'Shah']
+SPECIALTIES = ['Orthopedics', 'Cardiology', 'General Surgery', 'Neurology', 'Sports Medicine']
+PROCEDURES = ['Knee replacement', 'Hip replacement', 'ACL reconstruction', 'Spinal fusion', 'Rotator cuff repair', 'Bypass surgery']
+COMPLAINTS = ['Knee pain on stairs', 'Swelling after physiotherapy', 'Stiffness in the morning', 'Follow-up after surgery', 'Trouble sleeping']
+PLANS = ['Continue physiotherapy twice a week', 'Reduce anti-inflammatories', 'Order an X-ray', 'Review in two weeks', 'Start walking program']
+CHAT_LINES = ['How is the swelling today?', 'Better than yesterday, thanks', 'Please keep icing it', 'Can we move my appointment?', 'Sure, see you Thursday']
+SURVEY_QUESTIONS = [
+    {'id': 'pain', 'type': 'scale', 'question': 'Pain level today', 'min': 0, 'max': 10},
+    {'id': 'mobility', 'type': 'choice', 'question': 'How far can you walk?', 'options': ['<100m', '100-500m', '>500m']},
+    {'id': 'notes', 'type': 'text', 'question': 'Anything else we should know?'},
+]
+BATCH_SIZE = 1000
+
+
+@contextmanager
+def _explicit_timestamps(*fields):
+    """Let bulk_create keep the created_at-style values we set instead of stamping "now" (auto_now_add)"""
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now_add in saved:
+            field.auto_now_add = auto_now_add
+
+
+def _timestamp_fields():
+    return [model._meta.get_field(name) for model, name in (
+        (User, 'created_at'), (Doctor, 'created_at'), (Patient, 'created_at'), (DoctorPatientLink, 'linked_at'),
+        (Meeting, 'created_at'), (CallNote, 'created_at'), (Survey, 'created_at'), (SurveyResponse, 'submitted_at'),
+        (PromsScore, 'recorded_at'), (DoctorReview, 'created_at'), (ChatMessage, 'created_at'), (Post, 'created_at'),
+        (PostLike, 'created_at'), (PostComment, 'created_at'), (Notification, 'created_at'),
+    )]
+
+
+def _name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def seed_load_data(doctors=50, patients=1000, prefix='load', password=None, seed=0, index_notes=True, batch_size=BATCH_SIZE):
+    """
+    Write a synthetic data set and return it.
+
+    Users get emails <prefix>-doctor-<n>@example.com and
+    <prefix>-patient-<n>@example.com, and all share password (unusable if None).
+    Panels are largest for the first doctors. Returns {'counts': {model: rows},
+    'doctors': [Doctor], 'patients': [Patient]}.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    counts = Counter()
+    password_hash = make_password(password)
+
+    def save(model, rows):
+        created = model.objects.bulk_create(rows, batch_size=batch_size)
+        counts[model.__name__] += len(created)
+        return created
+
+    def past(days):
+        return now - timedelta(days=rng.uniform(0, days))
+
+    with _explicit_timestamps(*_timestamp_fields()):
+        doctor_users = save(User, [
+            User(email=f'{prefix}-doctor-{i}@example.com', name=f'Dr. {_name(rng)}', role='doctor', password=password_hash, created_at=past(720))
+            for i in range(doctors)
+        ])
+        doctor_rows = save(Doctor, [
+            Doctor(user=user, specialty=rng.choice(SPECIALTIES), city='Tel Aviv', verified=True, created_at=user.created_at)
+            for user in doctor_users
+        ])
+        patient_users = save(User, [
+            User(email=f'{prefix}-patient-{i}@example.com', name=_name(rng), role='patient', password=password_hash, created_at=past(365))
+            for i in range(patients)
+        ])
+        patient_rows = save(Patient, [
+            Patient(user=user, age=rng.randint(25, 85), gender=rng.choice(['female', 'male']), procedure=rng.choice(PROCEDURES),
+                    connect_to_peers=rng.random() < 0.4, created_at=user.created_at)
+            for user in patient_users
+        ])
+
+        # Panel sizes follow a long tail: a few busy doctors, many small practices
+        weights = [1 / (i + 1) ** 0.7 for i in range(doctors)]
+        links = []
+        for patient in patient_rows:
+            primary = rng.choices(range(doctors), weights=weights)[0] if doctors > 1 else 0
+            linked = {primary}
+            if doctors > 1 and rng.random() < 0.2:
+                linked.add(rng.randrange(doctors))
+            links += [DoctorPatientLink(doctor=doctor_rows[d], patient=patient, linked_at=past(300)) for d in sorted(linked)]
+        save(DoctorPatientLink, links)
+
+        meetings = []
+        for link in links:
+            for _ in range(rng.randint(2, 8)):
+                scheduled_at = now + timedelta(days=rng.uniform(-180, 30))
+                if scheduled_at > now:
+                    status = 'scheduled' if rng.random() < 0.9 else 'cancelled'
+                else:
+                    status = rng.choices(['completed', 'cancelled', 'missed'], weights=[80, 12, 8])[0]
+                meetings.append(Meeting(
+                    doctor=link.doctor, patient=link.patient, title='Follow-up consultation', status=status,
+                    scheduled_at=scheduled_at, created_at=scheduled_at - timedelta(days=rng.uniform(1, 21)),
+                    started_at=scheduled_at if status == 'completed' else None,
+                    ended_at=scheduled_at + timedelta(minutes=rng.randint(10, 40)) if status == 'completed' else None,
+                ))
+        save(Meeting, meetings)
+
+        notes = save(CallNote, [
+            CallNote(
+                meeting=meeting, chief_complaint=rng.choice(COMPLAINTS), hpi='Symptoms improving since the last visit.',
+                medications='Ibuprofen 400mg as needed', allergies='None known', assessment='Recovering as expected',
+                plan=rng.choice(PLANS), urgent_flags=[], follow_up_questions=['Any new pain at night?'],
+                created_at=meeting.ended_at,
+            )
+            for meeting in meetings if meeting.status == 'completed' and rng.random() < 0.7
+        ])
+
+        surveys = save(Survey, [
+            Survey(doctor=doctor, title=title, description='Weekly recovery check-in', questions=SURVEY_QUESTIONS,
+                   is_active=i < 2, created_at=past(120))
+            for doctor in doctor_rows for i, title in enumerate(['Recovery check-in', 'Pain diary', 'Pre-surgery intake'])
+        ])
+        surveys_by_doctor = {}
+        for survey in surveys:
+            surveys_by_doctor.setdefault(survey.doctor_id, []).append(survey)
+        save(SurveyResponse, [
+            SurveyResponse(survey=survey, patient=link.patient, submitted_at=past(90), answers={
+                'pain': rng.randint(0, 10), 'mobility': rng.choice(SURVEY_QUESTIONS[1]['options']), 'notes': '',
+            })
+            for link in links for survey in surveys_by_doctor[link.doctor_id] if rng.random() < 0.4
+        ])
+
+        scores = []
+        for link in links:
+            baseline = rng.randint(20, 45)
+            scores.append(PromsScore(doctor=link.doctor, patient=link.patient, score_type='pre_surgery', score=baseline,
+                                     recorded_at=past(180)))
+            for k in range(rng.randint(0, 3)):
+                scores.append(PromsScore(
+                    doctor=link.doctor, patient=link.patient, score_type='post_surgery', score=min(baseline + 10 * (k + 1), 100),
+                    billable_codes=['99091', '99457'], recorded_at=past(60),
+                ))
+        save(PromsScore, scores)
+
+        save(DoctorReview, [
+            DoctorReview(doctor=link.doctor, patient=link.patient, rating=rng.randint(3, 5), comment='Very attentive',
+                         created_at=past(90))
+            for link in links if rng.random() < 0.25
+        ])
+
+        messages = []
+        for link in links:
+            sent_at = past(30)
+            for i in range(rng.randint(0, 10)):
+                from_patient = i % 2 == 0
+                sent_at += timedelta(minutes=rng.randint(5, 600))
+                messages.append(ChatMessage(
+                    sender=link.patient.user if from_patient else link.doctor.user,
+                    receiver=link.doctor.user if from_patient else link.patient.user,
+                    message=rng.choice(CHAT_LINES), is_read=sent_at < now - timedelta(days=2) or rng.random() < 0.5,
+                    created_at=min(sent_at, now),
+                ))
+        save(ChatMessage, messages)
+
+        users = doctor_users + patient_users
+        posts = save(Post, [
+            Post(author=user, content='Sharing my progress this week', created_at=past(60))
+            for user in users for _ in range(rng.choices([0, 1, 3], weights=[50, 35, 15])[0])
+        ])
+        peers = {'doctor': doctor_users, 'patient': patient_users}
+        likes, comments = [], []
+        for post in posts:
+            same_role = peers[post.author.role]
+            for user in rng.sample(same_role, min(len(same_role), rng.randint(0, 6))):
+                likes.append(PostLike(post=post, user=user, created_at=post.created_at))
+            for _ in range(rng.randint(0, 3)):
+                comments.append(PostComment(post=post, author=rng.choice(same_role), content='Great to hear!', created_at=post.created_at))
+        save(PostLike, likes)
+        save(PostComment, comments)
+
+        save(Notification, [
+            Notification(user=user, type=rng.choice(['appointment', 'note', 'survey', 'general']), title='Reminder',
+                         message='You have an update', is_read=rng.random() < 0.7, created_at=past(60))
+            for user in users for _ in range(rng.randint(3, 20))
+        ])
+
+    if index_notes:
+        for start in range(0, len(notes), batch_size):
+            batch = [note.id for note in notes[start:start + batch_size]]
+            for note in CallNote.objects.filter(id__in=batch).select_related('meeting__patient__user'):
+                index_note(note)
+
+    return {'counts': dict(counts), 'doctors': doctor_rows, 'patients': patient_rows}
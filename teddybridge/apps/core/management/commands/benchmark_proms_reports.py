@@ -0,0 +1,73 @@
+import time
+import uuid
+import zipfile
+from io import BytesIO
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from teddybridge.apps.core.models import User, Doctor, Patient, DoctorPatientLink, PromsScore
+from teddybridge.apps.doctors.proms_reports import panel_reports, render_reports, render_proms_report, stream_reports_zip
+
+
+class Command(BaseCommand):
+    help = 'Benchmark PROMS report rendering (reports/second) on a seeded patient panel; all seeded data is rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000, help='Size of the seeded patient panel')
+        parser.add_argument('--processes', type=int, default=0, help='Process pool size (default: REPORT_RENDER_PROCESSES)')
+        parser.add_argument('--sample', type=int, default=100, help='Reports rendered sequentially for the single-process baseline')
+        parser.add_argument('--min-rate', type=float, default=0, help='Fail if the cold bulk export renders fewer reports/second')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            doctor = self._seed(options['patients'])
+            entries = panel_reports(doctor)
+            keys = [key for _, key, _ in entries]
+            cache.delete_many(keys)
+            try:
+                results = self._run(entries, options)
+            finally:
+                cache.delete_many(keys)
+                transaction.set_rollback(True)
+
+        for label, count, seconds in results:
+            self.stdout.write(f'{label:<32} {count:>6} reports in {seconds:7.2f}s = {count / seconds:8.1f} reports/s')
+
+        cold_rate = results[1][1] / results[1][2]
+        if options['min_rate'] and cold_rate < options['min_rate']:
+            raise CommandError(f'Bulk export rendered {cold_rate:.1f} reports/s, below --min-rate {options["min_rate"]}')
+
+    def _seed(self, count):
+        run = uuid.uuid4().hex[:8]
+        doctor_user = User.objects.create(email=f'bench-doctor-{run}@example.com', name='Bench Doctor', role='doctor')
+        doctor = Doctor.objects.create(user=doctor_user)
+        users = User.objects.bulk_create([
+            User(email=f'bench-{run}-{i}@example.com', name=f'Patient {i:04d}', role='patient') for i in range(count)
+        ])
+        patients = Patient.objects.bulk_create([Patient(user=user) for user in users])
+        DoctorPatientLink.objects.bulk_create([DoctorPatientLink(doctor=doctor, patient=patient) for patient in patients])
+        PromsScore.objects.bulk_create([
+            PromsScore(patient=patient, doctor=doctor, score_type=score_type, score=score,
+                       billable_codes=['99091', '99457'] if score_type == 'post_surgery' else None)
+            for i, patient in enumerate(patients)
+            for score_type, score in (('pre_surgery', 30 + i % 20), ('post_surgery', 55 + i % 30))
+        ])
+        return doctor
+
+    def _run(self, entries, options):
+        results = []
+
+        sample = entries[:options['sample']]
+        start = time.perf_counter()
+        for _, _, report in sample:
+            render_proms_report(report)
+        results.append(('sequential (1 process)', len(sample), time.perf_counter() - start))
+
+        for label in ('bulk export, cold cache', 'bulk export, warm cache'):
+            start = time.perf_counter()
+            archive = b''.join(stream_reports_zip(render_reports(entries, processes=options['processes'] or None)))
+            results.append((label, len(entries), time.perf_counter() - start))
+
+        if len(zipfile.ZipFile(BytesIO(archive)).namelist()) != len(entries):
+            raise CommandError('Exported ZIP is missing reports')
+        return results
@@ -0,0 +1,134 @@
+import sqlite3
+import statistics
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from teddybridge.apps.core.db_routing import primary_reads, replica_aliases, replica_reads
+from teddybridge.apps.core.models import Doctor, Notification
+from teddybridge.apps.doctors.dashboard import stats
+
+BENCH_TITLE = 'Replica routing benchmark'
+
+
+class Command(BaseCommand):
+    help = ('Measure throughput of a mixed read/write load with all reads on the primary, then with replica routing; '
+            'SQLite replicas are refreshed from the primary first')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent workers (one connection per database each)')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of operations that write')
+        parser.add_argument('--no-refresh', action='store_true', help='Do not copy the primary into SQLite replicas first')
+
+    def handle(self, *args, **options):
+        if not replica_aliases():
+            raise CommandError('No replicas configured; set DATABASE_REPLICA_URLS (e.g. sqlite:////tmp/replica.sqlite3)')
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('--write-ratio must be between 0 and 1')
+
+        doctors = list(Doctor.objects.select_related('user')[:max(options['threads'], 1)])
+        if not doctors:
+            raise CommandError('No doctors in the database; seed some data first')
+
+        # One notification per worker, so writes do not contend on a single row
+        notifications = [Notification.objects.create(
+            user=doctors[i % len(doctors)].user, type='general', title=BENCH_TITLE, message='0',
+        ) for i in range(options['threads'])]
+        try:
+            if not options['no_refresh']:
+                self._refresh_sqlite_replicas()
+            results = [
+                self._run('primary only', primary_reads, doctors, notifications, options),
+                self._run('replica routing', replica_reads, doctors, notifications, options),
+            ]
+        finally:
+            Notification.objects.filter(id__in=[n.id for n in notifications]).delete()
+
+        for label, result in results:
+            self.stdout.write(
+                f"{label:<16} {result['ops'] / options['seconds']:8.1f} ops/s "
+                f"(reads p50 {result['read_p50']:6.1f}ms p95 {result['read_p95']:6.1f}ms, "
+                f"writes p50 {result['write_p50']:6.1f}ms p95 {result['write_p95']:6.1f}ms) "
+                f"errors={result['errors']} stale_reads={result['stale']}"
+            )
+        if any(result['stale'] for _, result in results):
+            raise CommandError('A read after a write in the same context returned stale data')
+
+    def _refresh_sqlite_replicas(self):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if 'sqlite' not in primary['ENGINE']:
+            return
+        connections[DEFAULT_DB_ALIAS].close()
+        for alias in replica_aliases():
+            replica = settings.DATABASES[alias]
+            if 'sqlite' not in replica['ENGINE']:
+                continue
+            connections[alias].close()
+            source, target = sqlite3.connect(primary['NAME']), sqlite3.connect(replica['NAME'])
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+            self.stdout.write(f'Copied {primary["NAME"]} to {alias} ({replica["NAME"]})')
+
+    def _run(self, label, routing, doctors, notifications, options):
+        deadline = time.monotonic() + options['seconds']
+        write_every = round(1 / options['write_ratio']) if options['write_ratio'] else 0
+        totals = {'ops': 0, 'errors': 0, 'stale': 0, 'reads': [], 'writes': []}
+        lock = threading.Lock()
+
+        def worker(index):
+            doctor = doctors[index % len(doctors)]
+            notification_id = notifications[index].id
+            local = {'ops': 0, 'errors': 0, 'stale': 0, 'reads': [], 'writes': []}
+            try:
+                while time.monotonic() < deadline:
+                    local['ops'] += 1
+                    started = time.perf_counter()
+                    # Each operation is its own routing context, like one request
+                    with routing():
+                        try:
+                            if write_every and local['ops'] % write_every == 0:
+                                value = str(local['ops'])
+                                Notification.objects.filter(id=notification_id).update(message=value)
+                                # Read-your-writes: must come from the primary
+                                if Notification.objects.get(id=notification_id).message != value:
+                                    local['stale'] += 1
+                                local['writes'].append(time.perf_counter() - started)
+                            else:
+                                stats(doctor, doctor.user, {})
+                                local['reads'].append(time.perf_counter() - started)
+                        except Exception:
+                            local['errors'] += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    for key in ('ops', 'errors', 'stale'):
+                        totals[key] += local[key]
+                    totals['reads'] += local['reads']
+                    totals['writes'] += local['writes']
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return label, {
+            'ops': totals['ops'],
+            'errors': totals['errors'],
+            'stale': totals['stale'],
+            'read_p50': self._percentile(totals['reads'], 50),
+            'read_p95': self._percentile(totals['reads'], 95),
+            'write_p50': self._percentile(totals['writes'], 50),
+            'write_p95': self._percentile(totals['writes'], 95),
+        }
+
+    @staticmethod
+    def _percentile(samples, percent):
+        if len(samples) < 2:
+            return samples[0] * 1000 if samples else 0.0
+        return statistics.quantiles(samples, n=100)[percent - 1] * 1000
@@ -0,0 +1,97 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# SDKs that must stay out of worker boot; they are imported by the code paths that use them.
+# Not requests: rest_framework.compat imports it whenever it is installed, so our own imports of it are lazy but untracked
+LAZY_MODULES = ['groq', 'twilio', 'qrcode', 'reportlab', 'firebase_admin', 'PIL', 'assemblyai']
+
+# Runs in a fresh interpreter so nothing imported by manage.py skews the numbers
+BOOT_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns  # imports the URLconf and every view module
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': sorted(name for name in sys.modules if name.split('.')[0] in %r),
+}))
+""" % (LAZY_MODULES,)
+
+
+def _parse_importtime(stderr):
+    """Return (cumulative_us, module) pairs for top-level imports from -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3:
+            continue
+        try:
+            cumulative = int(parts[1])
+        except ValueError:
+            continue  # header line
+        # Nested imports are indented by two extra spaces per level; keep the outermost only
+        name = parts[2][1:]
+        if not name.startswith(' '):
+            entries.append((cumulative, name))
+    return entries
+
+
+class Command(BaseCommand):
+    help = 'Check that django.setup() + URLconf import stays within the worker boot time and memory budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-seconds', type=float, default=1.0, help='Budget for django.setup() + URLconf import (median of runs)')
+        parser.add_argument('--max-rss-mb', type=float, default=90.0, help='Budget for peak RSS of a freshly booted process')
+        parser.add_argument('--runs', type=int, default=3, help='Number of cold boots to measure')
+        parser.add_argument('--top', type=int, default=10, help='Show the N slowest top-level imports')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'teddybridge.settings'))
+        samples = []
+        importtime = []
+
+        for run in range(max(1, options['runs'])):
+            proc = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+                cwd=str(settings.BASE_DIR),
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if proc.returncode != 0:
+                raise CommandError(f'Boot failed:\n{proc.stderr[-2000:]}')
+            samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            if run == 0:
+                importtime = _parse_importtime(proc.stderr)
+
+        seconds = statistics.median(sample['seconds'] for sample in samples)
+        rss_mb = max(sample['rss_mb'] for sample in samples)
+        loaded = samples[0]['modules']
+
+        self.stdout.write(f'Boot time (median of {len(samples)}): {seconds:.3f}s (budget {options["max_seconds"]:.3f}s)')
+        self.stdout.write(f'Peak RSS: {rss_mb:.1f} MB (budget {options["max_rss_mb"]:.1f} MB)')
+        if options['top'] and importtime:
+            self.stdout.write('Slowest imports:')
+            for cumulative, name in sorted(importtime, reverse=True)[:options['top']]:
+                self.stdout.write(f'  {cumulative / 1000:8.1f} ms  {name}')
+
+        failures = []
+        if seconds > options['max_seconds']:
+            failures.append(f'boot took {seconds:.3f}s')
+        if rss_mb > options['max_rss_mb']:
+            failures.append(f'RSS was {rss_mb:.1f} MB')
+        if loaded:
+            failures.append(f'heavy modules imported at boot: {", ".join(sorted({name.split(".")[0] for name in loaded}))}')
+
+        if failures:
+            raise CommandError('Import budget exceeded: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Import budget OK'))
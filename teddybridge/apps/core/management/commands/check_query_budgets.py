@@ -0,0 +1,289 @@
+import time
+import uuid
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, resolve
+from django.utils import timezone
+from teddybridge.apps.core.db_routing import replica_aliases
+from teddybridge.apps.core.load_data import seed_load_data
+from teddybridge.apps.core.models import (
+    DoctorPatientLink, Meeting, Notification, PeerMeeting, Post, QRToken, SurveyResponse, Survey, TeddyConversation,
+)
+from teddybridge.apps.core.sharding import sharding_enabled
+from teddybridge.apps.core.sync import encode_token
+
+PASSWORD = 'budget-password'
+
+# (method, path, role, max queries, max milliseconds, body)
+# Paths and bodies are filled from the ids _prepare() returns. Roles: anon, doctor, patient, and
+# spare (a fresh session for a patient the later account routes can change and delete).
+# Counts are exact for the data set seeded below (it is the same on every run) and include the
+# session load, user load and session save every authenticated request makes. Endpoints marked
+# N+1 grow with the data and are budgeted at today's cost so they cannot get worse unnoticed.
+BUDGETS = (
+    ('GET', '/', 'anon', 0, 50, None),
+    ('GET', '/api/health', 'anon', 0, 50, None),
+    ('POST', '/api/auth/register', 'anon', 16, 1500, {
+        'email': 'budget-{run}-new@example.com', 'password': PASSWORD, 'name': 'New Patient', 'role': 'patient',
+    }),
+    ('POST', '/api/auth/login', 'anon', 13, 1500, {'email': '{patient_email}', 'password': PASSWORD}),
+    ('GET', '/api/auth/me', 'doctor', 6, 100, None),
+    ('GET', '/api/auth/link/verify/{verify_token}', 'patient', 6, 100, None),
+    ('POST', '/api/auth/link/patient', 'spare', 13, 200, {'token': '{link_token}'}),
+    ('GET', '/api/auth/teddy/conversations/{conversation_id}', 'patient', 7, 100, None),
+    ('PATCH', '/api/user/profile', 'patient', 11, 200, {'name': 'Renamed Patient'}),
+    ('GET', '/api/user/notifications', 'patient', 5, 100, None),
+    ('PATCH', '/api/user/notifications', 'patient', 8, 100, {'emailSurveys': False}),
+    ('GET', '/api/user/notifications/list', 'patient', 7, 100, None),
+    ('POST', '/api/user/notifications/{notification_id}/read', 'patient', 7, 100, None),
+    ('POST', '/api/user/notifications/read-all', 'patient', 7, 100, None),
+    ('POST', '/api/user/change-password', 'spare', 8, 1500, {'currentPassword': PASSWORD, 'newPassword': 'changed-' + PASSWORD}),
+    ('GET', '/api/doctor/dashboard', 'doctor', 16, 300, None),
+    ('GET', '/api/doctor/stats', 'doctor', 9, 200, None),
+    ('GET', '/api/doctor/patients', 'doctor', 7, 200, None),
+    ('GET', '/api/doctor/patients/recent', 'doctor', 7, 100, None),
+    ('GET', '/api/doctor/patients/top', 'doctor', 7, 200, None),
+    ('GET', '/api/doctor/patients/{patient_id}', 'doctor', 10, 100, None),
+    ('GET', '/api/doctor/appointments', 'doctor', 7, 200, None),
+    ('GET', '/api/doctor/appointments/upcoming', 'doctor', 7, 100, None),
+    ('GET', '/api/doctor/appointments/recent', 'doctor', 7, 100, None),
+    ('GET', '/api/doctor/appointments/statistics', 'doctor', 7, 100, None),
+    ('GET', '/api/doctor/meetings', 'doctor', 7, 200, None),
+    ('GET', '/api/doctor/notes', 'doctor', 7, 200, None),
+    ('GET', '/api/doctor/notes/search?q=knee', 'doctor', 8, 200, None),
+    ('POST', '/api/doctor/qr/generate', 'doctor', 7, 300, {}),
+    ('GET', '/api/doctor/qr/tokens', 'doctor', 7, 100, None),
+    ('POST', '/api/doctor/qr/batch', 'doctor', 7, 1000, {'count': 2}),
+    ('GET', '/api/doctor/qr/{verify_token}/image', 'doctor', 6, 300, None),
+    ('GET', '/api/doctor/surveys', 'doctor', 7, 100, None),
+    ('POST', '/api/doctor/surveys/create', 'doctor', 9, 100, {'title': 'Budget survey', 'questions': []}),
+    ('GET', '/api/doctor/surveys/{survey_id}', 'doctor', 7, 100, None),
+    ('GET', '/api/doctor/surveys/{survey_id}/responses', 'doctor', 8, 100, None),
+    ('PATCH', '/api/doctor/surveys/{survey_id}/update', 'doctor', 10, 100, {'description': 'Updated'}),
+    ('GET', '/api/doctor/monitor/dashboard', 'doctor', 139, 1000, None),  # N+1 over the panel
+    ('POST', '/api/doctor/monitor/scores/add', 'doctor', 9, 100, {
+        'patientId': '{patient_id}', 'scoreType': 'post_surgery', 'score': 80,
+    }),
+    ('GET', '/api/doctor/monitor/trends', 'doctor', 253, 500, None),  # N+1 over the panel
+    ('GET', '/api/doctor/monitor/document/{patient_id}', 'doctor', 8, 1000, None),
+    ('GET', '/api/doctor/monitor/documents/export', 'doctor', 8, 10000, None),
+    ('GET', '/api/doctor/monitor/history/{patient_id}', 'doctor', 8, 100, None),
+    ('GET', '/api/patient/dashboard', 'patient', 23, 300, None),
+    ('GET', '/api/patient/stats', 'patient', 11, 100, None),
+    ('GET', '/api/patient/doctors', 'patient', 11, 100, None),
+    ('GET', '/api/patient/doctors/{doctor_id}', 'patient', 12, 100, None),
+    ('GET', '/api/patient/surveys/pending', 'patient', 8, 100, None),
+    ('GET', '/api/patient/surveys/completed', 'patient', 7, 100, None),
+    ('GET', '/api/patient/appointments/upcoming', 'patient', 7, 100, None),
+    ('GET', '/api/patient/appointments/recent', 'patient', 7, 100, None),
+    ('GET', '/api/patient/appointments/statistics', 'patient', 7, 100, None),
+    ('GET', '/api/patient/appointments', 'patient', 7, 100, None),
+    ('POST', '/api/patient/reviews/submit', 'patient', 16, 100, {'doctorId': '{doctor_id}', 'rating': 5, 'comment': 'Great'}),
+    ('GET', '/api/patient/reviews/doctor/{doctor_id}', 'patient', 7, 100, None),
+    ('POST', '/api/meetings', 'doctor', 12, 200, {'patientId': '{patient_id}', 'scheduledAt': '{tomorrow}'}),
+    ('GET', '/api/meetings/{meeting_id}', 'patient', 7, 200, None),
+    ('POST', '/api/meetings/{meeting_id}/reschedule', 'doctor', 15, 100, {'scheduledAt': '{tomorrow}'}),
+    ('POST', '/api/meetings/{meeting_id}/consent', 'patient', 10, 100, {'status': 'granted'}),
+    ('POST', '/api/meetings/{meeting_id}/participant-event', 'patient', 7, 100, {'event': 'joined'}),
+    ('POST', '/api/meetings/{meeting_id}/startRecording', 'doctor', 10, 100, None),
+    ('POST', '/api/meetings/{meeting_id}/stopRecording', 'doctor', 6, 100, None),
+    ('POST', '/api/meetings/{meeting_id}/endMeeting', 'doctor', 10, 100, None),
+    ('DELETE', '/api/meetings/{meeting_to_delete}/delete', 'doctor', 15, 200, None),
+    ('POST', '/api/qr/generate', 'doctor', 7, 300, {}),
+    ('GET', '/api/qr/tokens', 'doctor', 7, 100, None),
+    ('POST', '/api/qr/batch', 'doctor', 7, 1000, {'count': 2}),
+    ('GET', '/api/qr/{verify_token}/image', 'doctor', 6, 300, None),
+    ('GET', '/api/link/verify/{verify_token}', 'patient', 6, 100, None),
+    ('POST', '/api/link/patient', 'spare', 13, 200, {'token': '{second_link_token}'}),
+    ('POST', '/api/surveys', 'doctor', 9, 100, {'title': 'Budget survey 2', 'questions': []}),
+    ('GET', '/api/surveys/{survey_id}', 'patient', 6, 100, None),
+    ('POST', '/api/surveys/{survey_id}/respond', 'patient', 13, 200, {'answers': {'pain': 3}}),
+    ('GET', '/api/peers/search?q=a', 'patient', 56, 200, None),  # N+1 over the matches
+    ('GET', '/api/peers/chat/conversations', 'patient', 10, 300, None),
+    ('GET', '/api/peers/chat/unread-count', 'patient', 6, 100, None),
+    ('GET', '/api/peers/chat/{peer_user_id}', 'patient', 18, 200, None),
+    ('POST', '/api/peers/chat/send', 'patient', 8, 200, {'receiverId': '{peer_user_id}', 'message': 'Hello'}),
+    ('GET', '/api/peers/meetings', 'patient', 6, 100, None),
+    ('POST', '/api/peers/meetings/create', 'patient', 8, 200, {
+        'participantId': '{other_patient_user_id}', 'title': 'Walk together', 'scheduledAt': '{tomorrow}',
+    }),
+    ('POST', '/api/peers/meetings/{peer_meeting_id}/start', 'doctor', 13, 200, None),
+    ('DELETE', '/api/peers/meetings/{peer_meeting_id}', 'doctor', 7, 100, None),
+    ('GET', '/api/peers/feed', 'patient', 156, 500, None),  # N+1 over the posts
+    ('POST', '/api/peers/posts/create', 'patient', 7, 100, {'content': 'Budget post'}),
+    ('POST', '/api/peers/posts/{post_id}/like', 'patient', 12, 100, None),
+    ('GET', '/api/peers/posts/{post_id}/comments', 'patient', 7, 100, None),
+    ('POST', '/api/peers/posts/{post_id}/comments', 'patient', 8, 100, {'content': 'Nice'}),
+    ('DELETE', '/api/peers/posts/{post_id}', 'patient', 14, 100, None),
+    ('GET', '/api/sync?since={since}', 'doctor', 6, 200, None),
+    ('POST', '/api/auth/logout', 'spare', 4, 100, None),
+    ('DELETE', '/api/user/delete-account', 'spare', 64, 1000, {'password': 'changed-' + PASSWORD}),
+)
+
+# API routes not exercised here, and why
+SKIPPED = {
+    ('POST', 'api/auth/google'): 'verifies a Firebase ID token',
+    ('POST', 'api/auth/teddy/chat'): 'calls the AI provider',
+    ('POST', 'api/auth/teddy/chat/stream'): 'calls the AI provider',
+    ('POST', 'api/meetings/notes/generate'): 'calls the AI provider',
+    ('POST', 'api/meetings/tokens/prefetch'): 'mints Twilio access tokens',
+    ('POST', 'api/meetings/<uuid:meeting_id>/uploadRecording'): 'uploads media and starts transcription',
+    ('GET', 'api/meetings/<uuid:meeting_id>/recording'): 'streams a stored recording file',
+    ('POST', 'api/user/upload-avatar'): 'writes image files to media storage',
+}
+
+
+def api_routes(patterns=None, prefix=''):
+    """{(method, route)} for every API view"""
+    routes = set()
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            routes |= api_routes(pattern.url_patterns, route)
+            continue
+        view_class = getattr(pattern.callback, 'cls', None)
+        if view_class is None or not route.startswith('api/'):
+            continue
+        routes |= {(method.upper(), route) for method in view_class.http_method_names
+                   if method not in ('options', 'head') and hasattr(view_class, method)}
+    return routes
+
+
+def _fill(value, ids):
+    if isinstance(value, str):
+        return value.format(**ids)
+    if isinstance(value, dict):
+        return {key: _fill(item, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, ids) for item in value]
+    return value
+
+
+class Command(BaseCommand):
+    help = ('Call every API route against a seeded data set and fail when one runs more queries or takes longer '
+            'than its budget, or when a route has no budget. All seeded data is rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency-factor', type=float, default=1.0, help='Scale the latency budgets (slow CI machines)')
+        parser.add_argument('--no-latency', action='store_true', help='Check query counts only')
+
+    def handle(self, *args, **options):
+        if sharding_enabled() or replica_aliases():
+            raise CommandError('Run against a single database (unset DATABASE_SHARD_URLS and DATABASE_REPLICA_URLS)')
+
+        covered = {(method, resolve(path.split('?')[0].format_map(_AnyId())).route) for method, path, *_ in BUDGETS}
+        missing = api_routes() - covered - set(SKIPPED)
+        if missing:
+            raise CommandError('Routes without a budget: ' + ', '.join(f'{method} {route}' for method, route in sorted(missing)))
+
+        with transaction.atomic():
+            try:
+                ids = self._prepare()
+                results = self._run(ids)
+            finally:
+                transaction.set_rollback(True)
+
+        failures = []
+        for method, path, queries, milliseconds, status_code, max_queries, max_ms in results:
+            max_ms *= options['latency_factor']
+            problems = []
+            if status_code >= 400:
+                problems.append(f'answered {status_code}')
+            if queries > max_queries:
+                problems.append(f'{queries} queries > {max_queries}')
+            if not options['no_latency'] and milliseconds > max_ms:
+                problems.append(f'{milliseconds:.0f}ms > {max_ms:.0f}ms')
+            if problems:
+                failures.append(f'{method} {path}: {", ".join(problems)}')
+            if problems or options['verbosity'] > 1:
+                line = f'{method:<6} {path:<60} {queries:>4}/{max_queries:<4} queries {milliseconds:7.1f}/{max_ms:.0f}ms {status_code}'
+                self.stdout.write(self.style.ERROR(line) if problems else line)
+
+        self.stdout.write(f'Checked {len(results)} requests; skipped {len(SKIPPED)} routes that call external services')
+        if failures:
+            raise CommandError(f'{len(failures)} requests over budget:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('All requests within budget'))
+
+    def _prepare(self):
+        run = uuid.uuid4().hex[:8]
+        seeded = seed_load_data(doctors=4, patients=80, prefix=f'budget-{run}', password=PASSWORD, seed=0)
+        doctor, second_doctor = seeded['doctors'][:2]
+        # The QR link routes link the spare patient to both doctors, so it must be in neither panel yet
+        panels = set(DoctorPatientLink.objects.filter(doctor__in=[doctor, second_doctor]).values_list('patient_id', flat=True))
+        spare = next(patient for patient in reversed(seeded['patients']) if patient.id not in panels)
+        links = DoctorPatientLink.objects.filter(doctor=doctor).select_related('patient__user').order_by('patient__user__email')
+        patient, other = links[0].patient, links[1].patient
+        survey = Survey.objects.filter(doctor=doctor, is_active=True).order_by('title').first()
+        SurveyResponse.objects.filter(survey=survey, patient=patient).delete()
+        tomorrow = timezone.now() + timedelta(days=1)
+
+        def meeting():
+            return Meeting.objects.create(doctor=doctor, patient=patient, title='Budget visit', scheduled_at=tomorrow)
+
+        def qr_token(owner=doctor):
+            return QRToken.objects.create(doctor=owner, token=uuid.uuid4().hex, expires_at=tomorrow).token
+
+        return {
+            'run': run,
+            'doctor': doctor.user,
+            'patient': patient.user,
+            'spare': spare.user,
+            'doctor_id': doctor.id,
+            'patient_id': patient.id,
+            'patient_email': patient.user.email,
+            'peer_user_id': doctor.user.id,
+            'other_patient_user_id': other.user.id,
+            'survey_id': survey.id,
+            'meeting_id': meeting().id,
+            'meeting_to_delete': meeting().id,
+            'notification_id': Notification.objects.filter(user=patient.user).first().id,
+            'verify_token': qr_token(),
+            'link_token': qr_token(),
+            'second_link_token': qr_token(second_doctor),
+            'conversation_id': TeddyConversation.objects.create(user=patient.user).id,
+            'post_id': Post.objects.create(author=patient.user, content='Budget post').id,
+            # Only doctor-doctor peer meetings start a video call
+            'peer_meeting_id': PeerMeeting.objects.create(
+                organizer=doctor.user, participant=second_doctor.user, title='Case review', scheduled_at=tomorrow,
+            ).id,
+            'tomorrow': tomorrow.isoformat(),
+            'since': encode_token(0),
+        }
+
+    def _run(self, ids):
+        connection = connections[DEFAULT_DB_ALIAS]
+        clients = {'anon': Client()}
+        for role in ('doctor', 'patient'):
+            clients[role] = Client()
+            clients[role].force_login(ids[role])
+        clients['anon'].get('/api/health')  # Warm up URL resolution and view imports
+
+        results = []
+        for method, path, role, max_queries, max_ms, body in BUDGETS:
+            if role == 'spare':
+                # A new session each time; reload the user so a changed password still matches
+                ids['spare'].refresh_from_db()
+                client = Client()
+                client.force_login(ids['spare'])
+            else:
+                client = clients[role]
+            path = path.format(**ids)
+            kwargs = {'data': _fill(body, ids), 'content_type': 'application/json'} if body is not None else {}
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method.lower())(path, **kwargs)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                milliseconds = (time.perf_counter() - started) * 1000
+            results.append((method, path, len(captured), milliseconds, response.status_code, max_queries, max_ms))
+        return results
+
+
+class _AnyId(dict):
+    """Placeholder ids for resolving budget paths to their routes"""
+
+    def __missing__(self, key):
+        return str(uuid.UUID(int=0))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from teddybridge.apps.core.models import QRToken
+from teddybridge.apps.doctors.qr_service import delete_expired_tokens
+
+class Command(BaseCommand):
+    help = 'Delete expired (and optionally used) doctor link QR tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=0, help='Keep tokens that expired within the last N days')
+        parser.add_argument('--include-used', action='store_true', help='Also delete used tokens created before the cutoff')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        if options['dry_run']:
+            expired = QRToken.objects.filter(expires_at__lt=cutoff).count()
+            used = QRToken.objects.filter(used=True, created_at__lt=cutoff, expires_at__gte=cutoff).count() if options['include_used'] else 0
+            self.stdout.write(f'Would delete {expired + used} QR token(s)')
+            return
+
+        deleted = delete_expired_tokens(older_than=cutoff, include_used=options['include_used'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} QR token(s)'))
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from teddybridge.apps.core.sync import compact_change_log
+
+
+class Command(BaseCommand):
+    help = 'Compact the delta sync change log: drop expired rows and rows superseded by a later change'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help=f'Retention in days (default SYNC_RETENTION_DAYS, currently {settings.SYNC_RETENTION_DAYS})',
+        )
+
+    def handle(self, *args, **options):
+        expired, superseded = compact_change_log(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {expired} expired and {superseded} superseded change log row(s)'))
@@ -0,0 +1,203 @@
+import re
+import uuid
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from teddybridge.apps.core.db_routing import replica_aliases
+from teddybridge.apps.core.models import (
+    CallNote, ChangeLogEntry, ChatMessage, Doctor, DoctorPatientLink, Meeting, Notification, Patient, Post, PromsScore,
+    Survey, SurveyResponse, User,
+)
+from teddybridge.apps.core.sharding import sharding_enabled
+from teddybridge.apps.core.sync import encode_token
+
+# (role, path) of the read-heavy endpoints; {patient}/{peer} are filled in from the seeded data
+HOT_ENDPOINTS = (
+    ('doctor', '/api/doctor/dashboard'),
+    ('doctor', '/api/doctor/patients'),
+    ('doctor', '/api/doctor/patients?sort=unread'),
+    ('doctor', '/api/doctor/patients/top'),
+    ('doctor', '/api/doctor/appointments/upcoming'),
+    ('doctor', '/api/doctor/appointments/recent?status=completed'),
+    ('doctor', '/api/doctor/appointments/statistics'),
+    ('doctor', '/api/doctor/notes'),
+    ('doctor', '/api/doctor/surveys'),
+    ('doctor', '/api/doctor/monitor/dashboard'),
+    ('doctor', '/api/doctor/monitor/trends'),
+    ('doctor', '/api/doctor/monitor/history/{patient}'),
+    ('patient', '/api/patient/dashboard'),
+    ('patient', '/api/patient/appointments/upcoming'),
+    ('patient', '/api/patient/appointments/recent'),
+    ('patient', '/api/patient/surveys/completed'),
+    ('doctor', '/api/user/notifications/list'),
+    ('patient', '/api/user/notifications/list'),
+    ('patient', '/api/peers/chat/unread-count'),
+    ('patient', '/api/peers/chat/conversations'),
+    ('patient', '/api/peers/chat/{peer}'),
+    ('patient', '/api/peers/feed'),
+    ('doctor', '/api/sync?since={token}'),
+)
+
+# Tables that grow with usage; a full scan of any of them on a hot path is a regression
+CHECKED_TABLES = {
+    'meetings', 'notifications', 'chat_messages', 'proms_scores', 'posts', 'doctor_patient_links', 'call_notes',
+    'change_log', 'surveys', 'survey_responses',
+}
+
+# Django aliases tables in joins and subqueries: FROM "meetings" U0, INNER JOIN "users" T3
+TABLE_ALIAS = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+class Command(BaseCommand):
+    help = ('Seed a representative data set, call the hot read endpoints and EXPLAIN every query they run; '
+            'fails if one of them scans a large table sequentially. All seeded data is rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=100, help='Seeded doctors')
+        parser.add_argument('--patients', type=int, default=10, help='Seeded patients per doctor')
+        parser.add_argument('--no-analyze', action='store_true', help='Do not refresh planner statistics after seeding')
+
+    def handle(self, *args, **options):
+        if sharding_enabled() or replica_aliases():
+            raise CommandError('Run against a single database (unset DATABASE_SHARD_URLS and DATABASE_REPLICA_URLS)')
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'EXPLAIN checks support SQLite and PostgreSQL, not {connection.vendor}')
+
+        with transaction.atomic():
+            try:
+                seeded = self._seed(options['doctors'], max(options['patients'], 2))
+                if not options['no_analyze']:
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE')
+                failures, explained = self._check(connection, seeded, options['verbosity'])
+            finally:
+                transaction.set_rollback(True)
+
+        self.stdout.write(f'Explained {explained} queries from {len(HOT_ENDPOINTS)} endpoints')
+        if failures:
+            for path, table, sql in failures:
+                self.stdout.write(self.style.ERROR(f'{path}: sequential scan of {table}'))
+                self.stdout.write(f'  {sql[:300]}')
+            raise CommandError(f'{len(failures)} hot queries scan a table sequentially')
+        self.stdout.write(self.style.SUCCESS('No sequential scans on hot tables'))
+
+    def _seed(self, doctor_count, patient_count):
+        run = uuid.uuid4().hex[:8]
+        now = timezone.now()
+        doctor_users = User.objects.bulk_create([
+            User(email=f'explain-doctor-{run}-{i}@example.com', name=f'Doctor {i}', role='doctor') for i in range(doctor_count)
+        ])
+        doctors = Doctor.objects.bulk_create([Doctor(user=user) for user in doctor_users])
+        patient_users = User.objects.bulk_create([
+            User(email=f'explain-patient-{run}-{i}@example.com', name=f'Patient {i}', role='patient')
+            for i in range(doctor_count * patient_count)
+        ])
+        patients = Patient.objects.bulk_create([Patient(user=user) for user in patient_users])
+
+        links, meetings, chats, scores = [], [], [], []
+        for d, doctor in enumerate(doctors):
+            for patient in patients[d * patient_count:(d + 1) * patient_count]:
+                links.append(DoctorPatientLink(doctor=doctor, patient=patient))
+                for days, status in ((-30, 'completed'), (-7, 'completed'), (-1, 'cancelled'), (3, 'scheduled'), (14, 'scheduled')):
+                    meetings.append(Meeting(doctor=doctor, patient=patient, status=status, scheduled_at=now + timedelta(days=days)))
+                for i in range(3):
+                    chats.append(ChatMessage(sender=patient.user, receiver=doctor.user, message=f'Question {i}', is_read=i > 0))
+                    chats.append(ChatMessage(sender=doctor.user, receiver=patient.user, message=f'Answer {i}', is_read=i > 0))
+                for score_type, score in (('pre_surgery', 40), ('post_surgery', 70)):
+                    scores.append(PromsScore(doctor=doctor, patient=patient, score_type=score_type, score=score))
+        DoctorPatientLink.objects.bulk_create(links)
+        Meeting.objects.bulk_create(meetings)
+        ChatMessage.objects.bulk_create(chats)
+        PromsScore.objects.bulk_create(scores)
+        CallNote.objects.bulk_create([
+            CallNote(meeting=meeting, chief_complaint='Follow-up', plan='Continue') for meeting in meetings if meeting.status == 'completed'
+        ])
+        surveys = Survey.objects.bulk_create([
+            Survey(doctor=doctor, title=f'Recovery check {i}', questions=[], is_active=i > 0) for doctor in doctors for i in range(5)
+        ])
+        SurveyResponse.objects.bulk_create([
+            SurveyResponse(survey=surveys[d * 5 + 1], patient=patient, answers={})
+            for d in range(doctor_count) for patient in patients[d * patient_count:(d + 1) * patient_count:2]
+        ])
+        users = doctor_users + patient_users
+        Notification.objects.bulk_create([
+            Notification(user=user, type='general', title='Reminder', message='Seeded', is_read=i > 2)
+            for user in users for i in range(10)
+        ])
+        Post.objects.bulk_create([Post(author=user, content='Seeded post') for user in users])
+        ChangeLogEntry.objects.bulk_create([
+            ChangeLogEntry(user=user, kind='meetings', object_id=uuid.uuid4(), action='update') for user in users for _ in range(5)
+        ])
+
+        # The doctor and patient whose endpoints are called: a panel in the middle of the data set
+        doctor = doctors[doctor_count // 2]
+        patient = patients[(doctor_count // 2) * patient_count]
+        return {
+            'doctor': doctor.user,
+            'patient': patient.user,
+            'values': {'patient': patient.id, 'peer': doctor.user.id, 'token': encode_token(0)},
+        }
+
+    def _check(self, connection, seeded, verbosity):
+        clients = {}
+        for role in ('doctor', 'patient'):
+            clients[role] = Client()
+            clients[role].force_login(seeded[role])
+
+        failures, explained, seen = [], 0, set()
+        for role, path in HOT_ENDPOINTS:
+            path = path.format(**seeded['values'])
+            with CaptureQueriesContext(connection) as captured:
+                response = clients[role].get(path, HTTP_HOST='localhost')
+            if response.status_code != 200:
+                raise CommandError(f'{path} answered {response.status_code}')
+
+            for query in captured.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT') or sql in seen:
+                    continue
+                seen.add(sql)
+                tables = {name: name for name in re.findall(r'FROM "(\w+)"|JOIN "(\w+)"', sql) for name in name if name}
+                tables.update({alias: table for table, alias in TABLE_ALIAS.findall(sql)})
+                if not CHECKED_TABLES & set(tables.values()):
+                    continue
+                plan = self._explain(connection, sql)
+                explained += 1
+                if verbosity > 1:
+                    self.stdout.write(f'{role} {path}\n  {sql[:200]}\n' + '\n'.join(f'    {line}' for line in plan))
+                for table in self._full_scans(connection, plan, tables):
+                    if table in CHECKED_TABLES:
+                        failures.append((f'{role} {path}', table, sql))
+        return failures, explained
+
+    def _explain(self, connection, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [row[-1] for row in cursor.fetchall()]
+            # Small seeded tables make a sequential scan look cheap; with it disabled,
+            # PostgreSQL still picks one only when no index can serve the query
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def _full_scans(connection, plan, tables):
+        for line in plan:
+            if connection.vendor == 'sqlite':
+                match = SQLITE_FULL_SCAN.match(line.strip())
+                if match:
+                    yield tables.get(match.group(1), match.group(1))
+                elif 'AUTOMATIC' in line:
+                    # SQLite built a temporary index because no declared one fits
+                    yield tables.get(line.split()[1], line.split()[1])
+            else:
+                match = POSTGRES_FULL_SCAN.search(line)
+                if match:
+                    yield match.group(1)
@@ -1,66 +1,30 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from teleclinic.apps.core.models import Meeting
-import requests
-import os
+from teddybridge.apps.core.models import Meeting
+from teddybridge.apps.core.sharding import shard_aliases, sharding_enabled, use_shard
+from teddybridge.apps.meetings.room_provisioning import provision_rooms
 
 class Command(BaseCommand):
     help = 'Create Daily.co rooms for existing meetings'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.DAILY_PROVISION_WORKERS, help='Concurrent Daily.co requests')
+        parser.add_argument('--batch-size', type=int, default=settings.DAILY_PROVISION_BATCH_SIZE, help='Meetings saved per bulk_update')
+
     def handle(self, *args, **options):
-        daily_api_key = os.getenv('DAILY_API_KEY')
-        
-        if not daily_api_key:
+        if not settings.DAILY_API_KEY:
             self.stdout.write(self.style.ERROR('DAILY_API_KEY not found in environment'))
             return
-        
-        meetings = Meeting.objects.filter(daily_room_url__isnull=True, status='scheduled')
-        
-        self.stdout.write(f'Found {meetings.count()} meetings without rooms')
-        
-        for meeting in meetings:
-            try:
-                room_name = str(meeting.id)
-                response = requests.post(
-                    'https://api.daily.co/v1/rooms',
-                    headers={
-                        'Authorization': f'Bearer {daily_api_key}',
-                        'Content-Type': 'application/json'
-                    },
-                    json={
-                        'name': room_name,
-                        'privacy': 'public',
-                        'properties': {
-                            'enable_screenshare': True,
-                            'enable_chat': True,
-                            'start_video_off': False,
-                            'start_audio_off': False
-                        }
-                    }
-                )
-                
-                if response.status_code == 200:
-                    room_data = response.json()
-                    room_url = room_data.get('url')
-                    meeting.daily_room_url = room_url
-                    meeting.save()
-                    self.stdout.write(self.style.SUCCESS(f'Created room for meeting {meeting.id}: {room_url}'))
-                elif response.status_code == 400 and 'already exists' in response.text:
-                    # Room already exists, fetch it
-                    get_response = requests.get(
-                        f'https://api.daily.co/v1/rooms/{room_name}',
-                        headers={'Authorization': f'Bearer {daily_api_key}'}
-                    )
-                    if get_response.status_code == 200:
-                        room_data = get_response.json()
-                        room_url = room_data.get('url')
-                        meeting.daily_room_url = room_url
-                        meeting.save()
-                        self.stdout.write(self.style.SUCCESS(f'Fetched existing room for meeting {meeting.id}: {room_url}'))
-                    else:
-                        self.stdout.write(self.style.ERROR(f'Failed to fetch room for meeting {meeting.id}'))
-                else:
-                    self.stdout.write(self.style.ERROR(f'Failed for meeting {meeting.id}: {response.status_code} - {response.text}'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error for meeting {meeting.id}: {str(e)}'))
-        
-        self.stdout.write(self.style.SUCCESS('Done!'))
+
+        provisioned, failures = 0, {}
+        for shard in shard_aliases():
+            with use_shard(shard):
+                meetings = list(Meeting.objects.filter(daily_room_url__isnull=True, status='scheduled').only('id', 'daily_room_url'))
+                self.stdout.write(f'Found {len(meetings)} meetings without rooms' + (f' on {shard}' if sharding_enabled() else ''))
+                created, failed = provision_rooms(meetings, workers=options['workers'], batch_size=options['batch_size'])
+            provisioned += created
+            failures.update(failed)
+
+        for meeting_id, error in failures.items():
+            self.stdout.write(self.style.ERROR(f'Failed for meeting {meeting_id}: {error}'))
+        self.stdout.write(self.style.SUCCESS(f'Done! Created {provisioned} room(s), {len(failures)} failed'))
@@ -0,0 +1,300 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from teddybridge.apps.core.models import User
+
+
+def dashboard(user, call):
+    """Open the dashboard: summary, upcoming appointments, notifications"""
+    call('GET', f'/api/{user["role"]}/dashboard')
+    call('GET', f'/api/{user["role"]}/appointments/upcoming')
+    call('GET', '/api/user/notifications/list')
+
+
+def chat_polling(user, call):
+    """Poll for new messages and open one conversation"""
+    call('GET', '/api/peers/chat/unread-count')
+    conversations = call('GET', '/api/peers/chat/conversations')
+    if conversations:
+        peer = user['rng'].choice(conversations)['peerId']
+        call('GET', f'/api/peers/chat/{peer}', '/api/peers/chat/<user_id>')
+
+
+def survey_submission(user, call):
+    """Answer the oldest pending survey"""
+    pending = call('GET', '/api/patient/surveys/pending')
+    if not pending:
+        return
+    survey_id = pending[0]['id']
+    call('GET', f'/api/surveys/{survey_id}', '/api/surveys/<id>')
+    call('POST', f'/api/surveys/{survey_id}/respond', '/api/surveys/<id>/respond', json={
+        'answers': {'pain': user['rng'].randint(0, 10), 'mobility': '100-500m', 'notes': ''},
+    })
+
+
+def meeting_join(user, call):
+    """Join the next appointment: load it (with its video token) and announce the join"""
+    upcoming = call('GET', f'/api/{user["role"]}/appointments/upcoming')
+    if not upcoming:
+        return
+    meeting_id = upcoming[0]['id']
+    call('GET', f'/api/meetings/{meeting_id}', '/api/meetings/<id>')
+    call('POST', f'/api/meetings/{meeting_id}/participant-event', '/api/meetings/<id>/participant-event',
+         json={'event': 'joined'})
+
+
+# (scenario, weight) per role; weights are relative, roughly the mix the web app produces
+SCENARIOS = {
+    'doctor': ((dashboard, 45), (chat_polling, 40), (meeting_join, 15)),
+    'patient': ((dashboard, 35), (chat_polling, 35), (survey_submission, 15), (meeting_join, 15)),
+}
+
+
+def percentile(sorted_samples, p):
+    if len(sorted_samples) == 1:
+        return sorted_samples[0]
+    return statistics.quantiles(sorted_samples, n=100, method='inclusive')[p - 1]
+
+
+class Recorder:
+    """Latency samples and errors per route, ignoring everything before start()"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recording = False
+        self.samples = {}
+        self.errors = {}
+        self.scenarios = {}
+
+    def start(self):
+        with self.lock:
+            self.recording = True
+            self.started = time.monotonic()
+
+    def stop(self):
+        with self.lock:
+            self.recording = False
+            self.elapsed = time.monotonic() - self.started
+
+    def add(self, route, milliseconds, failed):
+        with self.lock:
+            if self.recording:
+                self.samples.setdefault(route, []).append(milliseconds)
+                if failed:
+                    self.errors[route] = self.errors.get(route, 0) + 1
+
+    def scenario(self, name):
+        with self.lock:
+            if self.recording:
+                self.scenarios[name] = self.scenarios.get(name, 0) + 1
+
+    def report(self):
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            routes[route] = {
+                'requests': len(samples),
+                'errors': self.errors.get(route, 0),
+                'rps': round(len(samples) / self.elapsed, 2),
+                'p50_ms': round(percentile(samples, 50), 1),
+                'p95_ms': round(percentile(samples, 95), 1),
+                'p99_ms': round(percentile(samples, 99), 1),
+                'max_ms': round(samples[-1], 1),
+            }
+        total = sum(route['requests'] for route in routes.values())
+        return {
+            'seconds': round(self.elapsed, 1),
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'rps': round(total / self.elapsed, 2),
+            'scenarios': dict(sorted(self.scenarios.items())),
+            'routes': routes,
+        }
+
+
+class Command(BaseCommand):
+    help = ('Start the app under gunicorn, log in users seeded by seed_load_data and replay weighted scenarios '
+            '(dashboard, chat polling, survey submission, meeting join) from a pool of client threads; '
+            'reports throughput and p50/p95/p99 latency per route as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Load an already running server instead of starting gunicorn (same database)')
+        parser.add_argument('--bind', default='127.0.0.1:8765', help='Address for the local gunicorn')
+        parser.add_argument('--workers', type=int, default=2, help='Gunicorn worker processes')
+        parser.add_argument('--threads', type=int, default=1, help='Threads per gunicorn worker')
+        parser.add_argument('--asgi', action='store_true', help='Serve teddybridge.asgi with uvicorn workers, as in DEPLOYMENT_GUIDE.md')
+        parser.add_argument('--concurrency', type=int, default=16, help='Client threads sending requests')
+        parser.add_argument('--users', type=int, default=40, help='Seeded users to log in (at least --concurrency)')
+        parser.add_argument('--doctor-share', type=float, default=0.25, help='Share of the users that are doctors')
+        parser.add_argument('--prefix', default='load', help='Email prefix given to seed_load_data')
+        parser.add_argument('--password', default='loadtest', help='Password given to seed_load_data')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to record')
+        parser.add_argument('--warmup', type=float, default=5, help='Seconds of load before recording starts')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for user and scenario choice')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        users = self._pick_users(options)
+        server = None
+        url = (options['url'] or f'http://{options["bind"]}').rstrip('/')
+        try:
+            if not options['url']:
+                server = self._start_gunicorn(options, url)
+            pool = self._log_in(users, url, options['password'])
+            recorder = self._run(pool, url, options)
+        finally:
+            if server:
+                self._stop(server)
+
+        report = {
+            'url': url,
+            'server': None if options['url'] else {
+                'workers': options['workers'], 'threads': options['threads'], 'asgi': options['asgi'],
+            },
+            'concurrency': options['concurrency'],
+            'users': {role: sum(1 for user in pool if user['role'] == role) for role in SCENARIOS},
+            **recorder.report(),
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(
+                f'{report["requests"]} requests in {report["seconds"]}s ({report["rps"]} rps, {report["errors"]} errors); '
+                f'report written to {options["output"]}'
+            ))
+        else:
+            self.stdout.write(output)
+
+    def _pick_users(self, options):
+        count = max(options['users'], options['concurrency'])
+        doctors = max(1, round(count * options['doctor_share']))
+        picked = []
+        for role, wanted in (('doctor', doctors), ('patient', count - doctors)):
+            emails = list(User.objects.filter(
+                email__startswith=f'{options["prefix"]}-{role}-', role=role,
+            ).order_by('email').values_list('email', flat=True)[:wanted])
+            if wanted and not emails:
+                raise CommandError(f'No seeded {role}s with prefix {options["prefix"]!r}; run manage.py seed_load_data first')
+            picked += [(email, role) for email in emails]
+        return picked
+
+    def _start_gunicorn(self, options, url):
+        app = 'teddybridge.asgi:application' if options['asgi'] else 'teddybridge.wsgi:application'
+        command = [
+            sys.executable, '-m', 'gunicorn', app, '--bind', options['bind'],
+            '--workers', str(options['workers']), '--threads', str(options['threads']),
+        ]
+        if options['asgi']:
+            command += ['-k', 'uvicorn_worker.UvicornWorker']
+        log = tempfile.TemporaryFile(mode='w+')
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'teddybridge.settings'))
+        server = subprocess.Popen(command, cwd=str(settings.BASE_DIR), env=env, stdout=log, stderr=subprocess.STDOUT)
+        server.log = log
+        self.stderr.write(f'Started gunicorn ({options["workers"]} workers x {options["threads"]} threads) on {url}')
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                log.seek(0)
+                raise CommandError(f'gunicorn exited with {server.returncode}:\n{log.read()[-2000:]}')
+            try:
+                if requests.get(f'{url}/api/health', timeout=1).ok:
+                    return server
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self._stop(server)
+        raise CommandError(f'gunicorn did not answer {url}/api/health within 30s')
+
+    @staticmethod
+    def _stop(server):
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+        server.log.close()
+
+    def _log_in(self, users, url, password):
+        def log_in(user):
+            email, role = user
+            session = requests.Session()
+            response = session.post(f'{url}/api/auth/login', json={'email': email, 'password': password}, timeout=30)
+            if response.status_code != 200:
+                raise CommandError(f'Login as {email} answered {response.status_code}; check --prefix and --password')
+            # Production settings mark the session cookie Secure; send it over the local plain-HTTP connection too
+            for cookie in session.cookies:
+                cookie.secure = False
+            return {'email': email, 'role': role, 'session': session}
+
+        # Password hashing makes logins slow, so log the pool in concurrently before the clock starts
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            pool = list(executor.map(log_in, users))
+        self.stderr.write(f'Logged in {len(pool)} users')
+        return pool
+
+    def _run(self, pool, url, options):
+        recorder = Recorder()
+        idle = list(pool)
+        idle_lock = threading.Lock()
+        deadline = time.monotonic() + options['warmup'] + options['duration']
+
+        def worker(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            while time.monotonic() < deadline:
+                # Each session is used by one thread at a time
+                with idle_lock:
+                    user = idle.pop(rng.randrange(len(idle)))
+                try:
+                    user['rng'] = rng
+                    scenarios, weights = zip(*SCENARIOS[user['role']])
+                    scenario = rng.choices(scenarios, weights=weights)[0]
+                    recorder.scenario(scenario.__name__)
+                    scenario(user, lambda method, path, route=None, **kwargs: self._call(
+                        recorder, user['session'], url, method, path, route, **kwargs))
+                finally:
+                    with idle_lock:
+                        idle.append(user)
+
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        self.stderr.write(f'Warming up for {options["warmup"]:.0f}s with {len(threads)} client threads')
+        time.sleep(options['warmup'])
+        recorder.start()
+        self.stderr.write(f'Recording for {options["duration"]:.0f}s')
+        time.sleep(max(0, deadline - time.monotonic()))
+        recorder.stop()
+        for thread in threads:
+            thread.join()
+        return recorder
+
+    @staticmethod
+    def _call(recorder, session, url, method, path, route=None, **kwargs):
+        """Send one request and record it under its route; returns the JSON body or None on failure"""
+        route = f'{method} {route or path}'
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            recorder.add(route, (time.perf_counter() - started) * 1000, failed=True)
+            return None
+        recorder.add(route, (time.perf_counter() - started) * 1000, failed=response.status_code >= 400)
+        if response.status_code >= 400:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from teddybridge.apps.core.models import CallNote
+
+
+def _note_tokens(note):
+    usage = (note.ai_metadata or {}).get('usage') or {}
+    return (usage.get('prompt_tokens') or 0) + (usage.get('completion_tokens') or 0)
+
+
+class Command(BaseCommand):
+    # Duplicate cache entries cannot exist: call_notes_meeting_content_hash (migration 0024) keeps one per meeting
+    help = 'Report savings from the clinical note cache'
+
+    def handle(self, *args, **options):
+        total_notes = CallNote.objects.count()
+        hashed = CallNote.objects.filter(content_hash__isnull=False)
+        hashed_count = hashed.count()
+        total_hits = hashed.aggregate(total=Sum('cache_hits'))['total'] or 0
+
+        # Each hit skipped one generation with the same cost as the original
+        tokens_saved = 0
+        for note in hashed.filter(cache_hits__gt=0).only('cache_hits', 'ai_metadata'):
+            tokens_saved += note.cache_hits * _note_tokens(note)
+
+        self.stdout.write(f'Notes: {total_notes} ({hashed_count} content-addressed)')
+        self.stdout.write(f'Cache hits: {total_hits}')
+        self.stdout.write(f'Estimated tokens saved: {tokens_saved}')
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from teddybridge.apps.core.models import Doctor, DoctorShard
+from teddybridge.apps.core.sharding import (
+    move_doctor, place_doctor, ring_shard, shard_aliases, sharding_enabled, sync_reference_rows,
+)
+
+
+class Command(BaseCommand):
+    help = ('Move doctors whose data is not on the shard the hash ring assigns them (e.g. after adding a shard), '
+            'or one doctor with --doctor; the app keeps serving while each doctor moves')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', help='Move only this doctor (id)')
+        parser.add_argument('--to', help='Target shard for --doctor (default: its ring shard; a later full rebalance moves it back)')
+        parser.add_argument('--limit', type=int, default=0, help='Move at most this many doctors')
+        parser.add_argument('--dry-run', action='store_true', help='Only print the plan')
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError('Sharding is off; set DATABASE_SHARD_URLS')
+        aliases = shard_aliases()
+        if options['to'] and (not options['doctor'] or options['to'] not in aliases):
+            raise CommandError(f'--to needs --doctor and one of: {", ".join(aliases)}')
+
+        plan = self._plan(options)
+        self.stdout.write(f'{len(plan)} doctor(s) to move')
+        for doctor_id, source, target in plan:
+            self.stdout.write(f'  {doctor_id}: {source} -> {target}')
+        if options['dry_run'] or not plan:
+            return
+
+        # New shards need the users, doctors and patients that clinical rows point at
+        self.stdout.write(f'Synced {sync_reference_rows()} reference rows')
+
+        failed = 0
+        for doctor_id, source, target in plan:
+            try:
+                rows = move_doctor(doctor_id, target)
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'Failed to move {doctor_id}: {str(e)}'))
+                continue
+            self.stdout.write(f'Moved {doctor_id}: {source} -> {target} ({rows} rows)')
+        if failed:
+            raise CommandError(f'{failed} move(s) failed; rerun to retry them')
+        self.stdout.write(self.style.SUCCESS(f'Moved {len(plan)} doctor(s)'))
+
+    def _plan(self, options):
+        entries = dict(DoctorShard.objects.values_list('doctor_id', 'alias'))
+        if options['doctor']:
+            try:
+                doctor_id = Doctor.objects.get(id=options['doctor']).id
+            except (Doctor.DoesNotExist, ValueError):
+                raise CommandError(f'Doctor {options["doctor"]} not found')
+            source = entries.get(doctor_id, 'default')
+            target = options['to'] or ring_shard(doctor_id)
+            return [(doctor_id, source, target)] if source != target else []
+
+        plan = []
+        for doctor_id in Doctor.objects.order_by('id').values_list('id', flat=True):
+            source, target = entries.get(doctor_id, 'default'), ring_shard(doctor_id)
+            if source != target:
+                plan.append((doctor_id, source, target))
+            elif doctor_id not in entries and not options['dry_run']:
+                place_doctor(doctor_id)  # From before sharding, already where the ring wants it
+        return plan[:options['limit']] if options['limit'] else plan
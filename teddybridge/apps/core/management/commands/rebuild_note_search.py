@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from teddybridge.apps.core.models import CallNote, NoteSearchEntry
+from teddybridge.apps.core.note_search import drop_search_index, index_note, install_search_index, search_backend
+from teddybridge.apps.core.sharding import shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Recreate the clinical note search index and reindex every note (on every shard)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Notes indexed per transaction')
+
+    def handle(self, *args, **options):
+        total = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                total += self._rebuild(alias, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the note search index ({total} notes)'))
+
+    def _rebuild(self, alias, batch_size):
+        connection = connections[alias]
+        with transaction.atomic(using=alias):
+            NoteSearchEntry.objects.all().delete()
+            drop_search_index(connection)
+            install_search_index(connection)
+        self.stdout.write(f'Search backend ({alias}): {search_backend(connection)}')
+
+        note_ids = list(CallNote.objects.order_by('created_at').values_list('id', flat=True))
+        for start in range(0, len(note_ids), batch_size):
+            batch = note_ids[start:start + batch_size]
+            notes = CallNote.objects.filter(id__in=batch).select_related('meeting__patient__user', 'meeting__transcript')
+            with transaction.atomic(using=alias):
+                for note in notes:
+                    index_note(note)
+            self.stdout.write(f'Indexed {min(start + batch_size, len(note_ids))}/{len(note_ids)} notes')
+        return len(note_ids)
@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from teddybridge.apps.core.load_data import seed_load_data
+from teddybridge.apps.core.models import User
+from teddybridge.apps.core.sharding import sharding_enabled
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic load-test data set (doctors, patients, meetings, notes, surveys, PROMS, chat, '
+            'posts, notifications) with bulk inserts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50, help='Number of doctors')
+        parser.add_argument('--patients', type=int, default=1000, help='Number of patients (about 20%% are linked to two doctors)')
+        parser.add_argument('--prefix', default='load', help='Email prefix of the seeded users (<prefix>-doctor-<n>@example.com)')
+        parser.add_argument('--password', default='loadtest', help='Password of every seeded user, for logging in load tests')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same arguments give the same data set')
+        parser.add_argument('--no-index', action='store_true', help='Skip writing note search entries (faster for big sets)')
+        parser.add_argument('--clear', action='store_true', help='First delete the users (and their data) seeded with this prefix')
+
+    def handle(self, *args, **options):
+        if options['doctors'] < 1 or options['patients'] < 1:
+            raise CommandError('--doctors and --patients must be at least 1')
+        seeded = User.objects.filter(email__startswith=f"{options['prefix']}-", email__endswith='@example.com')
+        if options['clear']:
+            deleted, _ = seeded.delete()
+            self.stdout.write(f'Deleted {deleted} rows seeded with prefix {options["prefix"]!r}')
+        elif seeded.exists():
+            raise CommandError(f'Users with prefix {options["prefix"]!r} exist; pass --clear or another --prefix')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            result = seed_load_data(
+                doctors=options['doctors'], patients=options['patients'], prefix=options['prefix'],
+                password=options['password'], seed=options['seed'], index_notes=not options['no_index'],
+            )
+        seconds = time.monotonic() - started
+
+        for model, rows in sorted(result['counts'].items()):
+            self.stdout.write(f'  {model:<20} {rows:>8}')
+        total = sum(result['counts'].values())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {total} rows in {seconds:.1f}s ({total / seconds:.0f} rows/s)'))
+        self.stdout.write(f'Log in as {options["prefix"]}-doctor-0@example.com or {options["prefix"]}-patient-0@example.com '
+                          f'with password {options["password"]!r}')
+        if sharding_enabled():
+            self.stdout.write('Sharding is on: the data was written to the default database; run rebalance_shards to spread it')
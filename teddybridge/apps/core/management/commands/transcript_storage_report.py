@@ -0,0 +1,80 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from teddybridge.apps.core.appointments import appointment_rows, appointments
+from teddybridge.apps.core.models import CallNote, Doctor, Meeting, TranscriptBlob
+from teddybridge.apps.core.transcripts import unreferenced_blobs
+
+
+def _referenced_bytes(queryset, field):
+    """Uncompressed bytes the rows would hold if each stored its own copy of the text"""
+    return queryset.filter(**{f'{field}__isnull': False}).aggregate(total=Sum(f'{field}__size'))['total'] or 0
+
+
+def _time_query(build, rounds):
+    """Median seconds to build and fully evaluate a query"""
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        build()
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)[len(timings) // 2]
+
+
+class Command(BaseCommand):
+    help = 'Report compressed transcript storage savings and time the doctor meeting list query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=5, help='Timing rounds for the list query benchmark (0 to skip)')
+        parser.add_argument('--prune', action='store_true', help='Delete blobs no meeting or note refers to')
+
+    def handle(self, *args, **options):
+        blobs = TranscriptBlob.objects.aggregate(count=Count('sha256'), size=Sum('size'), stored=Sum('compressed_size'))
+        blob_count = blobs['count'] or 0
+        stored = blobs['stored'] or 0
+
+        # The old layout kept a full copy per reference: meetings.transcript_text
+        # plus the original transcript and raw response inside call_notes.ai_metadata
+        inline_bytes = (
+            _referenced_bytes(Meeting.objects.all(), 'transcript') +
+            _referenced_bytes(CallNote.objects.all(), 'source_transcript') +
+            _referenced_bytes(CallNote.objects.all(), 'raw_response')
+        )
+        meetings = Meeting.objects.filter(has_transcript=True).count()
+
+        self.stdout.write(f'Blobs: {blob_count} ({blobs["size"] or 0} bytes of text, {stored} bytes stored)')
+        self.stdout.write(f'Inline storage (previous layout): {inline_bytes} bytes')
+        if inline_bytes:
+            self.stdout.write(f'Saved: {inline_bytes - stored} bytes ({100 * (inline_bytes - stored) / inline_bytes:.1f}%)')
+        if meetings:
+            self.stdout.write(
+                f'Per meeting with a transcript ({meetings}): {inline_bytes / meetings:.0f} -> {stored / meetings:.0f} bytes'
+            )
+
+        orphaned = unreferenced_blobs()
+        orphaned_count = orphaned.count()
+        self.stdout.write(f'Unreferenced blobs: {orphaned_count}')
+        if options['prune'] and orphaned_count:
+            deleted, _ = orphaned.delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} unreferenced blob(s)'))
+
+        rounds = options['rounds']
+        doctor = Doctor.objects.annotate(meeting_count=Count('meetings')).order_by('-meeting_count').first()
+        if not rounds or not doctor or not doctor.meeting_count:
+            return
+
+        def full_rows():
+            # What get_meetings used to do: whole rows with the transcript, one note query per meeting
+            for meeting in Meeting.objects.filter(doctor=doctor).select_related('patient__user', 'transcript').order_by('-created_at'):
+                CallNote.objects.filter(meeting=meeting).exists()
+
+        def list_rows():
+            list(appointment_rows(appointments(doctor=doctor, with_notes=True), 'doctor').order_by('-created_at'))
+
+        before = _time_query(full_rows, rounds)
+        after = _time_query(list_rows, rounds)
+        self.stdout.write(f'Meeting list for a doctor with {doctor.meeting_count} meetings (median of {rounds}):')
+        self.stdout.write(f'  full rows + per-row note check: {before * 1000:.1f} ms')
+        self.stdout.write(f'  values() + Exists annotation:   {after * 1000:.1f} ms')
+        if after:
+            self.stdout.write(self.style.SUCCESS(f'  {before / after:.1f}x faster'))
@@ -0,0 +1,49 @@
+# Generated migration for Teddy AI conversation memory
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_add_firebase_uid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeddyConversation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('summary', models.TextField(blank=True, default='')),
+                ('summary_tokens', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='teddy_conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'teddy_conversations',
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TeddyMessage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('role', models.CharField(choices=[('user', 'User'), ('assistant', 'Assistant')], max_length=10)),
+                ('content', models.TextField()),
+                ('token_count', models.IntegerField(default=0)),
+                ('summarized', models.BooleanField(default=False, help_text='Rolled into the conversation summary')),
+                ('prompt_tokens', models.IntegerField(blank=True, help_text='Prompt size of the request that produced this reply', null=True)),
+                ('completion_tokens', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='core.teddyconversation')),
+            ],
+            options={
+                'db_table': 'teddy_messages',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
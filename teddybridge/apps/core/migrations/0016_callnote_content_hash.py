@@ -0,0 +1,23 @@
+# Generated migration for the clinical note cache
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_teddy_conversations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callnote',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='sha256 of prompt version, model and transcript', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='callnote',
+            name='cache_hits',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
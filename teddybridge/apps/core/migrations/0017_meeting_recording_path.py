@@ -0,0 +1,18 @@
+# Generated migration for persisted meeting recordings
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_callnote_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='recording_path',
+            field=models.CharField(blank=True, help_text='Storage name of the persisted recording', max_length=500, null=True),
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated migration moving transcripts into compressed blob storage
+
+import hashlib
+import zlib
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def _blob(TranscriptBlob, db, text):
+    # Always zlib here: the migration must not depend on optional packages
+    if not text:
+        return None
+    raw = text.encode('utf-8')
+    sha256 = hashlib.sha256(raw).hexdigest()
+    data = zlib.compress(raw, 9)
+    blob, _ = TranscriptBlob.objects.using(db).get_or_create(sha256=sha256, defaults={
+        'codec': 'zlib', 'data': data, 'size': len(raw), 'compressed_size': len(data),
+    })
+    return blob
+
+
+def move_transcripts_to_blobs(apps, schema_editor):
+    # The database being migrated, which is not always 'default' (shards, see core/sharding.py)
+    db = schema_editor.connection.alias
+    TranscriptBlob = apps.get_model('core', 'TranscriptBlob')
+    Meeting = apps.get_model('core', 'Meeting')
+    CallNote = apps.get_model('core', 'CallNote')
+
+    pending = []
+    for meeting in Meeting.objects.using(db).exclude(transcript_text__isnull=True).exclude(transcript_text='').only('id', 'transcript_text').iterator(chunk_size=BATCH_SIZE):
+        meeting.transcript = _blob(TranscriptBlob, db, meeting.transcript_text)
+        meeting.has_transcript = True
+        pending.append(meeting)
+        if len(pending) >= BATCH_SIZE:
+            Meeting.objects.using(db).bulk_update(pending, ['transcript', 'has_transcript'])
+            pending = []
+    Meeting.objects.using(db).bulk_update(pending, ['transcript', 'has_transcript'])
+
+    pending = []
+    for note in CallNote.objects.using(db).exclude(ai_metadata__isnull=True).only('id', 'ai_metadata').iterator(chunk_size=BATCH_SIZE):
+        metadata = dict(note.ai_metadata or {})
+        # Parsed notes stored it as original_transcript, unparsed ones as transcript
+        source = metadata.pop('original_transcript', None)
+        source = metadata.pop('transcript', None) or source
+        raw_response = metadata.pop('raw_response', None)
+        if metadata == note.ai_metadata:
+            continue
+        note.source_transcript = _blob(TranscriptBlob, db, source)
+        note.raw_response = _blob(TranscriptBlob, db, raw_response)
+        note.ai_metadata = metadata
+        pending.append(note)
+        if len(pending) >= BATCH_SIZE:
+            CallNote.objects.using(db).bulk_update(pending, ['source_transcript', 'raw_response', 'ai_metadata'])
+            pending = []
+    CallNote.objects.using(db).bulk_update(pending, ['source_transcript', 'raw_response', 'ai_metadata'])
+
+
+def restore_transcripts_from_blobs(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Meeting = apps.get_model('core', 'Meeting')
+    CallNote = apps.get_model('core', 'CallNote')
+
+    def text(blob):
+        return zlib.decompress(bytes(blob.data)).decode('utf-8') if blob else None
+
+    for meeting in Meeting.objects.using(db).filter(transcript__isnull=False).select_related('transcript').iterator(chunk_size=BATCH_SIZE):
+        meeting.transcript_text = text(meeting.transcript)
+        meeting.save(using=db, update_fields=['transcript_text'])
+
+    notes = CallNote.objects.using(db).filter(models.Q(source_transcript__isnull=False) | models.Q(raw_response__isnull=False))
+    for note in notes.select_related('source_transcript', 'raw_response').iterator(chunk_size=BATCH_SIZE):
+        metadata = dict(note.ai_metadata or {})
+        if note.source_transcript:
+            metadata['original_transcript' if metadata.get('parsed') else 'transcript'] = text(note.source_transcript)
+        if note.raw_response:
+            metadata['raw_response'] = text(note.raw_response)
+        note.ai_metadata = metadata
+        note.save(using=db, update_fields=['ai_metadata'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_meeting_recording_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('codec', models.CharField(max_length=10)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(help_text='Uncompressed size in bytes')),
+                ('compressed_size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'transcript_blobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='transcript',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.transcriptblob'),
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='has_transcript',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='callnote',
+            name='source_transcript',
+            field=models.ForeignKey(blank=True, help_text='Transcript as returned by the transcription service', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.transcriptblob'),
+        ),
+        migrations.AddField(
+            model_name='callnote',
+            name='raw_response',
+            field=models.ForeignKey(blank=True, help_text='Unparsed AI response', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.transcriptblob'),
+        ),
+        migrations.RunPython(move_transcripts_to_blobs, restore_transcripts_from_blobs),
+        migrations.RemoveField(
+            model_name='meeting',
+            name='transcript_text',
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated migration for clinical note search
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def install_index(apps, schema_editor):
+    from teddybridge.apps.core.note_search import install_search_index
+    install_search_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    from teddybridge.apps.core.note_search import drop_search_index
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_transcript_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteSearchEntry',
+            fields=[
+                ('call_note', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to='core.callnote')),
+                ('patient_name', models.CharField(blank=True, max_length=255)),
+                ('note_text', models.TextField(blank=True)),
+                ('transcript_sha', models.CharField(blank=True, help_text='Transcript blob indexed with the note', max_length=64, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.doctor')),
+                ('meeting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.meeting')),
+            ],
+            options={
+                'db_table': 'note_search_entries',
+                'indexes': [models.Index(fields=['doctor', '-created_at'], name='note_search_doctor_recent')],
+            },
+        ),
+        migrations.RunPython(install_index, drop_index),
+    ]
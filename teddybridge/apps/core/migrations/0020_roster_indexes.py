@@ -0,0 +1,25 @@
+# Generated migration for the doctor patient roster query
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_note_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorpatientlink',
+            index=models.Index(fields=['doctor', '-linked_at'], name='patient_links_doctor_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['doctor', 'patient', 'status', 'scheduled_at'], name='meetings_doctor_patient_visit'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['receiver', 'sender', 'is_read'], name='chat_messages_unread'),
+        ),
+    ]
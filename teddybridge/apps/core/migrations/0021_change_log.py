@@ -0,0 +1,30 @@
+# Generated migration for the delta sync change log
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_roster_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.UUIDField()),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'change_log',
+                'indexes': [models.Index(fields=['user', 'seq'], name='change_log_user_seq')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated migration for the doctor shard directory
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorShard',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='core.doctor')),
+                ('alias', models.CharField(max_length=50)),
+                ('moving_to', models.CharField(blank=True, help_text='Target shard while rebalance_shards moves the doctor', max_length=50, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'doctor_shards',
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated migration adding composite indexes for the hot read endpoints (see manage.py explain_hot_queries)
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_doctor_shards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['doctor', 'status', 'scheduled_at'], name='meetings_doctor_status_time'),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['patient', 'status', 'scheduled_at'], name='meetings_patient_status_time'),
+        ),
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(fields=['doctor', 'is_active'], name='surveys_doctor_active'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at'], name='notifications_user_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at'], name='notifications_user_unread'),
+        ),
+        migrations.AddIndex(
+            model_name='promsscore',
+            index=models.Index(fields=['doctor', 'patient', 'score_type', '-recorded_at'], name='proms_scores_latest'),
+        ),
+        # Leading with is_read serves "all unread for a user" as well as per-sender counts
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='chat_messages_unread',
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['receiver', 'is_read', 'sender'], name='chat_messages_unread'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['sender', 'receiver', 'created_at'], name='chat_messages_thread'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at'], name='posts_recent'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated migration making the clinical note cache key unique per meeting
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def clear_duplicate_cache_keys(apps, schema_editor):
+    """Keep one note per (meeting, content_hash) as the cache entry, preferring an edited one, then the oldest;
+    the other copies stay as plain notes"""
+    CallNote = apps.get_model('core', 'CallNote')
+    db = schema_editor.connection.alias
+    duplicates = (
+        CallNote.objects.using(db).filter(content_hash__isnull=False)
+        .values('meeting_id', 'content_hash').annotate(notes=Count('id')).filter(notes__gt=1)
+    )
+    for duplicate in duplicates:
+        notes = list(
+            CallNote.objects.using(db)
+            .filter(meeting_id=duplicate['meeting_id'], content_hash=duplicate['content_hash'])
+            .order_by('created_at')
+        )
+        kept = next((note for note in notes if note.is_edited), notes[0])
+        extra = [note for note in notes if note.id != kept.id]
+        CallNote.objects.using(db).filter(id=kept.id).update(cache_hits=F('cache_hits') + sum(note.cache_hits for note in extra))
+        CallNote.objects.using(db).filter(id__in=[note.id for note in extra]).update(content_hash=None, cache_hits=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_cache_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='callnote',
+            constraint=models.UniqueConstraint(condition=models.Q(('content_hash__isnull', False)), fields=('meeting', 'content_hash'), name='call_notes_meeting_content_hash'),
+        ),
+    ]
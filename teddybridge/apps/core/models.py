@@ -94,6 +94,19 @@ class DoctorPatientLink(models.Model):
     class Meta:
         db_table = 'doctor_patient_links'
         unique_together = ['doctor', 'patient']
+        indexes = [models.Index(fields=['doctor', '-linked_at'], name='patient_links_doctor_recent')]
+
+class TranscriptBlob(models.Model):
+    """Compressed, content-addressed text (transcripts, raw AI responses); see core/transcripts.py"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    codec = models.CharField(max_length=10)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(help_text='Uncompressed size in bytes')
+    compressed_size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'transcript_blobs'
 
 class Meeting(models.Model):
     STATUS_CHOICES = [
@@ -117,12 +130,21 @@ class Meeting(models.Model):
     meeting_url = models.URLField(blank=True, null=True)
     daily_room_url = models.URLField(blank=True, null=True)
     recording_url = models.URLField(blank=True, null=True)
+    recording_path = models.CharField(max_length=500, blank=True, null=True, help_text='Storage name of the persisted recording')
     transcript_url = models.URLField(blank=True, null=True)
-    transcript_text = models.TextField(blank=True, null=True)
+    transcript = models.ForeignKey(TranscriptBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    has_transcript = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         db_table = 'meetings'
+        indexes = [
+            # Last completed visit per (doctor, patient) for the patient roster
+            models.Index(fields=['doctor', 'patient', 'status', 'scheduled_at'], name='meetings_doctor_patient_visit'),
+            # Appointment lists and stats: one side, a status group, a date range
+            models.Index(fields=['doctor', 'status', 'scheduled_at'], name='meetings_doctor_status_time'),
+            models.Index(fields=['patient', 'status', 'scheduled_at'], name='meetings_patient_status_time'),
+        ]
 
 class RecordingConsent(models.Model):
     CONSENT_CHOICES = [
@@ -155,6 +177,10 @@ class CallNote(models.Model):
     urgent_flags = models.JSONField(blank=True, null=True)
     follow_up_questions = models.JSONField(blank=True, null=True)
     ai_metadata = models.JSONField(blank=True, null=True)
+    source_transcript = models.ForeignKey(TranscriptBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', help_text='Transcript as returned by the transcription service')
+    raw_response = models.ForeignKey(TranscriptBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', help_text='Unparsed AI response')
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True, help_text='sha256 of prompt version, model and transcript')
+    cache_hits = models.PositiveIntegerField(default=0)
     is_edited = models.BooleanField(default=False)
     edited_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='edited_notes')
     edited_at = models.DateTimeField(blank=True, null=True)
@@ -162,6 +188,24 @@ class CallNote(models.Model):
     
     class Meta:
         db_table = 'call_notes'
+        constraints = [
+            # One cached note per meeting and content address, however many identical requests race
+            models.UniqueConstraint(fields=['meeting', 'content_hash'], condition=models.Q(content_hash__isnull=False), name='call_notes_meeting_content_hash'),
+        ]
+
+class NoteSearchEntry(models.Model):
+    """Search document for a CallNote; the full-text index next to it is managed by core/note_search.py"""
+    call_note = models.OneToOneField(CallNote, on_delete=models.CASCADE, primary_key=True, related_name='search_entry')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='+')
+    meeting = models.ForeignKey(Meeting, on_delete=models.CASCADE, related_name='+')
+    patient_name = models.CharField(max_length=255, blank=True)
+    note_text = models.TextField(blank=True)
+    transcript_sha = models.CharField(max_length=64, blank=True, null=True, help_text='Transcript blob indexed with the note')
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'note_search_entries'
+        indexes = [models.Index(fields=['doctor', '-created_at'], name='note_search_doctor_recent')]
 
 class Survey(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -175,6 +219,8 @@ class Survey(models.Model):
     
     class Meta:
         db_table = 'surveys'
+        # Open surveys of a patient's doctors
+        indexes = [models.Index(fields=['doctor', 'is_active'], name='surveys_doctor_active')]
 
 class SurveyResponse(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -206,6 +252,40 @@ class Notification(models.Model):
     class Meta:
         db_table = 'notifications'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='notifications_user_recent'),
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notifications_user_unread'),
+        ]
+
+class ChangeLogEntry(models.Model):
+    """Append-only delta sync log: one row per write per user who can see the record; see core/sync.py"""
+    ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+    
+    seq = models.BigAutoField(primary_key=True)
+    # No constraint: rows are written after commit and may outlive the user; compaction removes them
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    kind = models.CharField(max_length=20)
+    object_id = models.UUIDField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'change_log'
+        indexes = [models.Index(fields=['user', 'seq'], name='change_log_user_seq')]
+
+class DoctorShard(models.Model):
+    """Directory entry: the database alias holding a doctor's clinical rows; see core/sharding.py"""
+    doctor = models.OneToOneField(Doctor, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    alias = models.CharField(max_length=50)
+    moving_to = models.CharField(max_length=50, blank=True, null=True, help_text='Target shard while rebalance_shards moves the doctor')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'doctor_shards'
 
 class PromsScore(models.Model):
     SCORE_TYPE_CHOICES = [
@@ -225,6 +305,8 @@ class PromsScore(models.Model):
     class Meta:
         db_table = 'proms_scores'
         ordering = ['-recorded_at']
+        # Latest score per (patient, type) for a doctor's panel, and one patient's history
+        indexes = [models.Index(fields=['doctor', 'patient', 'score_type', '-recorded_at'], name='proms_scores_latest')]
 
 class DoctorReview(models.Model):
     """Patient reviews and recommendations for doctors"""
@@ -288,6 +370,11 @@ class ChatMessage(models.Model):
     class Meta:
         db_table = 'chat_messages'
         ordering = ['created_at']
+        indexes = [
+            # Unread counts: all of a user's, or per sender
+            models.Index(fields=['receiver', 'is_read', 'sender'], name='chat_messages_unread'),
+            models.Index(fields=['sender', 'receiver', 'created_at'], name='chat_messages_thread'),
+        ]
 
 class PeerMeeting(models.Model):
     """Meetings between peers (patient-patient or doctor-doctor)"""
@@ -325,6 +412,7 @@ class Post(models.Model):
     class Meta:
         db_table = 'posts'
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['-created_at'], name='posts_recent')]
 
 class PostLike(models.Model):
     """Likes on posts"""
@@ -348,3 +436,37 @@ class PostComment(models.Model):
     class Meta:
         db_table = 'post_comments'
         ordering = ['created_at']
+
+class TeddyConversation(models.Model):
+    """Server-side Teddy AI chat session; older turns are rolled into a running summary"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='teddy_conversations')
+    summary = models.TextField(blank=True, default='')
+    summary_tokens = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'teddy_conversations'
+        ordering = ['-updated_at']
+
+class TeddyMessage(models.Model):
+    """A single turn in a Teddy AI conversation"""
+    ROLE_CHOICES = [
+        ('user', 'User'),
+        ('assistant', 'Assistant'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    conversation = models.ForeignKey(TeddyConversation, on_delete=models.CASCADE, related_name='messages')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    content = models.TextField()
+    token_count = models.IntegerField(default=0)
+    summarized = models.BooleanField(default=False, help_text='Rolled into the conversation summary')
+    prompt_tokens = models.IntegerField(blank=True, null=True, help_text='Prompt size of the request that produced this reply')
+    completion_tokens = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'teddy_messages'
+        ordering = ['created_at']
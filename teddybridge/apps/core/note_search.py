@@ -0,0 +1,322 @@
+"""
+Full-text search over clinical notes and their meeting transcripts.
+
+Every CallNote has a NoteSearchEntry row holding the doctor, the patient
+name, the note text and which transcript was indexed. The index next to it
+depends on the database:
+- PostgreSQL: a weighted tsvector column on note_search_entries with a GIN
+  index, ranked with ts_rank_cd. Transcripts are kept only in vector form;
+  the text stays compressed in transcript_blobs.
+- SQLite: an FTS5 table (note_search_fts) with the porter stemmer, ranked
+  with bm25. Its rowid is the entry's rowid.
+- Anything else, or SQLite without FTS5: every term must appear in the
+  patient name or note text (transcripts aren't searched), newest first.
+
+Entries are written by the CallNote and Meeting post_save signals.
+Creating or editing a note, or attaching a transcript to its meeting,
+reindexes just that note. `manage.py rebuild_note_search` recreates the
+index from scratch. On SQLite, run it after any migration that rebuilds
+note_search_entries, because that changes the rowids.
+
+Snippets are built in Python, only for the page of results returned. They
+are HTML-escaped, with the matches wrapped in <mark>.
+"""
+import base64
+import binascii
+import json
+import logging
+import re
+import uuid
+from django.db import connection, connections, models, router, transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+from .models import CallNote, NoteSearchEntry
+from .transcripts import get_meeting_transcript
+
+logger = logging.getLogger(__name__)
+
+NOTE_FIELDS = (
+    'chief_complaint', 'hpi', 'past_medical_history', 'medications', 'allergies',
+    'exam_observations', 'assessment', 'plan',
+)
+MAX_QUERY_TERMS = 8
+SNIPPET_CHARS = 200
+
+_backends = {}
+
+
+def search_backend(conn=None):
+    """'postgres', 'fts5' or 'basic' for the given connection"""
+    conn = conn or connection
+    if conn.alias not in _backends:
+        if conn.vendor == 'postgresql':
+            _backends[conn.alias] = 'postgres'
+        elif conn.vendor == 'sqlite' and 'note_search_fts' in conn.introspection.table_names():
+            _backends[conn.alias] = 'fts5'
+        else:
+            _backends[conn.alias] = 'basic'
+    return _backends[conn.alias]
+
+
+def install_search_index(conn):
+    """Create the database-specific index (idempotent); returns False when only basic search is available"""
+    _backends.pop(conn.alias, None)
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute("ALTER TABLE note_search_entries ADD COLUMN IF NOT EXISTS search_vector tsvector")
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS note_search_entries_vector_gin ON note_search_entries USING gin (search_vector)"
+            )
+            return True
+        if conn.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS note_search_fts "
+                    "USING fts5(patient_name, note_text, transcript, tokenize='porter unicode61')"
+                )
+            except Exception as e:
+                logger.warning(f"FTS5 unavailable, note search falls back to substring matching: {str(e)}")
+                return False
+            cursor.execute(
+                "CREATE TRIGGER IF NOT EXISTS note_search_entries_ad AFTER DELETE ON note_search_entries "
+                "BEGIN DELETE FROM note_search_fts WHERE rowid = old.rowid; END"
+            )
+            return True
+    return False
+
+
+def drop_search_index(conn):
+    _backends.pop(conn.alias, None)
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS note_search_entries_vector_gin")
+            cursor.execute("ALTER TABLE note_search_entries DROP COLUMN IF EXISTS search_vector")
+        elif conn.vendor == 'sqlite':
+            cursor.execute("DROP TRIGGER IF EXISTS note_search_entries_ad")
+            cursor.execute("DROP TABLE IF EXISTS note_search_fts")
+
+
+def note_text(note):
+    parts = [getattr(note, field) for field in NOTE_FIELDS]
+    parts += list(note.urgent_flags or []) + list(note.follow_up_questions or [])
+    return '\n'.join(str(part) for part in parts if part)
+
+
+def _db_uuid(value):
+    return models.UUIDField().get_db_prep_value(value, connection)
+
+
+def index_note(note):
+    """Write the search entry and index for one note"""
+    meeting = note.meeting
+    patient_name = meeting.patient.user.name if meeting.patient else ''
+    text = note_text(note)
+    entry, _ = NoteSearchEntry.objects.update_or_create(call_note_id=note.id, defaults={
+        'doctor_id': meeting.doctor_id,
+        'meeting_id': meeting.id,
+        'patient_name': patient_name,
+        'note_text': text,
+        'transcript_sha': meeting.transcript_id,
+        'created_at': note.created_at,
+    })
+
+    # The index sits next to the entry, on whichever database (shard) that went to
+    conn = connections[entry._state.db]
+    backend = search_backend(conn)
+    if backend == 'basic':
+        return entry
+    transcript = get_meeting_transcript(meeting) or ''
+    note_id = _db_uuid(note.id)
+    with conn.cursor() as cursor:
+        if backend == 'postgres':
+            cursor.execute(
+                "UPDATE note_search_entries SET search_vector = "
+                "setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'C') "
+                "WHERE call_note_id = %s",
+                [patient_name, text, transcript, note_id],
+            )
+        else:
+            cursor.execute(
+                "DELETE FROM note_search_fts WHERE rowid = (SELECT rowid FROM note_search_entries WHERE call_note_id = %s)",
+                [note_id],
+            )
+            cursor.execute(
+                "INSERT INTO note_search_fts (rowid, patient_name, note_text, transcript) "
+                "SELECT rowid, %s, %s, %s FROM note_search_entries WHERE call_note_id = %s",
+                [patient_name, text, transcript, note_id],
+            )
+    return entry
+
+
+def safe_index_note(note):
+    """index_note for signal handlers: a search index failure never fails the write that triggered it"""
+    try:
+        with transaction.atomic():
+            index_note(note)
+    except Exception as e:
+        logger.error(f"Failed to index note {note.id} for search: {str(e)}")
+
+
+def reindex_meeting_notes(meeting):
+    """Reindex the meeting's notes whose indexed transcript is no longer the meeting's"""
+    stale = NoteSearchEntry.objects.filter(meeting_id=meeting.id).exclude(transcript_sha=meeting.transcript_id)
+    note_ids = list(stale.values_list('call_note_id', flat=True))
+    if not note_ids:
+        return
+    for note in CallNote.objects.filter(id__in=note_ids).select_related('meeting__patient__user', 'meeting__transcript'):
+        safe_index_note(note)
+
+
+def query_terms(query):
+    return [term.lower() for term in re.findall(r'\w+', query or '')][:MAX_QUERY_TERMS]
+
+
+def encode_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, backend):
+    """Validated cursor payload: {'s': score, 'id'} for ranked backends, {'t': created_at, 'id'} for basic search"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        after = {'id': uuid.UUID(payload['id'])}
+        if backend == 'basic':
+            after['t'] = parse_datetime(payload['t'])
+            if after['t'] is None:
+                raise ValueError
+        else:
+            after['s'] = float(payload['s'])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise ValueError('Invalid cursor')
+    return after
+
+
+def _ranked_ids(doctor, query, limit, after):
+    """[(note_id, score)] best first, from the Postgres or FTS5 index"""
+    # Raw SQL bypasses the database routers; ask them so searches run on a replica or the doctor's shard
+    conn = connections[router.db_for_read(NoteSearchEntry)]
+    params = []
+    if search_backend(conn) == 'postgres':
+        ranked = (
+            "SELECT e.call_note_id, ts_rank_cd(e.search_vector, query)::float8 AS score "
+            "FROM note_search_entries e, websearch_to_tsquery('english', %s) query "
+            "WHERE e.doctor_id = %s AND e.search_vector @@ query"
+        )
+        params += [query, _db_uuid(doctor.id)]
+    else:
+        # Quoted terms: FTS5 operators in user input are treated as text
+        ranked = (
+            "SELECT e.call_note_id AS call_note_id, -bm25(note_search_fts, 10.0, 4.0, 1.0) AS score "
+            "FROM note_search_fts JOIN note_search_entries e ON e.rowid = note_search_fts.rowid "
+            "WHERE note_search_fts MATCH %s AND e.doctor_id = %s"
+        )
+        params += [' '.join(f'"{term}"' for term in query_terms(query)), _db_uuid(doctor.id)]
+
+    sql = f"SELECT call_note_id, score FROM ({ranked}) ranked"
+    if after:
+        sql += " WHERE score < %s OR (score = %s AND call_note_id > %s)"
+        params += [after['s'], after['s'], _db_uuid(after['id'])]
+    sql += " ORDER BY score DESC, call_note_id LIMIT %s"
+    params.append(limit)
+
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(models.UUIDField().to_python(note_id), score) for note_id, score in cursor.fetchall()]
+
+
+def _basic_ids(doctor, query, limit, after):
+    entries = NoteSearchEntry.objects.filter(doctor=doctor)
+    for term in query_terms(query):
+        entries = entries.filter(Q(note_text__icontains=term) | Q(patient_name__icontains=term))
+    if after:
+        entries = entries.filter(
+            Q(created_at__lt=after['t']) | Q(created_at=after['t'], call_note_id__lt=after['id'])
+        )
+    entries = entries.order_by('-created_at', '-call_note_id').values_list('call_note_id', 'created_at')[:limit]
+    return [(note_id, created_at) for note_id, created_at in entries]
+
+
+def _match_pattern(terms):
+    # Stemmed index matches "diabetic" for "diabetes"; cutting long terms back approximates that for highlighting
+    stems = [term[:max(4, len(term) - 3)] if len(term) > 5 else term for term in terms]
+    return re.compile(r'\b(?:' + '|'.join(re.escape(stem) for stem in stems) + r')\w*', re.IGNORECASE)
+
+
+def highlight(text, terms, width=SNIPPET_CHARS):
+    """HTML snippet of text around the first match with every match in <mark>, or None if nothing matches"""
+    if not text or not terms:
+        return None
+    pattern = _match_pattern(terms)
+    first = pattern.search(text)
+    if not first:
+        return None
+    start = max(0, first.start() - width // 3)
+    end = min(len(text), start + width)
+    excerpt = text[start:end]
+
+    parts = ['…' if start else '']
+    position = 0
+    for match in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[position:match.start()]))
+        parts.append(f'<mark>{escape(match.group())}</mark>')
+        position = match.end()
+    parts.append(escape(excerpt[position:]))
+    parts.append('…' if end < len(text) else '')
+    return ''.join(parts)
+
+
+def note_snippet(note, terms):
+    """Highlighted excerpt from the note, or from the transcript when the match is only there"""
+    text = note_text(note)
+    snippet = highlight(text, terms)
+    if snippet is None:
+        snippet = highlight(get_meeting_transcript(note.meeting), terms)
+        if snippet is not None:
+            return snippet, 'transcript'
+        return escape(text[:SNIPPET_CHARS]), 'note'
+    return snippet, 'note'
+
+
+def search_notes(doctor, query, limit=20, cursor=None):
+    """
+    One page of the doctor's notes matching query, best match first.
+
+    Returns (notes, next_cursor). Each note has .search_rank, .snippet and
+    .snippet_source set. Raises ValueError for an unusable cursor.
+    """
+    backend = search_backend(connections[router.db_for_read(NoteSearchEntry)])
+    after = decode_cursor(cursor, backend) if cursor else None
+    if not query_terms(query):
+        return [], None
+    if backend == 'basic':
+        rows = _basic_ids(doctor, query, limit + 1, after)
+    else:
+        rows = _ranked_ids(doctor, query, limit + 1, after)
+
+    page, more = rows[:limit], len(rows) > limit
+    notes = CallNote.objects.filter(id__in=[note_id for note_id, _ in page]).select_related(
+        'meeting__patient__user', 'meeting__transcript'
+    ).defer('ai_metadata', 'content_hash')
+    by_id = {note.id: note for note in notes}
+
+    terms = query_terms(query)
+    results = []
+    for note_id, sort_value in page:
+        note = by_id.get(note_id)
+        if note is None:
+            continue
+        note.search_rank = sort_value if backend != 'basic' else None
+        note.snippet, note.snippet_source = note_snippet(note, terms)
+        results.append(note)
+
+    next_cursor = None
+    if more and page:
+        last_id, last_value = page[-1]
+        if backend == 'basic':
+            next_cursor = encode_cursor({'t': last_value.isoformat(), 'id': str(last_id)})
+        else:
+            next_cursor = encode_cursor({'s': last_value, 'id': str(last_id)})
+    return results, next_cursor
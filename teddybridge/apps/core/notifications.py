@@ -9,3 +9,51 @@ def create_notification(user, notification_type, title, message, link=None):
         message=message,
         link=link
     )
+
+
+def serialize_notification(n):
+    return {
+        'id': str(n.id),
+        'type': n.type,
+        'title': n.title,
+        'message': n.message,
+        'link': n.link,
+        'isRead': n.is_read,
+        'createdAt': n.created_at.isoformat(),
+    }
+
+
+def notification_feed(user, limit=20):
+    """The user's latest notifications and unread count, as returned by /api/user/notifications/list"""
+    notifications = Notification.objects.filter(user=user)[:limit]
+    unread_count = Notification.objects.filter(user=user, is_read=False).count()
+    
+    # Fix old notification links that point to /peer-network incorrectly
+    # For "New Message" notifications, set correct link based on user role
+    result_notifications = []
+    for n in notifications:
+        notification_link = n.link
+        
+        # Fix old "New Message" notifications that incorrectly link to /peer-network
+        # This handles notifications created before the fix was implemented
+        if (n.type == 'general' and 
+            n.title == 'New Message' and 
+            notification_link == '/peer-network' and
+            user.role in ['patient', 'doctor']):
+            # Determine correct link based on user's role
+            if user.role == 'patient':
+                notification_link = '/patient/doctors'
+            elif user.role == 'doctor':
+                notification_link = '/doctor/patients'
+            
+            # Update the database record to fix it permanently
+            if notification_link != n.link:
+                n.link = notification_link
+                n.save(update_fields=['link'])
+        
+        result_notifications.append(serialize_notification(n))
+    
+    return {
+        'notifications': result_notifications,
+        'unreadCount': unread_count,
+    }
@@ -4,7 +4,11 @@ from rest_framework.response import Response
 from django.db.models import Q
 from django.utils import timezone
 from .models import User, PeerConnection, ChatMessage, PeerMeeting, Post, PostLike, PostComment
+from .avatars import avatar_variant
 from .notifications import create_notification
+from .sharding import doctor_shard_alias
+from .sync import record_changes
+from .versions import bump, conditional_get
 
 @api_view(['GET'])
 def search_peers(request):
@@ -38,7 +42,7 @@ def search_peers(request):
             'id': str(user.id),
             'name': user.name,
             'email': user.email,
-            'avatar': user.avatar_url,
+            'avatar': avatar_variant(user.avatar_url, 48),
             'role': user.role,
         }
         
@@ -79,7 +83,7 @@ def get_chat_conversations(request):
         conversations.append({
             'peerId': str(peer.id),
             'peerName': peer.name,
-            'peerAvatar': peer.avatar_url,
+            'peerAvatar': avatar_variant(peer.avatar_url, 48),
             'lastMessage': last_message.message if last_message else '',
             'lastMessageTime': last_message.created_at if last_message else None,
             'unreadCount': unread_count,
@@ -112,7 +116,13 @@ def get_chat_messages(request, peer_id):
     ).order_by('created_at')
     
     # Mark messages as read
-    ChatMessage.objects.filter(sender=peer, receiver=request.user, is_read=False).update(is_read=True)
+    unread = ChatMessage.objects.filter(sender=peer, receiver=request.user, is_read=False)
+    unread_ids = list(unread.values_list('id', flat=True))
+    if unread_ids:
+        unread.update(is_read=True)
+        bump('patients', request.user.id)
+        bump('doctors', request.user.id)
+        record_changes('messages', unread_ids, [peer.id, request.user.id])
     
     return Response([{
         'id': str(msg.id),
@@ -348,7 +358,8 @@ def start_peer_meeting(request, meeting_id):
         
         # Check if meeting already exists for this peer meeting
         try:
-            existing_meeting = Meeting.objects.filter(
+            # The requester may be the participant, whose data can be on another shard
+            existing_meeting = Meeting.objects.using(doctor_shard_alias(organizer_doctor.id)).filter(
                 doctor__user=peer_meeting.organizer,
                 patient=None,
                 title=peer_meeting.title
@@ -370,7 +381,7 @@ def start_peer_meeting(request, meeting_id):
         
         # Create Meeting record (doctor-doctor: use organizer as doctor, patient=None)
         try:
-            meeting = Meeting.objects.create(
+            meeting = Meeting.objects.using(doctor_shard_alias(organizer_doctor.id)).create(
                 doctor=organizer_doctor,
                 patient=None,  # No patient for doctor-doctor meetings
                 title=peer_meeting.title,
@@ -430,6 +441,7 @@ def delete_peer_meeting(request, meeting_id):
         return Response({'error': 'Meeting not found'}, status=status.HTTP_404_NOT_FOUND)
 
 @api_view(['GET'])
+@conditional_get('feed')
 def get_feed(request):
     """Get social feed posts"""
     if not request.user.is_authenticated:
@@ -447,7 +459,7 @@ def get_feed(request):
             'id': str(post.id),
             'authorId': str(post.author.id),
             'authorName': post.author.name,
-            'authorAvatar': post.author.avatar_url,
+            'authorAvatar': avatar_variant(post.author.avatar_url, 48),
             'content': post.content,
             'imageUrl': post.image_url,
             'likesCount': likes_count,
@@ -515,7 +527,7 @@ def post_comments(request, post_id):
             'id': str(c.id),
             'authorId': str(c.author.id),
             'authorName': c.author.name,
-            'authorAvatar': c.author.avatar_url,
+            'authorAvatar': avatar_variant(c.author.avatar_url, 48),
             'content': c.content,
             'createdAt': c.created_at.isoformat(),
         } for c in comments])
@@ -0,0 +1,539 @@
+"""
+Per-doctor sharding of clinical data.
+
+When DATABASE_SHARD_URLS is set (see settings.py), each URL becomes a
+shard alias ('shard1', 'shard2', ...) next to 'default', which stays a
+shard too. Every doctor's clinical rows (SHARDED_MODELS: patient links,
+surveys and responses, meetings with their consents, notes, search entries
+and transcripts, PROMs scores, reviews) live together on one shard.
+
+- Placement: a consistent-hash ring over the aliases picks a new doctor's
+  shard, and the DoctorShard directory table (on 'default') records it.
+  The directory is the source of truth; doctors without an entry predate
+  sharding and live on 'default'. Adding a shard moves only the doctors
+  the ring now places on it.
+- Reference rows (users, doctors, patients) are written on 'default' and
+  mirrored to every shard (signals.py), so joins and foreign keys work
+  inside a shard. Everything else (chat, feed, notifications, ...) lives
+  on 'default' only.
+- Routing: ShardRouter sends sharded models to the shard of the doctor an
+  instance belongs to, when the query has one, and otherwise to the
+  current request's shard. ShardRoutingMiddleware sets that from the user:
+  a doctor's own shard, or the shards of a patient's doctors.
+- Cross-shard reads (a patient whose doctors are on several shards) go
+  through scatter(), which runs a function once per shard in parallel, or
+  locate(), which finds a record by id on whichever shard has it and pins
+  the request there.
+- `manage.py rebalance_shards` moves doctors online (see move_doctor).
+
+Directory lookups are cached for DIRECTORY_CACHE_SECONDS. Without a
+shared cache (REDIS_URL), keep SHARD_MOVE_GRACE_SECONDS above that, so
+other workers see a move before it completes.
+
+Without DATABASE_SHARD_URLS, every helper here is a no-op and all data
+stays on 'default'.
+"""
+import bisect
+import functools
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.db.models.constants import OnConflict
+from django.http import JsonResponse
+from .db_routing import SAFE_METHODS
+from .models import (
+    CallNote, Doctor, DoctorPatientLink, DoctorReview, DoctorShard, Meeting, NoteSearchEntry, Patient, PromsScore,
+    RecordingConsent, Survey, SurveyResponse, TranscriptBlob, User,
+)
+from .note_search import safe_index_note
+
+logger = logging.getLogger(__name__)
+
+RING_POINTS = 64  # Virtual nodes per shard
+DIRECTORY_CACHE_SECONDS = 60
+DOCTOR_SHARD_CACHE_KEY = 'doctor-shard:{doctor_id}'
+USER_SHARDS_CACHE_KEY = 'user-shards:{user_id}'
+
+REFERENCE_MODELS = (User, Doctor, Patient)
+# In copy order: rows before the rows that reference them
+SHARDED_MODELS = (
+    TranscriptBlob, DoctorPatientLink, Survey, Meeting, RecordingConsent, CallNote, NoteSearchEntry, SurveyResponse,
+    PromsScore, DoctorReview,
+)
+# How each model's rows are found by doctor (transcripts are found through meetings and notes)
+DOCTOR_LOOKUPS = {
+    DoctorPatientLink: 'doctor_id',
+    Survey: 'doctor_id',
+    Meeting: 'doctor_id',
+    RecordingConsent: 'meeting__doctor_id',
+    CallNote: 'meeting__doctor_id',
+    NoteSearchEntry: 'doctor_id',
+    SurveyResponse: 'survey__doctor_id',
+    PromsScore: 'doctor_id',
+    DoctorReview: 'doctor_id',
+}
+
+
+class ShardMoving(Exception):
+    """A write for a doctor whose data rebalance_shards is moving right now"""
+
+
+def sharding_enabled():
+    return bool(settings.SHARD_DATABASES)
+
+
+def shard_aliases():
+    return list(settings.SHARD_DATABASES) or [DEFAULT_DB_ALIAS]
+
+
+# --- Placement ---
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing: adding an alias only moves the keys that now land on it"""
+
+    def __init__(self, aliases, points=RING_POINTS):
+        self._ring = sorted((_hash(f'{alias}#{point}'), alias) for alias in aliases for point in range(points))
+        self._hashes = [point for point, _ in self._ring]
+
+    def place(self, key):
+        index = bisect.bisect(self._hashes, _hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+
+@functools.lru_cache(maxsize=4)
+def _ring(aliases):
+    return HashRing(aliases)
+
+
+def ring_shard(doctor_id):
+    """The shard the ring assigns to a doctor"""
+    return _ring(tuple(shard_aliases())).place(doctor_id)
+
+
+def place_doctor(doctor_id):
+    """Record a new doctor's shard in the directory (existing entries are kept)"""
+    DoctorShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(doctor_id=doctor_id, defaults={'alias': ring_shard(doctor_id)})
+    cache.delete(DOCTOR_SHARD_CACHE_KEY.format(doctor_id=doctor_id))
+
+
+def doctor_entry(doctor_id):
+    """(alias, moving_to) for a doctor"""
+    key = DOCTOR_SHARD_CACHE_KEY.format(doctor_id=doctor_id)
+    entry = cache.get(key)
+    if entry is None:
+        row = DoctorShard.objects.using(DEFAULT_DB_ALIAS).filter(doctor_id=doctor_id).values_list('alias', 'moving_to').first()
+        entry = tuple(row) if row else (DEFAULT_DB_ALIAS, None)  # Doctors from before sharding live on 'default'
+        cache.set(key, entry, DIRECTORY_CACHE_SECONDS)
+    return entry
+
+
+def doctor_shard_alias(doctor_id):
+    """The database alias holding a doctor's clinical rows"""
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    return doctor_entry(doctor_id)[0]
+
+
+def user_shards(user):
+    """{'aliases': [...], 'moving': bool}: the shards a user's requests read from"""
+    if not user.is_authenticated:
+        return {'aliases': [DEFAULT_DB_ALIAS], 'moving': False}
+    key = USER_SHARDS_CACHE_KEY.format(user_id=user.id)
+    placement = cache.get(key)
+    if placement is None:
+        placement = _user_placement(user)
+        cache.set(key, placement, DIRECTORY_CACHE_SECONDS)
+    return placement
+
+
+def _user_placement(user):
+    if user.role == 'doctor':
+        doctor_id = Doctor.objects.filter(user=user).values_list('id', flat=True).first()
+        if doctor_id:
+            alias, moving_to = doctor_entry(doctor_id)
+            return {'aliases': [alias], 'moving': bool(moving_to)}
+    elif user.role == 'patient':
+        patient_id = Patient.objects.filter(user=user).values_list('id', flat=True).first()
+        if patient_id:
+            # Links live with the doctor, so the patient's shards are those holding one of their links
+            aliases = [
+                alias for alias in shard_aliases()
+                if DoctorPatientLink._base_manager.using(alias).filter(patient_id=patient_id).exists()
+            ]
+            if aliases:
+                return {'aliases': aliases, 'moving': False}
+    return {'aliases': [DEFAULT_DB_ALIAS], 'moving': False}
+
+
+def forget_user_shards(*user_ids):
+    keys = [USER_SHARDS_CACHE_KEY.format(user_id=user_id) for user_id in user_ids if user_id]
+    if keys and sharding_enabled():
+        cache.delete_many(keys)
+
+
+# --- Request context ---
+
+class _Shards:
+    __slots__ = ('aliases',)
+
+    def __init__(self, aliases):
+        self.aliases = list(aliases)
+
+    @property
+    def alias(self):
+        return self.aliases[0]
+
+    def pin(self, alias):
+        if alias in self.aliases:
+            self.aliases.remove(alias)
+        self.aliases.insert(0, alias)
+
+
+_shards = ContextVar('db_shards', default=None)
+
+
+def current_shards():
+    context = _shards.get()
+    return list(context.aliases) if context else [DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def use_shard(alias):
+    """Send sharded queries in this block to one alias"""
+    token = _shards.set(_Shards([alias]))
+    try:
+        yield
+    finally:
+        _shards.reset(token)
+
+
+def doctor_shard(doctor_id):
+    """use_shard() for a doctor's shard, e.g. a patient view about one of their doctors"""
+    return use_shard(doctor_shard_alias(doctor_id))
+
+
+_scatter_lock = threading.Lock()
+_scatter_executor = None
+
+
+def _executor():
+    global _scatter_executor
+    with _scatter_lock:
+        if _scatter_executor is None:
+            _scatter_executor = ThreadPoolExecutor(max_workers=len(shard_aliases()), thread_name_prefix='shard-scatter')
+    return _scatter_executor
+
+
+def _run_on(alias, fn):
+    try:
+        with use_shard(alias):
+            return fn()
+    finally:
+        connections.close_all()  # Only this worker thread's connections
+
+
+def scatter(fn, aliases=None):
+    """
+    [fn() on each shard], for the current request's shards by default.
+
+    Shards are queried in parallel; with one shard (or sharding off) fn
+    runs inline. Callers merge the results.
+    """
+    if not sharding_enabled():
+        return [fn()]
+    aliases = current_shards() if aliases is None else list(aliases)
+    if len(aliases) == 1:
+        with use_shard(aliases[0]):
+            return [fn()]
+    futures = [_executor().submit(copy_context().run, _run_on, alias, fn) for alias in aliases]
+    return [future.result() for future in futures]
+
+
+def locate(queryset, **lookup):
+    """
+    queryset.get(**lookup) on whichever shard has the row: the request's shards first, then the rest.
+
+    Pins the current request to that shard, so its other queries about the
+    record go there too. Raises the model's DoesNotExist like get().
+    """
+    if not sharding_enabled():
+        return queryset.get(**lookup)
+    context = _shards.get()
+    preferred = current_shards()
+    for alias in preferred + [alias for alias in shard_aliases() if alias not in preferred]:
+        try:
+            obj = queryset.using(alias).get(**lookup)
+        except queryset.model.DoesNotExist:
+            continue
+        if context is not None:
+            context.pin(alias)
+        return obj
+    raise queryset.model.DoesNotExist(f'{queryset.model.__name__} matching query does not exist.')
+
+
+# --- Router and middleware ---
+
+def _instance_shard(instance, for_write):
+    """The shard an instance hint belongs to, or None"""
+    doctor_id = instance.pk if isinstance(instance, Doctor) else getattr(instance, 'doctor_id', None)
+    if doctor_id:
+        alias, moving_to = doctor_entry(doctor_id)
+        if for_write and moving_to:
+            raise ShardMoving('Doctor data is being moved to another database; retry in a few seconds')
+        return alias
+    if instance._meta.concrete_model in SHARDED_MODELS:
+        return instance._state.db  # Rows without a doctor column stay with their parent
+    return None
+
+
+class ShardRouter:
+    def _route(self, model, hints, for_write):
+        if model._meta.concrete_model not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        alias = _instance_shard(instance, for_write) if instance is not None else None
+        return alias or current_shards()[0]
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints, False)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints, True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Reference rows exist on every shard
+        if obj1._meta.concrete_model in REFERENCE_MODELS or obj2._meta.concrete_model in REFERENCE_MODELS:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Every shard has the full schema; only reference and sharded tables hold rows
+        if db in settings.SHARD_DATABASES:
+            return True
+        return None
+
+
+def _moving_response():
+    response = JsonResponse({'error': 'Your data is being moved to another database; retry in a few seconds'}, status=503)
+    response['Retry-After'] = '5'
+    return response
+
+
+class ShardRoutingMiddleware:
+    """
+    Route a request's sharded queries to the user's shards.
+
+    Goes after AuthenticationMiddleware. Writes by a doctor whose data is
+    being moved are answered 503 with Retry-After. Runs natively under
+    ASGI too, so async views are not pushed into a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not sharding_enabled():
+            return self.get_response(request)
+        placement = user_shards(request.user)
+        if placement['moving'] and request.method not in SAFE_METHODS:
+            return _moving_response()
+        token = _shards.set(_Shards(placement['aliases']))
+        try:
+            return self.get_response(request)
+        finally:
+            _shards.reset(token)
+
+    async def __acall__(self, request):
+        if not sharding_enabled():
+            return await self.get_response(request)
+        # Loading the user and the directory hits the database and cache
+        placement = await sync_to_async(user_shards)(request.user)
+        if placement['moving'] and request.method not in SAFE_METHODS:
+            return _moving_response()
+        token = _shards.set(_Shards(placement['aliases']))
+        try:
+            return await self.get_response(request)
+        finally:
+            _shards.reset(token)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, ShardMoving):
+            return _moving_response()
+        return None
+
+
+# --- Copying rows between shards ---
+
+def _upsert(model, rows, alias):
+    """
+    Insert or overwrite rows on alias, as they are.
+
+    Raw inserts keep auto_now/auto_now_add values and send no signals:
+    the rows moved, they did not change.
+    """
+    if not rows:
+        return
+    fields = model._meta.local_concrete_fields
+    update_fields = [field for field in fields if not field.primary_key]
+    batch_size = max(connections[alias].ops.bulk_batch_size(fields, rows), 1)
+    for start in range(0, len(rows), batch_size):
+        model._base_manager._insert(
+            rows[start:start + batch_size], fields=fields, raw=True, using=alias,
+            on_conflict=OnConflict.UPDATE, update_fields=update_fields, unique_fields=[model._meta.pk],
+        )
+
+
+def _delete(model, alias, pks):
+    """Delete rows by primary key without cascades or signals (callers delete children first)"""
+    pks = list(pks)
+    batch_size = max(connections[alias].ops.bulk_batch_size([model._meta.pk], pks), 1)
+    for start in range(0, len(pks), batch_size):
+        queryset = model._base_manager.using(alias).filter(pk__in=pks[start:start + batch_size])
+        queryset._raw_delete(alias)
+
+
+def mirror_reference(instance):
+    """Copy a user, doctor or patient row saved on 'default' to every other shard"""
+    for alias in shard_aliases():
+        if alias != DEFAULT_DB_ALIAS:
+            _upsert(instance._meta.concrete_model, [instance], alias)
+
+
+def unmirror_reference(instance):
+    """Delete a reference row from every other shard, with the rows cascading from it there"""
+    for alias in shard_aliases():
+        if alias != DEFAULT_DB_ALIAS:
+            instance._meta.concrete_model._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def sync_reference_rows(aliases=None, batch_size=1000):
+    """Copy every reference row from 'default' to the given shards (e.g. after adding one); returns rows copied"""
+    copied = 0
+    for alias in aliases or [alias for alias in shard_aliases() if alias != DEFAULT_DB_ALIAS]:
+        for model in REFERENCE_MODELS:
+            rows = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) == batch_size:
+                    _upsert(model, batch, alias)
+                    copied += len(batch)
+                    batch = []
+            _upsert(model, batch, alias)
+            copied += len(batch)
+    return copied
+
+
+def _doctor_rows(model, doctor_id, alias):
+    manager = model._base_manager.using(alias)
+    if model is TranscriptBlob:
+        meetings = Meeting._base_manager.using(alias).filter(doctor_id=doctor_id)
+        notes = CallNote._base_manager.using(alias).filter(meeting__doctor_id=doctor_id)
+        return manager.filter(
+            Q(sha256__in=meetings.values('transcript_id')) |
+            Q(sha256__in=notes.values('source_transcript_id')) |
+            Q(sha256__in=notes.values('raw_response_id'))
+        )
+    return manager.filter(**{DOCTOR_LOOKUPS[model]: doctor_id})
+
+
+def _copy_doctor(doctor_id, source, target, prune=False):
+    """Upsert the doctor's rows from source onto target; with prune, drop target rows gone from source"""
+    copied, kept = 0, {}
+    for model in SHARDED_MODELS:
+        rows = list(_doctor_rows(model, doctor_id, source))
+        _upsert(model, rows, target)
+        copied += len(rows)
+        kept[model] = {row.pk for row in rows}
+    if prune:
+        # Transcripts are content-addressed and may be shared with other doctors on the target
+        for model in reversed(SHARDED_MODELS[1:]):
+            stale = set(_doctor_rows(model, doctor_id, target).values_list('pk', flat=True)) - kept[model]
+            _delete(model, target, stale)
+    return copied
+
+
+def _delete_doctor(doctor_id, alias):
+    """Remove the doctor's rows from a shard they moved away from"""
+    pks = {model: list(_doctor_rows(model, doctor_id, alias).values_list('pk', flat=True)) for model in SHARDED_MODELS}
+    for model in reversed(SHARDED_MODELS[1:]):
+        _delete(model, alias, pks[model])
+    blobs = set(pks[TranscriptBlob])
+    still_used = set(Meeting._base_manager.using(alias).filter(transcript_id__in=blobs).values_list('transcript_id', flat=True))
+    for column in ('source_transcript_id', 'raw_response_id'):
+        still_used |= set(CallNote._base_manager.using(alias).filter(**{f'{column}__in': blobs}).values_list(column, flat=True))
+    _delete(TranscriptBlob, alias, blobs - still_used)
+
+
+def _set_entry(doctor_id, alias, moving_to):
+    DoctorShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        doctor_id=doctor_id, defaults={'alias': alias, 'moving_to': moving_to},
+    )
+    cache.set(DOCTOR_SHARD_CACHE_KEY.format(doctor_id=doctor_id), (alias, moving_to), DIRECTORY_CACHE_SECONDS)
+    doctor_user_id = Doctor.objects.using(DEFAULT_DB_ALIAS).filter(id=doctor_id).values_list('user_id', flat=True).first()
+    patient_user_ids = DoctorPatientLink._base_manager.using(alias).filter(doctor_id=doctor_id).values_list(
+        'patient__user_id', flat=True,
+    )
+    forget_user_shards(doctor_user_id, *patient_user_ids)
+
+
+def move_doctor(doctor_id, target):
+    """
+    Move a doctor's clinical rows to target while the app keeps running; returns rows copied.
+
+    1. Copy the rows; reads and writes continue on the old shard.
+    2. Mark the doctor as moving: new writes are refused (503, retry) and
+       in-flight ones get SHARD_MOVE_GRACE_SECONDS to finish.
+    3. Copy again, dropping target rows deleted in the meantime.
+    4. Point the directory at the target and rebuild the doctor's note
+       search index there (the index is not a model field, so it is not
+       copied).
+    5. Wait out the grace period for readers still on the old entry, then
+       delete the old rows.
+    """
+    source = doctor_entry(doctor_id)[0]  # Also where an interrupted move resumes from
+    if source == target:
+        return 0
+
+    _copy_doctor(doctor_id, source, target)
+    _set_entry(doctor_id, source, target)
+    try:
+        time.sleep(settings.SHARD_MOVE_GRACE_SECONDS)
+        with transaction.atomic(using=target):
+            copied = _copy_doctor(doctor_id, source, target, prune=True)
+    except Exception:
+        _set_entry(doctor_id, source, None)
+        raise
+
+    _set_entry(doctor_id, target, None)
+    with use_shard(target):
+        notes = CallNote._base_manager.using(target).filter(meeting__doctor_id=doctor_id).select_related(
+            'meeting__patient__user', 'meeting__transcript',
+        )
+        for note in notes:
+            safe_index_note(note)
+
+    time.sleep(settings.SHARD_MOVE_GRACE_SECONDS)
+    with transaction.atomic(using=source):
+        _delete_doctor(doctor_id, source)
+    logger.info(f"Moved doctor {doctor_id} from {source} to {target} ({copied} rows)")
+    return copied
@@ -0,0 +1,195 @@
+"""
+Model signal handlers that keep derived/cached data in sync with writes
+"""
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import (
+    User, Doctor, Patient, DoctorPatientLink, DoctorReview, CallNote, Meeting, ChatMessage, Notification, Survey,
+    SurveyResponse, PromsScore, Post, PostLike, PostComment,
+)
+from .note_search import reindex_meeting_notes, safe_index_note
+from .sharding import (
+    doctor_shard_alias, forget_user_shards, mirror_reference, place_doctor, scatter, shard_aliases, sharding_enabled,
+    unmirror_reference,
+)
+from .sync import record_change
+from .teddy_context import invalidate_user_contexts
+from .versions import bump
+
+
+def _linked_patient_user_ids(doctor_id):
+    return list(
+        DoctorPatientLink.objects.using(doctor_shard_alias(doctor_id)).filter(doctor_id=doctor_id).values_list(
+            'patient__user_id', flat=True,
+        )
+    )
+
+
+def _linked_doctor_user_ids(patient_id):
+    # Links live on their doctor's shard, so a patient's can be on any of them
+    return [user_id for user_ids in scatter(lambda: list(
+        DoctorPatientLink.objects.filter(patient_id=patient_id).values_list('doctor__user_id', flat=True)
+    ), shard_aliases()) for user_id in user_ids]
+
+
+def _doctor_user_id(doctor_id):
+    return Doctor.objects.filter(id=doctor_id).values_list('user_id', flat=True).first()
+
+
+def _patient_user_id(patient_id):
+    return Patient.objects.filter(id=patient_id).values_list('user_id', flat=True).first()
+
+
+def _sync_action(kwargs):
+    if kwargs['signal'] is post_delete:
+        return 'delete'
+    return 'create' if kwargs.get('created') else 'update'
+
+
+@receiver([post_save, post_delete], sender=DoctorPatientLink)
+def link_changed(sender, instance, **kwargs):
+    patient_user_id = _patient_user_id(instance.patient_id)
+    doctor_user_id = _doctor_user_id(instance.doctor_id)
+    invalidate_user_contexts([patient_user_id, doctor_user_id])
+    forget_user_shards(patient_user_id)
+    bump('patients', doctor_user_id)
+    bump('doctors', patient_user_id)
+
+
+@receiver([post_save, post_delete], sender=DoctorReview)
+def review_changed(sender, instance, **kwargs):
+    # The doctor's own aggregate changes, and so does every linked patient's recommendation list
+    patient_user_ids = _linked_patient_user_ids(instance.doctor_id)
+    invalidate_user_contexts([_doctor_user_id(instance.doctor_id)] + patient_user_ids)
+    bump('doctors', *patient_user_ids)
+
+
+@receiver(post_save, sender=Doctor)
+def doctor_profile_changed(sender, instance, **kwargs):
+    patient_user_ids = _linked_patient_user_ids(instance.id)
+    invalidate_user_contexts([instance.user_id] + patient_user_ids)
+    bump('doctors', *patient_user_ids)
+
+
+@receiver(post_save, sender=Patient)
+def patient_profile_changed(sender, instance, **kwargs):
+    invalidate_user_contexts([instance.user_id])
+    bump('patients', *_linked_doctor_user_ids(instance.id))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # login() saves last_login on every sign-in; that never affects derived data
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    user_ids = [instance.id]
+    if instance.role == 'doctor':
+        doctor_id = Doctor.objects.filter(user_id=instance.id).values_list('id', flat=True).first()
+        if doctor_id:
+            patient_user_ids = _linked_patient_user_ids(doctor_id)
+            user_ids += patient_user_ids
+            bump('doctors', *patient_user_ids)
+    elif instance.role == 'patient':
+        patient_id = Patient.objects.filter(user_id=instance.id).values_list('id', flat=True).first()
+        if patient_id:
+            bump('patients', *_linked_doctor_user_ids(patient_id))
+    invalidate_user_contexts(user_ids)
+    # Names and avatars appear on feed posts
+    bump('feed', instance.role)
+
+
+@receiver(post_save, sender=CallNote)
+def call_note_saved(sender, instance, **kwargs):
+    # Cache hit counters are bumped with update(), so every save here is a content change
+    safe_index_note(instance)
+
+
+@receiver(post_save, sender=Meeting)
+def meeting_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and 'transcript' not in update_fields):
+        return
+    # One indexed query; notes are only reindexed when the transcript actually changed
+    reindex_meeting_notes(instance)
+
+
+@receiver([post_save, post_delete], sender=Meeting)
+def meeting_changed(sender, instance, **kwargs):
+    doctor_user_id = _doctor_user_id(instance.doctor_id)
+    patient_user_id = _patient_user_id(instance.patient_id) if instance.patient_id else None
+    # Last visit and appointment counts on both sides' lists
+    bump('patients', doctor_user_id)
+    bump('doctors', patient_user_id)
+    record_change('meetings', instance.id, [doctor_user_id, patient_user_id], _sync_action(kwargs))
+
+
+@receiver([post_save, post_delete], sender=CallNote)
+def call_note_changed(sender, instance, **kwargs):
+    doctor_user_id = Meeting.objects.using(instance._state.db).filter(id=instance.meeting_id).values_list('doctor__user_id', flat=True).first()
+    record_change('notes', instance.id, [doctor_user_id], _sync_action(kwargs))
+
+
+@receiver([post_save, post_delete], sender=ChatMessage)
+def chat_message_changed(sender, instance, **kwargs):
+    # Unread counts; marking a thread read uses update() and bumps in the view
+    bump('patients', instance.receiver_id)
+    bump('doctors', instance.receiver_id)
+    record_change('messages', instance.id, [instance.sender_id, instance.receiver_id], _sync_action(kwargs))
+
+
+@receiver([post_save, post_delete], sender=Notification)
+def notification_changed(sender, instance, **kwargs):
+    bump('notifications', instance.user_id)
+    record_change('notifications', instance.id, [instance.user_id], _sync_action(kwargs))
+
+
+@receiver([post_save, post_delete], sender=Survey)
+def survey_changed(sender, instance, **kwargs):
+    doctor_user_id = _doctor_user_id(instance.doctor_id)
+    bump('surveys', doctor_user_id)
+    # Every linked patient; the sync endpoint applies the assignment when it loads the survey
+    record_change('surveys', instance.id, [doctor_user_id] + _linked_patient_user_ids(instance.doctor_id), _sync_action(kwargs))
+
+
+@receiver([post_save, post_delete], sender=SurveyResponse)
+def survey_response_changed(sender, instance, **kwargs):
+    doctor_user_id = Survey.objects.using(instance._state.db).filter(id=instance.survey_id).values_list('doctor__user_id', flat=True).first()
+    bump('surveys', doctor_user_id)
+    record_change('surveyResponses', instance.id, [doctor_user_id, _patient_user_id(instance.patient_id)], _sync_action(kwargs))
+
+
+@receiver([post_save, post_delete], sender=PromsScore)
+def proms_score_changed(sender, instance, **kwargs):
+    bump('proms', _doctor_user_id(instance.doctor_id))
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    bump('feed', User.objects.filter(id=instance.author_id).values_list('role', flat=True).first())
+
+
+@receiver([post_save, post_delete], sender=PostLike)
+@receiver([post_save, post_delete], sender=PostComment)
+def post_activity_changed(sender, instance, **kwargs):
+    bump('feed', Post.objects.filter(id=instance.post_id).values_list('author__role', flat=True).first())
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Patient)
+def reference_row_saved(sender, instance, created, **kwargs):
+    # Reference rows are written on 'default'; the copies on the other shards come from here
+    if not sharding_enabled() or instance._state.db != DEFAULT_DB_ALIAS:
+        return
+    if created and sender is Doctor:
+        place_doctor(instance.id)
+    mirror_reference(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Patient)
+def reference_row_deleted(sender, instance, **kwargs):
+    if not sharding_enabled() or instance._state.db != DEFAULT_DB_ALIAS:
+        return
+    unmirror_reference(instance)
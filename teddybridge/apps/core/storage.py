@@ -0,0 +1,237 @@
+"""
+Media storage.
+
+Code saves and serves media through get_media_storage() instead of touching
+MEDIA_ROOT directly. LocalMediaStorage is the only backend today. Names
+from URLs go through public_media_name() before reaching any backend. The
+interface (save/open/exists/size/delete/serve) is what an object-store
+backend would implement too: its serve() would redirect to a presigned URL,
+which handles Range requests natively.
+
+Local files are served with ETag/If-None-Match, single-range Range/If-Range
+support and, when MEDIA_SENDFILE is set, X-Accel-Redirect or X-Sendfile
+headers. With those headers the front-end server copies the bytes and the
+Python worker never does.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import uuid
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+
+RANGE_CHUNK_SIZE = 64 * 1024
+# Top-level media directories anyone may fetch by URL; everything else (recordings) has its own endpoint
+PUBLIC_MEDIA_DIRS = ('avatars',)
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+_storage = None
+
+
+class MediaStorage:
+    """Interface for media backends; names are '/'-separated keys relative to the media root"""
+
+    def save(self, name, content):
+        """Store an iterable of byte chunks (or a Django File) under name; returns the name"""
+        raise NotImplementedError
+
+    def open(self, name):
+        raise NotImplementedError
+
+    def exists(self, name):
+        raise NotImplementedError
+
+    def size(self, name):
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def serve(self, request, name, content_type=None, cache_control='private, max-age=3600'):
+        """HTTP response for the stored file (Range and conditional requests included)"""
+        raise NotImplementedError
+
+
+class LocalMediaStorage(MediaStorage):
+    def __init__(self, root=None):
+        self._root = root
+
+    @property
+    def root(self):
+        return os.path.abspath(self._root or settings.MEDIA_ROOT)
+
+    def path(self, name):
+        path = os.path.abspath(os.path.join(self.root, name))
+        # Names come from URLs, never let them escape the media root
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid media name: {name}")
+        return path
+
+    def save(self, name, content):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        chunks = content.chunks() if hasattr(content, 'chunks') else content
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as destination:
+            for chunk in chunks:
+                destination.write(chunk)
+        os.replace(tmp_path, path)
+        return name
+
+    def open(self, name):
+        return open(self.path(name), 'rb')
+
+    def exists(self, name):
+        try:
+            return os.path.isfile(self.path(name))
+        except ValueError:
+            return False
+
+    def size(self, name):
+        return os.path.getsize(self.path(name))
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def serve(self, request, name, content_type=None, cache_control='private, max-age=3600'):
+        return file_response(request, self.path(name), content_type=content_type,
+                             cache_control=cache_control, accel_name=name)
+
+
+def public_media_name(name):
+    """
+    The normalized storage name if name points into a public media directory, else None.
+
+    Checked before any backend sees the name, so '..', '.' and encoded variants
+    cannot reach private files after a prefix check on the raw URL path.
+    """
+    if not name or '\\' in name or '\x00' in name or '..' in name.split('/'):
+        return None
+    normalized = posixpath.normpath(name)
+    parts = normalized.split('/')
+    if normalized.startswith('/') or len(parts) < 2 or parts[0] not in PUBLIC_MEDIA_DIRS:
+        return None
+    return normalized
+
+
+def get_media_storage():
+    """The configured storage backend (MEDIA_STORAGE_BACKEND), created once per process"""
+    global _storage
+    if _storage is None:
+        _storage = import_string(settings.MEDIA_STORAGE_BACKEND)()
+    return _storage
+
+
+def file_etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _parse_range(header, size):
+    """(start, end) inclusive for a single satisfiable byte range, None to send the whole file, False if unsatisfiable"""
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None  # Multi-range or malformed: serving the full file is always allowed
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request, path, content_type=None, cache_control=None, accel_name=None):
+    """
+    Serve a local file with ETag, Range and optional sendfile offload.
+
+    accel_name is the file's name under MEDIA_ACCEL_PREFIX (X-Accel-Redirect);
+    nginx then applies Range and conditional headers itself.
+    """
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Accept-Ranges'] = 'bytes'
+        if cache_control:
+            response['Cache-Control'] = cache_control
+        return response
+
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        return finish(HttpResponseNotModified())
+
+    sendfile = settings.MEDIA_SENDFILE
+    if sendfile == 'x-accel-redirect' and accel_name:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f"{settings.MEDIA_ACCEL_PREFIX.rstrip('/')}/{accel_name}"
+        return finish(response)
+    if sendfile == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return finish(response)
+
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    # A stale If-Range validator means the client's partial copy is outdated: send everything
+    if range_header and (not if_range or if_range == etag):
+        byte_range = _parse_range(range_header, stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{stat.st_size}"
+            return finish(response)
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(_iter_range(path, start, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+            return finish(response)
+
+    # Whole file: FileResponse lets the WSGI server use sendfile() via wsgi.file_wrapper
+    return finish(FileResponse(open(path, 'rb'), content_type=content_type))
+
+
+def recording_name(meeting_id, uploaded_file):
+    """Storage name for a meeting recording; the content hash keeps re-uploads from overwriting each other"""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    ext = os.path.splitext(uploaded_file.name or '')[1].lower() or '.webm'
+    if not re.match(r'^\.[a-z0-9]{1,5}$', ext):
+        ext = '.webm'
+    return f"recordings/{meeting_id}/{digest.hexdigest()[:16]}{ext}"
+
+
+def store_recording(meeting, uploaded_file):
+    """Persist an uploaded recording and point the meeting at it (the file is rewound for the caller)"""
+    name = get_media_storage().save(recording_name(meeting.id, uploaded_file), uploaded_file)
+    uploaded_file.seek(0)
+    meeting.recording_path = name
+    meeting.save(update_fields=['recording_path'])
+    return name
@@ -0,0 +1,259 @@
+"""
+Delta sync: "what changed since my last poll?" (GET /api/sync).
+
+Writes to the synced models are appended to the change_log table by the
+handlers in signals.py, with one row per user who can see the record.
+Rows are inserted after the write commits, but sequence numbers are
+taken at insert time, so under concurrency a higher seq can commit before
+a lower one. A client moving its token past the higher one would never
+see the lower. Pages therefore stop at the first row younger than
+SYNC_SETTLE_SECONDS: older rows are assumed committed, and the newest
+changes arrive on the next poll instead.
+
+A sync token encodes the last sequence number the client has seen and
+when it was issued. /api/sync?since=<token>:
+- reads the caller's log rows after that point (one indexed range scan);
+- collapses them per record, to created/updated/deleted;
+- loads the surviving records with one query per kind, re-checking
+  visibility (a record the caller can no longer see is reported deleted).
+
+Tokens older than SYNC_RETENTION_DAYS may point at rows that compaction
+(manage.py compact_change_log) has removed. For those, and for a missing
+token, the response says reset: the client reloads its lists in full and
+continues from the returned token.
+
+Clients should apply created and updated alike (upsert): compaction
+keeps only the latest row per record, so a create followed by an update
+can arrive as an update.
+"""
+import base64
+import binascii
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.utils import timezone
+from .appointments import NOTE_FIELDS, QueryParamError, appointment_rows, appointments, serialize_appointment, serialize_note
+from .models import (
+    CallNote, ChangeLogEntry, ChatMessage, Doctor, DoctorPatientLink, Notification, Patient, Survey, SurveyResponse,
+)
+from .notifications import serialize_notification
+from .sharding import scatter
+
+def record_change(kind, object_id, user_ids, action):
+    """Append a change for every user in user_ids once the current transaction commits"""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return
+    transaction.on_commit(lambda: ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(user_id=user_id, kind=kind, object_id=object_id, action=action) for user_id in user_ids
+    ]))
+
+
+def record_changes(kind, object_ids, user_ids, action='update'):
+    """record_change for several records with the same audience (bulk update() sites)"""
+    for object_id in object_ids:
+        record_change(kind, object_id, user_ids, action)
+
+
+def encode_token(seq, issued_at=None):
+    raw = f'{seq}.{int(issued_at or time.time())}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """(seq, issued_at) for a sync token"""
+    try:
+        seq, issued_at = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode().split('.')
+        return int(seq), int(issued_at)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise QueryParamError('Invalid sync token')
+
+
+def _settled_before():
+    """Rows created before this are assumed committed (see the module docstring)"""
+    return timezone.now() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+
+
+def latest_token():
+    # The newest settled row, not Max('seq'): a lower seq may still be in flight
+    seq = ChangeLogEntry.objects.filter(created_at__lt=_settled_before()).order_by('-created_at').values_list(
+        'seq', flat=True,
+    ).first() or 0
+    return encode_token(seq)
+
+
+def collapse(entries):
+    """{kind: {object_id: 'created' | 'updated' | 'deleted'}} for log rows in sequence order"""
+    first, last = {}, {}
+    for entry in entries:
+        key = (entry['kind'], entry['object_id'])
+        first.setdefault(key, entry['action'])
+        last[key] = entry['action']
+
+    changes = {}
+    for (kind, object_id), action in last.items():
+        if action == 'delete':
+            if first[(kind, object_id)] == 'create':
+                continue  # Created and deleted since the last poll; the client never saw it
+            state = 'deleted'
+        else:
+            state = 'created' if first[(kind, object_id)] == 'create' else 'updated'
+        changes.setdefault(kind, {})[object_id] = state
+    return changes
+
+
+def _meetings(user, ids):
+    if user.role == 'doctor':
+        specialty = Doctor.objects.filter(user=user).values_list('specialty', flat=True).first()
+        rows = appointment_rows(appointments(with_notes=True).filter(doctor__user=user, id__in=ids), 'doctor')
+        return {row['id']: serialize_appointment(row, 'doctor', specialty) for row in rows}
+    if user.role == 'patient':
+        rows = appointment_rows(appointments().filter(patient__user=user, id__in=ids), 'patient')
+        return {row['id']: serialize_appointment(row, 'patient') for row in rows}
+    return {}
+
+
+def _notes(user, ids):
+    rows = CallNote.objects.filter(meeting__doctor__user=user, id__in=ids).values(*NOTE_FIELDS)
+    return {row['id']: serialize_note(row) for row in rows}
+
+
+def _notifications(user, ids):
+    return {n.id: serialize_notification(n) for n in Notification.objects.filter(user=user, id__in=ids)}
+
+
+def _surveys(user, ids):
+    if user.role == 'doctor':
+        surveys = Survey.objects.filter(doctor__user=user, id__in=ids).annotate(response_count=Count('responses'))
+        return {s.id: {
+            'id': str(s.id),
+            'title': s.title,
+            'description': s.description,
+            'questionCount': len(s.questions) if s.questions else 0,
+            'isActive': s.is_active,
+            'createdAt': s.created_at.isoformat(),
+            'responseCount': s.response_count,
+        } for s in surveys}
+
+    patient = Patient.objects.filter(user=user).first()
+    if patient is None:
+        return {}
+    doctor_ids = DoctorPatientLink.objects.filter(patient=patient).values('doctor_id')
+    surveys = Survey.objects.filter(id__in=ids, doctor_id__in=doctor_ids, is_active=True).annotate(
+        answered=Exists(SurveyResponse.objects.filter(survey=OuterRef('pk'), patient=patient)),
+    ).select_related('doctor__user')
+    # Same visibility as the pending list: unassigned surveys go to every linked patient
+    return {s.id: {
+        'id': str(s.id),
+        'title': s.title,
+        'doctorName': s.doctor.user.name,
+        'assignedAt': s.created_at.isoformat(),
+        'questionCount': len(s.questions) if s.questions else 0,
+        'isAnswered': s.answered,
+    } for s in surveys if not s.assigned_patients or str(patient.id) in s.assigned_patients}
+
+
+def _survey_responses(user, ids):
+    responses = SurveyResponse.objects.filter(
+        Q(survey__doctor__user=user) | Q(patient__user=user), id__in=ids,
+    ).select_related('survey', 'patient__user')
+    return {r.id: {
+        'id': str(r.id),
+        'surveyId': str(r.survey_id),
+        'surveyTitle': r.survey.title,
+        'patientName': r.patient.user.name,
+        'answers': r.answers,
+        'submittedAt': r.submitted_at.isoformat(),
+    } for r in responses}
+
+
+def _messages(user, ids):
+    messages = ChatMessage.objects.filter(Q(sender=user) | Q(receiver=user), id__in=ids)
+    return {m.id: {
+        'id': str(m.id),
+        'senderId': str(m.sender_id),
+        'receiverId': str(m.receiver_id),
+        'message': m.message,
+        'isRead': m.is_read,
+        'createdAt': m.created_at.isoformat(),
+    } for m in messages}
+
+
+LOADERS = {
+    'meetings': _meetings,
+    'notes': _notes,
+    'notifications': _notifications,
+    'surveys': _surveys,
+    'surveyResponses': _survey_responses,
+    'messages': _messages,
+}
+# Kinds stored on the doctor's shard; a patient's can be spread over several (see sharding.py)
+SHARDED_KINDS = {'meetings', 'notes', 'surveys', 'surveyResponses'}
+
+
+def _load(kind, user, ids):
+    if kind not in SHARDED_KINDS:
+        return LOADERS[kind](user, ids)
+    records = {}
+    for part in scatter(lambda: LOADERS[kind](user, ids)):
+        records.update(part)
+    return records
+
+
+def sync_page(user, since, limit):
+    """
+    The /api/sync body for a token (or None).
+
+    {'reset': bool, 'changes': {kind: {'created': [...], 'updated': [...], 'deleted': [ids]}},
+     'next': token, 'hasMore': bool}
+    """
+    if not since:
+        return {'reset': True, 'changes': {}, 'next': latest_token(), 'hasMore': False}
+    seq, issued_at = decode_token(since)
+    if issued_at < time.time() - timedelta(days=settings.SYNC_RETENTION_DAYS).total_seconds():
+        return {'reset': True, 'changes': {}, 'next': latest_token(), 'hasMore': False}
+
+    entries = list(ChangeLogEntry.objects.filter(user=user, seq__gt=seq).order_by('seq').values(
+        'seq', 'kind', 'object_id', 'action', 'created_at',
+    )[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    # Stop at the first unsettled row, so the token never passes a seq whose transaction may still commit
+    settled_before = _settled_before()
+    for index, entry in enumerate(entries):
+        if entry['created_at'] >= settled_before:
+            entries, has_more = entries[:index], False
+            break
+
+    changes = {}
+    for kind, states in collapse(entries).items():
+        live = [object_id for object_id, state in states.items() if state != 'deleted']
+        records = _load(kind, user, live) if kind in LOADERS and live else {}
+        changed = {'created': [], 'updated': [], 'deleted': []}
+        for object_id, state in states.items():
+            if state != 'deleted' and object_id in records:
+                changed[state].append(records[object_id])
+            else:
+                changed['deleted'].append(str(object_id))
+        changes[kind] = changed
+
+    # Always a fresh token, so clients that keep polling never age out
+    next_seq = entries[-1]['seq'] if entries else seq
+    return {'reset': False, 'changes': changes, 'next': encode_token(next_seq), 'hasMore': has_more}
+
+
+def compact_change_log(retention_days=None):
+    """
+    Drop rows older than the retention window and rows superseded by a later change to the same record.
+
+    Returns (expired, superseded) row counts.
+    """
+    retention_days = settings.SYNC_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    expired, _ = ChangeLogEntry.objects.filter(created_at__lt=cutoff).delete()
+
+    latest = ChangeLogEntry.objects.values('user', 'kind', 'object_id').annotate(last=Max('seq')).values('last')
+    superseded, _ = ChangeLogEntry.objects.exclude(seq__in=latest).delete()
+    return expired, superseded
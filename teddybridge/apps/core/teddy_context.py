@@ -0,0 +1,259 @@
+"""
+Precomputed per-user context for the Teddy AI assistant.
+
+The system prompt for an authenticated user depends on their linked doctors,
+review aggregates and profile. Building it costs several queries, so we render
+it once, store the snapshot in the cache and invalidate it from model signals
+(see signals.py) whenever the underlying data changes. Invalidation only
+reaches every worker through a shared cache (REDIS_URL); with the per-process
+fallback, TEDDY_CONTEXT_TTL defaults to a minute to bound the staleness.
+"""
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count
+from .ai_utils import estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Bump when the prompt layout changes so stale snapshots are ignored after a deploy
+CONTEXT_VERSION = 1
+CONTEXT_CACHE_KEY = 'teddy:context:v%d:{user_id}' % CONTEXT_VERSION
+
+SYSTEM_PROMPT_TEMPLATE = """You are Teddy, the AI assistant for TeddyBridge - a healthcare platform that connects patients with specialized doctors for joint replacement consultations and PROMS (Patient-Reported Outcome Measures) tracking.
+
+PLATFORM KNOWLEDGE:
+- TeddyBridge is a peer-to-peer healthcare platform
+- PROMSBridge is the patient-facing side for PROMS tracking
+- Doctors can connect with peers for consultations
+- Patients can link to doctors via QR codes
+- The platform supports automated PROMS assessments (Pre, Post, and follow-up)
+- HIPAA-compliant video consultations are available
+- Review and recommendation system allows patients to rate doctors
+
+{context_info}
+
+{doctor_recommendations}
+
+CAPABILITIES:
+1. For Patients:
+   - Help find and recommend doctors based on medical needs and reviews
+   - Explain how to link with doctors via QR code
+   - Guide on PROMS assessments
+   - Answer questions about the platform
+
+2. For Doctors:
+   - Help manage patient relationships
+   - Explain PROMS monitoring features
+   - Guide on peer-to-peer consultations
+   - Help understand review feedback
+
+IMPORTANT GUIDELINES:
+- Always be helpful, professional, and empathetic
+- Use review ratings and feedback when recommending doctors to patients
+- When recommending doctors, prioritize those with higher ratings (4+ stars) and more reviews
+- Consider specialty match when suggesting doctors
+- Encourage patients to read reviews and leave their own after consultations
+- Provide accurate information about platform features
+- If asked about medical advice, recommend consulting with a doctor
+- Be concise but thorough in responses
+- For patients: Help them understand how to link with doctors via QR code
+- For doctors: Help them understand PROMS monitoring and patient management features
+
+REVIEW SYSTEM:
+- Patients can rate doctors from 1-5 stars
+- Reviews help other patients make informed decisions
+- Doctors can see their average ratings and review counts
+- Use review data to provide personalized recommendations
+
+Current user role: {user_role}
+"""
+
+GUEST_CONTEXT = """
+Guest User:
+- Not logged in
+- Can provide general information about TeddyBridge
+- Should encourage registration/login for personalized features
+"""
+
+RECOMMENDATION_GUIDANCE = (
+    "\nWhen recommending doctors:\n"
+    "- Prioritize doctors with higher ratings (4+ stars)\n"
+    "- Consider specialty match with patient's medical needs\n"
+    "- Mention review count for credibility\n"
+    "- Encourage patients to read reviews and leave their own after consultations\n"
+)
+
+
+def render_system_prompt(context_info, doctor_recommendations, user_role):
+    return SYSTEM_PROMPT_TEMPLATE.format(
+        context_info=context_info,
+        doctor_recommendations=doctor_recommendations,
+        user_role=user_role,
+    )
+
+
+# The guest prompt never changes, so render it once at import time
+GUEST_SNAPSHOT = {
+    'role': 'guest',
+    'system_prompt': render_system_prompt(GUEST_CONTEXT, '', 'guest'),
+}
+
+
+def _build_doctor_recommendations(doctors_list, token_budget):
+    """Render the recommendation block, dropping the lowest rated doctors once over budget"""
+    if not doctors_list:
+        return ''
+
+    header = "\n\nAvailable Doctors with Reviews (use these for recommendations):\n"
+    used = estimate_tokens(header) + estimate_tokens(RECOMMENDATION_GUIDANCE)
+    lines = []
+    # Sort by rating (highest first)
+    doctors_sorted = sorted(doctors_list, key=lambda x: x['avgRating'] or 0, reverse=True)
+    for index, doc in enumerate(doctors_sorted):
+        rating_text = f"{doc['avgRating']:.1f} stars" if doc['avgRating'] else "No ratings yet"
+        review_text = f"{doc['reviewCount']} review{'s' if doc['reviewCount'] != 1 else ''}"
+        line = f"- **{doc['name']}** ({doc['specialty']}): {rating_text} from {review_text}"
+        if doc['bio']:
+            line += f"\n  Bio: {doc['bio'][:150]}"
+        line += "\n"
+
+        line_tokens = estimate_tokens(line)
+        if used + line_tokens > token_budget:
+            remaining = len(doctors_sorted) - index
+            lines.append(f"- ...and {remaining} more linked doctor{'s' if remaining != 1 else ''}\n")
+            break
+        lines.append(line)
+        used += line_tokens
+
+    return header + ''.join(lines) + RECOMMENDATION_GUIDANCE
+
+
+def _linked_doctors(patient):
+    from .models import DoctorPatientLink, DoctorReview
+
+    # Get linked doctors with reviews
+    links = DoctorPatientLink.objects.filter(patient=patient).select_related('doctor__user')
+    doctor_ids = [link.doctor.id for link in links]
+
+    # Get review data for recommendations
+    reviews_data = DoctorReview.objects.filter(doctor_id__in=doctor_ids).values('doctor_id').annotate(
+        avg_rating=Avg('rating'),
+        review_count=Count('id')
+    )
+    reviews_dict = {str(r['doctor_id']): {'avgRating': float(r['avg_rating']) if r['avg_rating'] else None, 'reviewCount': r['review_count']} for r in reviews_data}
+
+    doctors_list = []
+    for link in links:
+        review_info = reviews_dict.get(str(link.doctor.id), {'avgRating': None, 'reviewCount': 0})
+        doctors_list.append({
+            'name': link.doctor.user.name,
+            'specialty': link.doctor.specialty or 'General',
+            'avgRating': review_info['avgRating'],
+            'reviewCount': review_info['reviewCount'],
+            'bio': link.doctor.bio or '',
+        })
+    return doctors_list
+
+
+def _build_patient_context(user, token_budget):
+    from .models import Patient
+    from .sharding import scatter
+
+    try:
+        patient = user.patient_profile
+    except Patient.DoesNotExist:
+        patient = Patient.objects.create(user=user)
+
+    # The patient's doctors can be on different shards
+    doctors_list = [doctor for part in scatter(lambda: _linked_doctors(patient)) for doctor in part]
+
+    # Safely handle medical_conditions
+    medical_conditions_str = 'None specified'
+    if patient.medical_conditions:
+        if isinstance(patient.medical_conditions, list):
+            medical_conditions_str = ', '.join(str(c) for c in patient.medical_conditions) or 'None specified'
+        else:
+            medical_conditions_str = str(patient.medical_conditions)
+    medical_conditions_str = truncate_to_tokens(medical_conditions_str, token_budget // 4)
+
+    context_info = f"""
+Patient Information:
+- Name: {user.name}
+- Email: {user.email}
+- Linked Doctors: {len(doctors_list)}
+- Medical Conditions: {medical_conditions_str}
+"""
+    remaining_budget = token_budget - estimate_tokens(context_info)
+    return context_info, _build_doctor_recommendations(doctors_list, remaining_budget)
+
+
+def _build_doctor_context(user):
+    from .models import Doctor, DoctorPatientLink, DoctorReview
+
+    try:
+        doctor = user.doctor_profile
+    except Doctor.DoesNotExist:
+        doctor = Doctor.objects.create(user=user)
+
+    patient_count = DoctorPatientLink.objects.filter(doctor=doctor).count()
+    review_stats = DoctorReview.objects.filter(doctor=doctor).aggregate(
+        avg_rating=Avg('rating'),
+        total_reviews=Count('id')
+    )
+    avg_rating_str = f"{review_stats['avg_rating']:.1f}" if review_stats['avg_rating'] is not None else 'N/A'
+
+    return f"""
+Doctor Information:
+- Name: {user.name}
+- Email: {user.email}
+- Specialty: {doctor.specialty or 'Not specified'}
+- License Number: {doctor.license_number or 'Not specified'}
+- Total Patients: {patient_count}
+- Average Rating: {avg_rating_str} stars
+- Total Reviews: {review_stats['total_reviews']}
+"""
+
+
+def build_user_context(user):
+    """Render the context snapshot for an authenticated user (hits the database)"""
+    token_budget = settings.TEDDY_CONTEXT_TOKEN_BUDGET
+    doctor_recommendations = ''
+
+    if user.role == 'patient':
+        context_info, doctor_recommendations = _build_patient_context(user, token_budget)
+    elif user.role == 'doctor':
+        context_info = truncate_to_tokens(_build_doctor_context(user), token_budget)
+    else:
+        return GUEST_SNAPSHOT
+
+    return {
+        'role': user.role,
+        'system_prompt': render_system_prompt(context_info, doctor_recommendations, user.role),
+    }
+
+
+def get_user_context(user):
+    """
+    Return the context snapshot for a user.
+
+    Guests get the static prompt without touching the cache. Authenticated users
+    cost a single cache read; the snapshot is only rebuilt after invalidation.
+    """
+    if user is None or not getattr(user, 'is_authenticated', False) or getattr(user, 'role', None) not in ['patient', 'doctor']:
+        return GUEST_SNAPSHOT
+
+    key = CONTEXT_CACHE_KEY.format(user_id=user.id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_user_context(user)
+        cache.set(key, snapshot, settings.TEDDY_CONTEXT_TTL)
+    return snapshot
+
+
+def invalidate_user_contexts(user_ids):
+    """Drop cached snapshots so they are rebuilt on the next chat message"""
+    keys = [CONTEXT_CACHE_KEY.format(user_id=user_id) for user_id in user_ids if user_id]
+    if keys:
+        cache.delete_many(keys)
+        logger.debug(f"Invalidated Teddy context for {len(keys)} user(s)")
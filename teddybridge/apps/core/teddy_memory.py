@@ -0,0 +1,197 @@
+"""
+Bounded conversation memory for the Teddy AI assistant.
+
+Turns are stored per conversation. The prompt carries the running summary plus
+as many recent turns as fit in TEDDY_HISTORY_TOKEN_BUDGET, so its size stays
+bounded however long the chat runs. Once the unsummarized turns exceed the
+budget, the oldest ones are folded into the summary by a background LLM call.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from .ai_utils import estimate_tokens, truncate_to_tokens
+from .models import TeddyConversation, TeddyMessage
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """You maintain the memory of an ongoing chat between a TeddyBridge user and Teddy, the platform's AI assistant.
+Update the running summary with the new turns below. Keep facts the assistant will need later (the user's goals, symptoms or conditions mentioned, doctors discussed, questions still open) and drop small talk.
+Write at most {max_words} words of plain text.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:"""
+
+# Summaries run off the request thread; two workers is plenty for a single web dyno
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='teddy-summary')
+
+
+def get_conversation(user, conversation_id):
+    """
+    Load an existing conversation owned by the user (None if not found), or start a new one.
+
+    A new conversation is not saved until record_turn() stores its first
+    exchange, so failed or aborted model calls leave no empty rows behind.
+    """
+    if conversation_id:
+        try:
+            return TeddyConversation.objects.get(id=conversation_id, user=user)
+        except (TeddyConversation.DoesNotExist, ValidationError, ValueError):
+            return None
+    return TeddyConversation(user=user)
+
+
+def stored_conversation_id(conversation):
+    """The id clients may send back, or None while the conversation has no stored turn yet"""
+    if conversation is None or conversation._state.adding:
+        return None
+    return str(conversation.id)
+
+
+def build_chat_messages(system_prompt, message, conversation=None):
+    """
+    Build the message list for the model.
+
+    Returns (messages, metrics) where metrics holds the estimated token split of
+    the prompt. Recent turns are added newest first until the history budget is
+    spent; anything older is represented by the summary only.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    history = []
+    history_tokens = 0
+    summary_tokens = 0
+
+    if conversation is not None:
+        if conversation.summary:
+            summary_tokens = conversation.summary_tokens
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation with this user:\n{conversation.summary}"
+            })
+
+        budget = settings.TEDDY_HISTORY_TOKEN_BUDGET
+        recent = conversation.messages.filter(summarized=False).order_by('-created_at').values('role', 'content', 'token_count')
+        for turn in recent:
+            if history_tokens + turn['token_count'] > budget:
+                break
+            history.append({"role": turn['role'], "content": turn['content']})
+            history_tokens += turn['token_count']
+        history.reverse()
+
+    messages.extend(history)
+    messages.append({"role": "user", "content": message})
+
+    metrics = {
+        'systemTokens': estimate_tokens(system_prompt),
+        'summaryTokens': summary_tokens,
+        'historyTokens': history_tokens,
+        'historyTurns': len(history),
+        'messageTokens': estimate_tokens(message),
+    }
+    metrics['promptTokens'] = metrics['systemTokens'] + summary_tokens + history_tokens + metrics['messageTokens']
+    return messages, metrics
+
+
+def record_turn(conversation, message, reply, prompt_tokens, completion_tokens=None):
+    """Store a user/assistant exchange and schedule summarization if needed"""
+    if completion_tokens is None:
+        completion_tokens = estimate_tokens(reply)
+
+    with transaction.atomic():
+        if conversation._state.adding:
+            conversation.save()
+        TeddyMessage.objects.create(
+            conversation=conversation,
+            role='user',
+            content=message,
+            token_count=estimate_tokens(message),
+        )
+        TeddyMessage.objects.create(
+            conversation=conversation,
+            role='assistant',
+            content=reply,
+            token_count=estimate_tokens(reply),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+        conversation.save(update_fields=['updated_at'])
+
+    logger.info(
+        f"Teddy conversation {conversation.id}: prompt_tokens={prompt_tokens}, completion_tokens={completion_tokens}"
+    )
+
+    pending = sum(
+        conversation.messages.filter(summarized=False).values_list('token_count', flat=True)
+    )
+    if pending > settings.TEDDY_HISTORY_TOKEN_BUDGET:
+        _summary_executor.submit(_summarize_in_background, conversation.id)
+    return completion_tokens
+
+
+def _summarize_in_background(conversation_id):
+    close_old_connections()
+    try:
+        summarize_conversation(conversation_id)
+    except Exception as e:
+        logger.error(f"Failed to summarize Teddy conversation {conversation_id}: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def summarize_conversation(conversation_id, groq_client=None):
+    """Fold the oldest unsummarized turns into the running summary"""
+    keep_recent = settings.TEDDY_RECENT_TURNS_KEPT
+    summary_budget = settings.TEDDY_SUMMARY_TOKEN_BUDGET
+
+    conversation = TeddyConversation.objects.get(id=conversation_id)
+    pending = list(conversation.messages.filter(summarized=False).order_by('created_at'))
+    to_fold = pending[:-keep_recent] if keep_recent else pending
+    if not to_fold:
+        return conversation
+
+    turns = "\n".join(f"{turn.role.capitalize()}: {turn.content}" for turn in to_fold)
+    summary = None
+
+    from .ai_client import get_groq_client
+    from .ai_views import TEDDY_MODEL
+    if groq_client is None:
+        groq_client = get_groq_client()
+
+    if groq_client:
+        prompt = SUMMARY_PROMPT.format(
+            max_words=summary_budget * 3 // 4,
+            summary=conversation.summary or '(none yet)',
+            turns=truncate_to_tokens(turns, settings.TEDDY_HISTORY_TOKEN_BUDGET * 2),
+        )
+        try:
+            response = groq_client.chat.completions.create(
+                model=TEDDY_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                max_tokens=summary_budget * 2,
+            )
+            summary = (response.choices[0].message.content or '').strip()
+        except Exception as e:
+            logger.warning(f"Teddy summary call failed for conversation {conversation_id}: {str(e)}")
+
+    if not summary:
+        # Fall back to keeping the tail of the raw turns so memory stays bounded anyway
+        combined = f"{conversation.summary}\n{turns}".strip()
+        summary = combined[-summary_budget * 4:]
+
+    summary = truncate_to_tokens(summary, summary_budget)
+
+    with transaction.atomic():
+        conversation.summary = summary
+        conversation.summary_tokens = estimate_tokens(summary)
+        conversation.save(update_fields=['summary', 'summary_tokens', 'updated_at'])
+        TeddyMessage.objects.filter(id__in=[turn.id for turn in to_fold]).update(summarized=True)
+
+    logger.info(f"Folded {len(to_fold)} turns into summary for Teddy conversation {conversation_id}")
+    return conversation
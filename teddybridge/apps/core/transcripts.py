@@ -0,0 +1,94 @@
+"""
+Compressed transcript storage.
+
+Meeting transcripts, the original transcription service output and
+unparsed AI responses are large and rarely read. Keeping them on the
+meetings/call_notes rows made every list query drag them along. They now
+live in the transcript_blobs table instead:
+- Each text is compressed with zlib, or zstd when TRANSCRIPT_COMPRESSION
+  is 'zstd' and the zstandard package is installed.
+- Blobs are keyed by the SHA-256 of the text, so text that is stored
+  twice (e.g. a transcript without speaker labels, which is both the
+  formatted and the original copy) is kept once.
+
+Rows point at blobs with foreign keys. Meeting.has_transcript answers
+"is there a transcript?" without a join.
+"""
+import hashlib
+import zlib
+from django.conf import settings
+from django.db.models import Q
+from .models import CallNote, Meeting, TranscriptBlob
+
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 19
+
+
+def _zstd():
+    import zstandard
+    return zstandard
+
+
+def compress_text(text, codec=None):
+    """(codec, compressed bytes) for a string"""
+    codec = codec or settings.TRANSCRIPT_COMPRESSION
+    raw = text.encode('utf-8')
+    if codec == 'zstd':
+        return codec, _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if codec == 'zlib':
+        return codec, zlib.compress(raw, ZLIB_LEVEL)
+    raise ValueError(f"Unsupported transcript codec: {codec}")
+
+
+def decompress_text(codec, data):
+    data = bytes(data)  # BinaryField may hand back a memoryview
+    if codec == 'zstd':
+        return _zstd().ZstdDecompressor().decompress(data).decode('utf-8')
+    if codec == 'zlib':
+        return zlib.decompress(data).decode('utf-8')
+    raise ValueError(f"Unsupported transcript codec: {codec}")
+
+
+def store_text(text):
+    """The blob holding `text` (created if needed), or None for empty text"""
+    if not text:
+        return None
+    sha256 = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    blob = TranscriptBlob.objects.filter(sha256=sha256).first()
+    if blob:
+        return blob
+    codec, data = compress_text(text)
+    blob, _ = TranscriptBlob.objects.get_or_create(sha256=sha256, defaults={
+        'codec': codec,
+        'data': data,
+        'size': len(text.encode('utf-8')),
+        'compressed_size': len(data),
+    })
+    return blob
+
+
+def blob_text(blob):
+    return decompress_text(blob.codec, blob.data) if blob else None
+
+
+def set_meeting_transcript(meeting, text):
+    """Point the meeting at a stored transcript; the caller saves the meeting"""
+    meeting.transcript = store_text(text)
+    meeting.has_transcript = meeting.transcript is not None
+
+
+def get_meeting_transcript(meeting):
+    """The meeting's transcript text, or None"""
+    if not meeting.has_transcript:
+        return None
+    return blob_text(meeting.transcript)
+
+
+def unreferenced_blobs():
+    """Blobs no meeting or call note points at (left behind by deleted meetings)"""
+    meeting_refs = Meeting.objects.filter(transcript__isnull=False).values('transcript_id')
+    source_refs = CallNote.objects.filter(source_transcript__isnull=False).values('source_transcript_id')
+    response_refs = CallNote.objects.filter(raw_response__isnull=False).values('raw_response_id')
+    return TranscriptBlob.objects.exclude(
+        Q(sha256__in=meeting_refs) | Q(sha256__in=source_refs) | Q(sha256__in=response_refs)
+    )
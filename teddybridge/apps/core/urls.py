@@ -1,16 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from . import ai_views
 
+if settings.ASYNC_VIEWS:
+    from . import async_views
+    chat_views = current_user_views = async_views
+else:
+    chat_views, current_user_views = ai_views, views
+
 urlpatterns = [
     path('register', views.register),
     path('login', views.user_login),
     path('google', views.google_auth),  # New endpoint for Google sign-in
     path('logout', views.user_logout),
-    path('me', views.get_current_user),
+    path('me', current_user_views.get_current_user),
     path('link/verify/<str:token>', views.verify_qr_token),
     path('link/patient', views.link_patient),
-    path('teddy/chat', ai_views.teddy_ai_chat),
+    path('teddy/chat', chat_views.teddy_ai_chat),
+    path('teddy/chat/stream', chat_views.teddy_ai_chat_stream),
+    path('teddy/conversations/<uuid:conversation_id>', ai_views.get_teddy_conversation),
 ]
 
 user_urlpatterns = [
@@ -0,0 +1,119 @@
+"""
+Change versions and conditional GET for read-heavy JSON endpoints.
+
+Every cacheable resource family (a doctor's patient list, a patient's
+doctors, notifications, the social feed, ...) has a version token per
+scope, usually the user it belongs to. Model signals (see signals.py)
+replace the token after each write that can change the family's
+responses.
+
+@conditional_get('family', ...) derives a weak ETag from the viewer, the
+request path and the current tokens. When If-None-Match matches, it
+answers 304 Not Modified before the view runs a single query, so
+background refetches cost one cache read.
+
+Tokens live in the cache, like the Teddy context snapshots. A token that
+is missing (never written, evicted or flushed) is replaced by a fresh
+random one, so losing the cache causes refetches, never stale data.
+Without a shared cache (REDIS_URL) a bump only reaches the worker that
+made the write, so tokens expire after RESOURCE_VERSION_TTL seconds;
+that bounds how long another worker can answer 304 for changed data.
+"""
+import functools
+import hashlib
+import logging
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+logger = logging.getLogger(__name__)
+
+# Bump when response layouts change so clients cannot revalidate bodies from before a deploy
+ETAG_VERSION = 1
+VERSION_CACHE_KEY = 'resource-version:{family}:{scope}'
+
+# Families shared by more than one user; everything else is scoped to the viewer
+FAMILY_SCOPES = {
+    'feed': lambda user: user.role,  # The feed shows every post by authors of the viewer's role
+}
+
+
+def _new_token():
+    return uuid.uuid4().hex[:16]
+
+
+def _scope(family, user):
+    scope = FAMILY_SCOPES.get(family)
+    return scope(user) if scope else user.id
+
+
+def current_versions(families, user):
+    """Version tokens for the viewer's scope of each family, creating any that are missing"""
+    keys = [VERSION_CACHE_KEY.format(family=family, scope=_scope(family, user)) for family in families]
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            token = _new_token()
+            # add() so a token another worker created at the same moment wins
+            tokens[key] = token if cache.add(key, token, settings.RESOURCE_VERSION_TTL) else (cache.get(key) or token)
+    return [tokens[key] for key in keys]
+
+
+def bump(family, *scopes):
+    """Invalidate the family for the given scopes (user ids, or roles for the feed) once the transaction commits"""
+    keys = {VERSION_CACHE_KEY.format(family=family, scope=scope) for scope in scopes if scope}
+    if not keys:
+        return
+
+    def replace_tokens():
+        cache.set_many({key: _new_token() for key in keys}, settings.RESOURCE_VERSION_TTL)
+        logger.debug(f"Bumped {family} version for {len(keys)} scope(s)")
+
+    transaction.on_commit(replace_tokens)
+
+
+def compute_etag(request, families):
+    tokens = current_versions(families, request.user)
+    source = '|'.join([str(ETAG_VERSION), str(request.user.id), request.get_full_path(), *tokens])
+    return 'W/"%s"' % hashlib.sha1(source.encode()).hexdigest()[:20]
+
+
+def _matches(etag, if_none_match):
+    # Weak comparison (RFC 9110 13.1.2), as for any GET
+    if not if_none_match:
+        return False
+    candidates = parse_etags(if_none_match)
+    if '*' in candidates:
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(candidate.removeprefix('W/') == opaque for candidate in candidates)
+
+
+def conditional_get(*families):
+    """
+    Send ETag on GET responses of an @api_view and answer 304 when the client's copy is current.
+
+    Apply below @api_view. Anonymous requests and non-GET methods pass
+    through untouched; so do error responses, which get no ETag.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            etag = compute_etag(request, families)
+            if _matches(etag, request.META.get('HTTP_IF_NONE_MATCH')):
+                response = HttpResponseNotModified()
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            # Store, but always revalidate; the body is per-user
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
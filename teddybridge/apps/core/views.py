@@ -7,13 +7,26 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 from .models import User, Doctor, Patient, QRToken, DoctorPatientLink, Notification
+from .avatars import (
+    AVATAR_DIR, AVATAR_FILENAME_RE, AVATAR_SIZES, AvatarError, avatar_path, avatar_variant,
+    render_variant as render_avatar_variant, render_variants_in_background as render_avatar_variants_in_background,
+    store_avatar
+)
+from django.conf import settings
+from .appointments import QueryParamError, parse_limit
+from .notifications import notification_feed
+from .storage import file_response, get_media_storage, public_media_name
+from .sharding import doctor_shard_alias
+from .sync import record_changes, sync_page
+from .versions import bump, conditional_get
 
-# Firebase imports (optional)
-try:
+import importlib.util
+
+# Firebase is optional; firebase_auth only imports the SDK when a token is verified
+FIREBASE_AVAILABLE = importlib.util.find_spec('firebase_admin') is not None
+if FIREBASE_AVAILABLE:
     from .firebase_auth import verify_firebase_token, get_user_from_token
-    FIREBASE_AVAILABLE = True
-except ImportError:
-    FIREBASE_AVAILABLE = False
+else:
     import logging
     logger = logging.getLogger(__name__)
     logger.warning("Firebase authentication not available. Install firebase-admin package.")
@@ -331,13 +344,13 @@ def user_logout(request):
     logout(request)
     return Response({'success': True})
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def get_current_user(request):
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    # Check if Firebase token is provided (for Firebase authentication)
+def login_with_firebase_bearer(request):
+    """
+    Sign the user in from a Firebase ID token in the Authorization header.
+
+    Returns False when a valid token belongs to an email with no Django account
+    yet (the client should register first), True otherwise.
+    """
     auth_header = request.headers.get('Authorization', '')
     if auth_header.startswith('Bearer '):
         firebase_token = auth_header.split('Bearer ')[1]
@@ -350,17 +363,31 @@ def get_current_user(request):
                     # Create session for the user
                     login(request, user, backend='django.contrib.auth.backends.ModelBackend')
                     request.session.save()
-                    # Continue to return user data below
                 except User.DoesNotExist:
-                    # User doesn't exist in Django yet - return 401 to trigger registration
-                    return Response({'error': 'User not found. Please register first.'}, status=status.HTTP_401_UNAUTHORIZED)
+                    return False
+    return True
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_current_user(request):
+    # Check if Firebase token is provided (for Firebase authentication)
+    if not login_with_firebase_bearer(request):
+        # User doesn't exist in Django yet - return 401 to trigger registration
+        return Response({'error': 'User not found. Please register first.'}, status=status.HTTP_401_UNAUTHORIZED)
     
     # Check Django session authentication
     if not request.user.is_authenticated:
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
+    data, status_code = current_user_payload(request.user)
+    return Response(data, status=status_code)
+
+def current_user_payload(user):
+    """Build the /me payload for an authenticated user; returns (data, status_code)"""
+    import logging
+    logger = logging.getLogger(__name__)
+    
     try:
-        user = request.user
         
         # Basic user data - ensure all fields are safely accessed
         try:
@@ -370,7 +397,7 @@ def get_current_user(request):
                 'name': getattr(user, 'name', '') or '',
                 'username': getattr(user, 'username', None) or None,
                 'role': getattr(user, 'role', '') or '',
-                'avatarUrl': getattr(user, 'avatar_url', None) or None,
+                'avatarUrl': avatar_variant(getattr(user, 'avatar_url', None), 512) or None,
             }
             
             # Check profile completeness
@@ -406,10 +433,10 @@ def get_current_user(request):
             data['missingFields'] = missing_fields if not is_profile_complete else []
         except Exception as e:
             logger.error(f"Error accessing basic user fields for user {user.id}: {str(e)}")
-            return Response({
+            return {
                 'error': 'Error accessing user data',
                 'details': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            }, status.HTTP_500_INTERNAL_SERVER_ERROR
         
         # Safely get doctor or patient profile
         # OneToOneField raises DoesNotExist when accessed and doesn't exist
@@ -480,18 +507,17 @@ def get_current_user(request):
                 logger.warning(f"Error fetching patient profile for user {user.id}: {str(e)}")
                 # Return data without patient profile
         
-        return Response(data)
+        return data, status.HTTP_200_OK
     except Exception as e:
         import logging
         import traceback
         logger = logging.getLogger(__name__)
         error_msg = str(e)
         error_trace = traceback.format_exc()
-        logger.error(f"Error in get_current_user for user {getattr(request.user, 'id', 'unknown')}: {error_msg}\n{error_trace}")
+        logger.error(f"Error in get_current_user for user {getattr(user, 'id', 'unknown')}: {error_msg}\n{error_trace}")
         
         # Return minimal user data even on error to prevent frontend crashes
         try:
-            user = request.user
             minimal_data = {
                 'id': str(user.id),
                 'email': getattr(user, 'email', '') or '',
@@ -500,13 +526,13 @@ def get_current_user(request):
                 'avatarUrl': None,
                 'error': 'Profile data unavailable'
             }
-            return Response(minimal_data)
+            return minimal_data, status.HTTP_200_OK
         except Exception as fallback_error:
             logger.error(f"Failed to return minimal user data: {str(fallback_error)}")
-            return Response({
+            return {
                 'error': 'Failed to get user data',
                 'details': error_msg
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            }, status.HTTP_500_INTERNAL_SERVER_ERROR
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -529,7 +555,7 @@ def verify_qr_token(request, token):
                 'id': str(qr_token.doctor.id),
                 'name': qr_token.doctor.user.name,
                 'specialty': qr_token.doctor.specialty,
-                'avatar': qr_token.doctor.user.avatar_url,
+                'avatar': avatar_variant(qr_token.doctor.user.avatar_url, 128),
             }
         })
     except QRToken.DoesNotExist:
@@ -556,10 +582,12 @@ def link_patient(request):
         except Patient.DoesNotExist:
             patient = Patient.objects.create(user=request.user)
         
-        if DoctorPatientLink.objects.filter(doctor=qr_token.doctor, patient=patient).exists():
+        # Links live on the doctor's shard, not necessarily the patient's
+        links = DoctorPatientLink.objects.using(doctor_shard_alias(qr_token.doctor_id))
+        if links.filter(doctor=qr_token.doctor, patient=patient).exists():
             return Response({'error': 'Already linked'}, status=status.HTTP_400_BAD_REQUEST)
         
-        DoctorPatientLink.objects.create(doctor=qr_token.doctor, patient=patient, source='qr')
+        links.create(doctor=qr_token.doctor, patient=patient, source='qr')
         qr_token.used = True
         qr_token.save()
         
@@ -591,22 +619,12 @@ def upload_avatar(request):
     import os
     from django.conf import settings
     
-    avatars_dir = os.path.join(settings.MEDIA_ROOT, 'avatars')
-    os.makedirs(avatars_dir, exist_ok=True)
-    
-    ext = os.path.splitext(avatar_file.name)[1]
-    filename = f"{request.user.id}{ext}"
-    filepath = os.path.join(avatars_dir, filename)
-    
-    if request.user.avatar_url:
-        old_path = request.user.avatar_url.replace(settings.MEDIA_URL, '').replace('http://localhost:5173/', '')
-        old_file = os.path.join(settings.MEDIA_ROOT, old_path)
-        if os.path.exists(old_file):
-            os.remove(old_file)
-    
-    with open(filepath, 'wb+') as destination:
-        for chunk in avatar_file.chunks():
-            destination.write(chunk)
+    # Decoding is the real validation; the stored master is a metadata-free WebP
+    try:
+        digest = store_avatar(avatar_file)
+    except AvatarError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    render_avatar_variants_in_background(digest)
     
     # Use environment variable for API base URL, fallback to request host
     api_base_url = os.getenv('API_BASE_URL', '')
@@ -616,11 +634,45 @@ def upload_avatar(request):
         host = request.get_host()
         api_base_url = f"{scheme}://{host}"
     
-    avatar_url = f"{api_base_url}{settings.MEDIA_URL}avatars/{filename}"
+    # Content-addressed files may be shared between users, so old avatars are not deleted here
+    avatar_url = f"{api_base_url}{settings.MEDIA_URL}{AVATAR_DIR}/{digest}.webp"
     request.user.avatar_url = avatar_url
-    request.user.save()
+    request.user.save(update_fields=['avatar_url'])
     
-    return Response({'success': True, 'avatarUrl': avatar_url})
+    return Response({
+        'success': True,
+        'avatarUrl': avatar_url,
+        'avatarVariants': {str(size): avatar_variant(avatar_url, size) for size in AVATAR_SIZES},
+    })
+
+def serve_avatar(request, filename):
+    """Serve avatar files; content-addressed ones are immutable and variants render on first request"""
+    import os
+    from django.http import Http404
+    
+    match = AVATAR_FILENAME_RE.match(filename)
+    if match:
+        size = match.group('size')
+        if size and int(size) not in AVATAR_SIZES:
+            raise Http404('Unknown avatar size')
+        path = render_avatar_variant(match.group('digest'), int(size)) if size else avatar_path(match.group('digest'))
+        if not path or not os.path.exists(path):
+            raise Http404('Avatar not found')
+        return file_response(request, path, content_type='image/webp',
+                             cache_control='public, max-age=31536000, immutable', accel_name=f'{AVATAR_DIR}/{filename}')
+    
+    # Avatars uploaded before the pipeline existed (<user_id><ext>) can still change in place
+    return serve_media(request, f'{AVATAR_DIR}/{filename}')
+
+def serve_media(request, name):
+    """Public media from the storage backend; recordings are private and only served by their meeting endpoint"""
+    from django.http import Http404
+    
+    storage = get_media_storage()
+    name = public_media_name(name)
+    if name is None or not storage.exists(name):
+        raise Http404('File not found')
+    return storage.serve(request, name, cache_control='public, max-age=3600')
 
 @api_view(['PATCH'])
 def update_profile(request):
@@ -739,50 +791,12 @@ def delete_account(request):
     return Response({'success': True})
 
 @api_view(['GET'])
+@conditional_get('notifications')
 def get_notifications(request):
     if not request.user.is_authenticated:
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    notifications = Notification.objects.filter(user=request.user)[:20]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
-    
-    # Fix old notification links that point to /peer-network incorrectly
-    # For "New Message" notifications, set correct link based on user role
-    result_notifications = []
-    for n in notifications:
-        notification_link = n.link
-        
-        # Fix old "New Message" notifications that incorrectly link to /peer-network
-        # This handles notifications created before the fix was implemented
-        if (n.type == 'general' and 
-            n.title == 'New Message' and 
-            notification_link == '/peer-network' and
-            request.user.role in ['patient', 'doctor']):
-            # Determine correct link based on user's role
-            if request.user.role == 'patient':
-                notification_link = '/patient/doctors'
-            elif request.user.role == 'doctor':
-                notification_link = '/doctor/patients'
-            
-            # Update the database record to fix it permanently
-            if notification_link != n.link:
-                n.link = notification_link
-                n.save(update_fields=['link'])
-        
-        result_notifications.append({
-            'id': str(n.id),
-            'type': n.type,
-            'title': n.title,
-            'message': n.message,
-            'link': notification_link,
-            'isRead': n.is_read,
-            'createdAt': n.created_at.isoformat(),
-        })
-    
-    return Response({
-        'notifications': result_notifications,
-        'unreadCount': unread_count,
-    })
+    return Response(notification_feed(request.user))
 
 @api_view(['POST'])
 def mark_notification_read(request, notification_id):
@@ -802,9 +816,26 @@ def mark_all_notifications_read(request):
     if not request.user.is_authenticated:
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    unread = Notification.objects.filter(user=request.user, is_read=False)
+    unread_ids = list(unread.values_list('id', flat=True))
+    if unread_ids:
+        unread.update(is_read=True)
+        bump('notifications', request.user.id)
+        record_changes('notifications', unread_ids, [request.user.id])
     return Response({'success': True})
 
+@api_view(['GET'])
+def sync_changes(request):
+    """Created, updated and deleted records visible to the caller since ?since= (see core/sync.py)"""
+    if not request.user.is_authenticated:
+        return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    try:
+        limit = parse_limit(request.GET, settings.SYNC_PAGE_SIZE, maximum=settings.SYNC_PAGE_SIZE)
+        return Response(sync_page(request.user, request.GET.get('since'), limit))
+    except QueryParamError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def health_check(request):
@@ -0,0 +1,152 @@
+"""
+Doctor dashboard sections.
+
+Each section is a function of (doctor, user, params). The standalone
+endpoints (stats, patients/recent, appointments/upcoming, ...) and
+/api/doctor/dashboard, which bundles them (see core/dashboard.py), call
+the same functions.
+"""
+from datetime import timedelta
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from teddybridge.apps.core.appointments import (
+    UPCOMING_STATUSES, appointment_page, appointment_statistics, parse_statuses, period_range
+)
+from teddybridge.apps.core.avatars import avatar_variant
+from teddybridge.apps.core.models import CallNote, DoctorPatientLink, Meeting
+from teddybridge.apps.core.notifications import notification_feed
+from .roster import NEVER, roster_links
+
+STATS_PERIOD_DAYS = {'week': 7, 'month': 30, 'year': 365}
+TOP_PERIOD_DAYS = {'week': 7, 'month': 30, 'year': 365, 'all': None}
+
+ONLINE = Q(meeting_url__isnull=False) & ~Q(meeting_url='')
+
+
+def stats(doctor, user, params):
+    """Headline counters for ?period= (week/month/year) and the period before it"""
+    now = timezone.now()
+    period_days = STATS_PERIOD_DAYS.get(params.get('period', 'month'), 30)
+    start_date = now - timedelta(days=period_days)
+    previous_start = start_date - timedelta(days=period_days)
+    current = Q(scheduled_at__gte=start_date)
+    previous = Q(scheduled_at__gte=previous_start, scheduled_at__lt=start_date)
+    # Future meetings with patients who already had a completed visit
+    seen_patients = Meeting.objects.filter(doctor=doctor, status='completed', patient__isnull=False).values('patient_id')
+
+    meetings = Meeting.objects.filter(doctor=doctor).aggregate(
+        upcoming=Count('id', filter=Q(status__in=UPCOMING_STATUSES)),
+        completed=Count('id', filter=Q(status='completed') & current),
+        cancelled=Count('id', filter=Q(status='cancelled') & current),
+        online=Count('id', filter=ONLINE & current),
+        previous_completed=Count('id', filter=Q(status='completed') & previous),
+        previous_cancelled=Count('id', filter=Q(status='cancelled') & previous),
+        previous_online=Count('id', filter=ONLINE & previous),
+        total=Count('id'),
+        total_online=Count('id', filter=ONLINE),
+        total_rescheduled=Count('id', filter=Q(status__in=UPCOMING_STATUSES, scheduled_at__isnull=False)),
+        follow_ups=Count('id', filter=Q(scheduled_at__gt=now, patient_id__in=Subquery(seen_patients))),
+    )
+    links = DoctorPatientLink.objects.filter(doctor=doctor).aggregate(
+        total=Count('id'),
+        previous=Count('id', filter=Q(linked_at__gte=previous_start, linked_at__lt=start_date)),
+    )
+    pending_notes = CallNote.objects.filter(
+        meeting__doctor=doctor, meeting__status='completed', chief_complaint__isnull=True,
+    ).count()
+
+    return {
+        'totalPatients': links['total'],
+        'upcomingAppointments': meetings['upcoming'],
+        'completedMeetings': meetings['completed'],
+        'cancelledAppointments': meetings['cancelled'],
+        'onlineConsultations': meetings['online'],
+        'pendingNotes': pending_notes,
+        # Previous period data for growth calculation
+        'previousTotalPatients': links['previous'],
+        'previousCompletedMeetings': meetings['previous_completed'],
+        'previousCancelledAppointments': meetings['previous_cancelled'],
+        'previousOnlineConsultations': meetings['previous_online'],
+        # Breakdown stats (all time)
+        'totalAppointments': meetings['total'],
+        'totalVideoConsultations': meetings['total_online'],
+        'totalRescheduled': meetings['total_rescheduled'],
+        'totalFollowUps': meetings['follow_ups'],
+    }
+
+
+def recent_patients(doctor, user, params):
+    """The five most recently linked patients with unread message counts"""
+    rows = roster_links(doctor, user).order_by('-linked_at', '-id').values(
+        'patient_id', 'patient__user_id', 'patient__user__name', 'patient__user__avatar_url', 'linked_at', 'unread',
+    )[:5]
+    return [{
+        'id': str(row['patient_id']),
+        'userId': str(row['patient__user_id']),
+        'name': row['patient__user__name'],
+        'avatar': avatar_variant(row['patient__user__avatar_url'], 48),
+        'lastVisit': row['linked_at'].isoformat(),
+        'unreadMessageCount': row['unread'],
+    } for row in rows]
+
+
+def top_patients(doctor, user, params):
+    """The five patients with the most appointments in ?period= (week/month/year/all)"""
+    days = TOP_PERIOD_DAYS.get(params.get('period', 'week'))
+    counted = Meeting.objects.filter(doctor=doctor, patient=OuterRef('patient_id'))
+    if days:
+        counted = counted.filter(scheduled_at__gte=timezone.now() - timedelta(days=days))
+    counted = counted.order_by().values('patient').annotate(count=Count('id')).values('count')
+
+    rows = roster_links(doctor, user).annotate(appointment_count=Coalesce(Subquery(counted), 0)).filter(
+        appointment_count__gt=0,
+    ).order_by('-appointment_count', '-linked_at').values(
+        'patient_id', 'patient__user_id', 'patient__user__name', 'patient__user__avatar_url', 'patient__phone',
+        'appointment_count', 'last_visit',
+    )[:5]
+    return [{
+        'id': str(row['patient_id']),
+        'userId': str(row['patient__user_id']),
+        'name': row['patient__user__name'],
+        'avatar': avatar_variant(row['patient__user__avatar_url'], 48),
+        'phone': row['patient__phone'],
+        'appointmentCount': row['appointment_count'],
+        'lastVisit': row['last_visit'].isoformat() if row['last_visit'] != NEVER else None,
+    } for row in rows]
+
+
+def upcoming_appointments(doctor, user, params):
+    start_date, end_date = period_range(params.get('filter', 'all'))  # today, week, month, all
+    return appointment_page(
+        params, 'doctor', 20, specialty=doctor.specialty, descending=False,
+        doctor=doctor, statuses=UPCOMING_STATUSES, start=start_date, end=end_date,
+    )
+
+
+def recent_appointments(doctor, user, params):
+    # status: all, completed, pending, cancelled (or a single meeting status)
+    return appointment_page(
+        params, 'doctor', 10, specialty=doctor.specialty,
+        doctor=doctor, statuses=parse_statuses(params.get('status', 'all')),
+    )
+
+
+def appointment_chart(doctor, user, params):
+    return appointment_statistics(params.get('period', 'monthly'), 'pending', doctor=doctor)  # monthly, weekly, yearly
+
+
+def notifications(doctor, user, params):
+    return notification_feed(user)
+
+
+SECTIONS = {
+    'stats': stats,
+    'recentPatients': recent_patients,
+    'topPatients': top_patients,
+    'upcomingAppointments': upcoming_appointments,
+    'recentAppointments': recent_appointments,
+    'appointmentStatistics': appointment_chart,
+    'notifications': notifications,
+}
+PAGED_SECTIONS = {'upcomingAppointments', 'recentAppointments'}
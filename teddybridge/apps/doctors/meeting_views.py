@@ -1,7 +1,16 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from teddybridge.apps.core.models import Doctor, Meeting, CallNote
+from teddybridge.apps.core.models import Doctor
+from teddybridge.apps.core.appointments import (
+    QueryParamError, appointment_page, list_response, note_rows, paginate, parse_limit, parse_statuses, serialize_note
+)
+from teddybridge.apps.core.avatars import avatar_variant
+from teddybridge.apps.core.note_search import query_terms, search_notes
+
+LIST_PAGE_SIZE = 100
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
 
 @api_view(['GET'])
 def get_appointments(request):
@@ -16,19 +25,15 @@ def get_appointments(request):
     except Doctor.DoesNotExist:
         doctor = Doctor.objects.create(user=request.user)
     
-    meetings = Meeting.objects.filter(doctor=doctor).select_related('patient__user').order_by('-scheduled_at')
-    
-    result = [{
-        'id': str(m.id),
-        'patientName': m.patient.user.name if m.patient else 'Unknown',
-        'patientAvatar': m.patient.user.avatar_url if m.patient else None,
-        'patientId': str(m.patient.id) if m.patient else None,
-        'scheduledAt': m.scheduled_at.isoformat() if m.scheduled_at else None,
-        'title': m.title,
-        'status': m.status,
-    } for m in meetings]
+    try:
+        items, next_cursor = appointment_page(
+            request.GET, 'doctor', LIST_PAGE_SIZE, specialty=doctor.specialty,
+            doctor=doctor, statuses=parse_statuses(request.GET.get('status')),
+        )
+    except QueryParamError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    return Response(result)
+    return list_response(items, next_cursor)
 
 @api_view(['GET'])
 def get_meetings(request):
@@ -43,22 +48,15 @@ def get_meetings(request):
     except Doctor.DoesNotExist:
         doctor = Doctor.objects.create(user=request.user)
     
-    meetings = Meeting.objects.filter(doctor=doctor).select_related('patient__user').order_by('-created_at')
-    
-    result = [{
-        'id': str(m.id),
-        'patientName': m.patient.user.name if m.patient else 'Unknown',
-        'patientAvatar': m.patient.user.avatar_url if m.patient else None,
-        'title': m.title,
-        'scheduledAt': m.scheduled_at.isoformat() if m.scheduled_at else None,
-        'startedAt': m.started_at.isoformat() if m.started_at else None,
-        'endedAt': m.ended_at.isoformat() if m.ended_at else None,
-        'status': m.status,
-        'hasTranscript': bool(m.transcript_text),
-        'hasNotes': CallNote.objects.filter(meeting=m).exists(),
-    } for m in meetings]
-    
-    return Response(result)
+    try:
+        items, next_cursor = appointment_page(
+            request.GET, 'doctor', LIST_PAGE_SIZE, specialty=doctor.specialty, sort_field='created_at',
+            doctor=doctor, statuses=parse_statuses(request.GET.get('status')), with_notes=True,
+        )
+    except QueryParamError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return list_response(items, next_cursor)
 
 @api_view(['GET'])
 def get_notes(request):
@@ -73,26 +71,54 @@ def get_notes(request):
     except Doctor.DoesNotExist:
         doctor = Doctor.objects.create(user=request.user)
     
-    notes = CallNote.objects.filter(meeting__doctor=doctor).select_related('meeting__patient__user').order_by('-created_at')
-    
-    result = [{
-        'id': str(n.id),
-        'meetingId': str(n.meeting.id),
-        'patientName': n.meeting.patient.user.name if n.meeting.patient else 'Unknown',
-        'patientAvatar': n.meeting.patient.user.avatar_url if n.meeting.patient else None,
-        'meetingDate': n.meeting.created_at.isoformat(),
-        'chiefComplaint': n.chief_complaint or '',
-        'hpi': n.hpi or '',
-        'pastMedicalHistory': n.past_medical_history or '',
-        'medications': n.medications or '',
-        'allergies': n.allergies or '',
-        'examObservations': n.exam_observations or '',
-        'assessment': n.assessment or '',
-        'plan': n.plan or '',
-        'urgentFlags': n.urgent_flags or [],
-        'followUpQuestions': n.follow_up_questions or [],
-        'isEdited': n.is_edited,
-        'createdAt': n.created_at.isoformat(),
-    } for n in notes]
-    
-    return Response(result)
+    try:
+        rows, next_cursor = paginate(
+            note_rows(doctor), 'created_at', parse_limit(request.GET, LIST_PAGE_SIZE), request.GET.get('cursor'),
+        )
+    except QueryParamError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return list_response([serialize_note(row) for row in rows], next_cursor)
+
+@api_view(['GET'])
+def search_notes_view(request):
+    """Full-text search over the doctor's notes and transcripts: ?q=metformin&limit=20&cursor=..."""
+    if not request.user.is_authenticated:
+        return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    if request.user.role != 'doctor':
+        return Response({'error': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        doctor = request.user.doctor_profile
+    except Doctor.DoesNotExist:
+        doctor = Doctor.objects.create(user=request.user)
+    
+    query = request.GET.get('q', '').strip()
+    if not query_terms(query):
+        return Response({'error': 'Search query is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.GET.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        notes, next_cursor = search_notes(doctor, query, limit=limit, cursor=request.GET.get('cursor') or None)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'results': [{
+            'id': str(n.id),
+            'meetingId': str(n.meeting.id),
+            'patientName': n.meeting.patient.user.name if n.meeting.patient else 'Unknown',
+            'patientAvatar': avatar_variant(n.meeting.patient.user.avatar_url, 48) if n.meeting.patient else None,
+            'meetingDate': n.meeting.created_at.isoformat(),
+            'chiefComplaint': n.chief_complaint or '',
+            'snippet': n.snippet,
+            'matchedIn': n.snippet_source,
+            'rank': n.search_rank,
+            'createdAt': n.created_at.isoformat(),
+        } for n in notes],
+        'nextCursor': next_cursor,
+    })
@@ -6,5 +6,6 @@ urlpatterns = [
     path('scores/add', monitor_views.add_proms_score),
     path('trends', monitor_views.get_trends_data),
     path('document/<uuid:patient_id>', monitor_views.generate_proms_document),
+    path('documents/export', monitor_views.export_proms_documents),
     path('history/<uuid:patient_id>', monitor_views.get_patient_proms_history),
 ]
@@ -3,15 +3,13 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.utils import timezone
 from datetime import timedelta
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from teddybridge.apps.core.models import Doctor, Patient, PromsScore
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from io import BytesIO
+from teddybridge.apps.core.versions import conditional_get
+from .proms_reports import get_proms_report, panel_reports, render_reports, report_filename, stream_reports_zip
 
 @api_view(['GET'])
+@conditional_get('patients', 'proms')
 def get_monitor_dashboard(request):
     if not request.user.is_authenticated or request.user.role != 'doctor':
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -135,73 +133,30 @@ def generate_proms_document(request, patient_id):
     
     try:
         doctor = request.user.doctor_profile
-        patient = Patient.objects.get(id=patient_id)
+        patient = Patient.objects.select_related('user').get(id=patient_id)
     except (Doctor.DoesNotExist, Patient.DoesNotExist):
         return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    # Get scores
-    pre_score = PromsScore.objects.filter(
-        patient=patient,
-        doctor=doctor,
-        score_type='pre_surgery'
-    ).order_by('-recorded_at').first()
+    pdf = get_proms_report(doctor, patient)
     
-    post_score = PromsScore.objects.filter(
-        patient=patient,
-        doctor=doctor,
-        score_type='post_surgery'
-    ).order_by('-recorded_at').first()
-    
-    # Create PDF
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title = Paragraph(f"<b>PROMS Report - {patient.user.name}</b>", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 20))
-    
-    # Patient Info
-    info = Paragraph(f"<b>Patient:</b> {patient.user.name}<br/><b>Doctor:</b> Dr. {doctor.user.name}<br/><b>Date:</b> {timezone.now().strftime('%Y-%m-%d')}", styles['Normal'])
-    elements.append(info)
-    elements.append(Spacer(1, 20))
-    
-    # Scores Table
-    data = [['Metric', 'Value']]
-    if pre_score:
-        data.append(['Pre-Surgery Score', str(pre_score.score)])
-    if post_score:
-        data.append(['Post-Surgery Score', str(post_score.score)])
-    if pre_score and post_score:
-        improvement = post_score.score - pre_score.score
-        data.append(['Improvement', f"{improvement} ({'+' if improvement > 0 else ''}{improvement})"])
-    
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(table)
-    elements.append(Spacer(1, 20))
-    
-    # Billable Codes
-    if post_score and post_score.billable_codes:
-        codes_text = Paragraph(f"<b>Billable Codes:</b> {', '.join(post_score.billable_codes)}", styles['Normal'])
-        elements.append(codes_text)
-    
-    doc.build(elements)
-    buffer.seek(0)
-    
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="proms_report_{patient.user.name.replace(" ", "_")}.pdf"'
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{report_filename(patient.user.name)}"'
+    return response
+
+@api_view(['GET'])
+def export_proms_documents(request):
+    """ZIP of PROMS reports for every linked patient, streamed as reports are rendered"""
+    if not request.user.is_authenticated or request.user.role != 'doctor':
+        return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    try:
+        doctor = request.user.doctor_profile
+    except Doctor.DoesNotExist:
+        return Response({'error': 'Doctor profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    entries = panel_reports(doctor)
+    response = StreamingHttpResponse(stream_reports_zip(render_reports(entries)), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="proms_reports_{timezone.now().strftime("%Y%m%d")}.zip"'
     return response
 
 @api_view(['GET'])
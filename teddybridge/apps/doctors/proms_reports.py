@@ -0,0 +1,225 @@
+"""
+PROMS PDF reports.
+
+render_proms_report is a pure function: a plain dict goes in and PDF bytes
+come out. That lets the bulk export run it in worker processes. A rendered
+PDF only changes when the patient's latest pre/post-surgery scores change,
+so it is cached under a key built from those score IDs (plus the names
+printed on it). The bulk export renders only cache misses, in a process
+pool, and streams the ZIP while later reports are still rendering.
+"""
+import hashlib
+import logging
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.cache import cache
+from teddybridge.apps.core.models import Patient, PromsScore
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def latest_scores(doctor, patient_ids=None):
+    """{patient_id: {'pre_surgery': score, 'post_surgery': score}} for the doctor's latest scores, in one query"""
+    scores = PromsScore.objects.filter(doctor=doctor).only(
+        'id', 'patient_id', 'score_type', 'score', 'billable_codes', 'recorded_at'
+    ).order_by('patient_id', 'score_type', '-recorded_at')
+    if patient_ids is not None:
+        scores = scores.filter(patient_id__in=patient_ids)
+
+    latest = {}
+    for score in scores.iterator(chunk_size=2000):
+        latest.setdefault(score.patient_id, {}).setdefault(score.score_type, score)
+    return latest
+
+
+def build_report_input(patient_name, doctor_name, scores):
+    """Everything the PDF shows, as picklable primitives"""
+    pre_score = scores.get('pre_surgery')
+    post_score = scores.get('post_surgery')
+    recorded = [s.recorded_at for s in (pre_score, post_score) if s]
+    return {
+        'patient_name': patient_name,
+        'doctor_name': doctor_name,
+        'as_of': max(recorded).strftime('%Y-%m-%d') if recorded else None,
+        'pre_score_id': str(pre_score.id) if pre_score else None,
+        'pre_score': pre_score.score if pre_score else None,
+        'post_score_id': str(post_score.id) if post_score else None,
+        'post_score': post_score.score if post_score else None,
+        'billable_codes': (post_score.billable_codes or []) if post_score else [],
+    }
+
+
+def report_cache_key(doctor_id, patient_id, report):
+    names = hashlib.sha1(f"{report['patient_name']}|{report['doctor_name']}".encode()).hexdigest()[:12]
+    return f"proms_report:{doctor_id}:{patient_id}:{report['pre_score_id']}:{report['post_score_id']}:{names}"
+
+
+def render_proms_report(report):
+    """Render a report input dict to PDF bytes (no database access, safe to run in another process)"""
+    # reportlab is only needed for this export, so keep it out of worker boot
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Title
+    elements.append(Paragraph(f"<b>PROMS Report - {report['patient_name']}</b>", styles['Title']))
+    elements.append(Spacer(1, 20))
+
+    # Patient Info; dated by the latest score so cached copies stay accurate
+    elements.append(Paragraph(
+        f"<b>Patient:</b> {report['patient_name']}<br/><b>Doctor:</b> Dr. {report['doctor_name']}"
+        f"<br/><b>Scores as of:</b> {report['as_of'] or 'No scores recorded'}",
+        styles['Normal']
+    ))
+    elements.append(Spacer(1, 20))
+
+    # Scores Table
+    data = [['Metric', 'Value']]
+    if report['pre_score'] is not None:
+        data.append(['Pre-Surgery Score', str(report['pre_score'])])
+    if report['post_score'] is not None:
+        data.append(['Post-Surgery Score', str(report['post_score'])])
+    if report['pre_score'] is not None and report['post_score'] is not None:
+        improvement = report['post_score'] - report['pre_score']
+        data.append(['Improvement', f"{improvement} ({'+' if improvement > 0 else ''}{improvement})"])
+
+    table = Table(data)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(table)
+    elements.append(Spacer(1, 20))
+
+    # Billable Codes
+    if report['billable_codes']:
+        elements.append(Paragraph(f"<b>Billable Codes:</b> {', '.join(report['billable_codes'])}", styles['Normal']))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def get_proms_report(doctor, patient):
+    """Cached PDF bytes for one patient"""
+    report = build_report_input(patient.user.name, doctor.user.name, latest_scores(doctor, [patient.id]).get(patient.id, {}))
+    key = report_cache_key(doctor.id, patient.id, report)
+    pdf = cache.get(key)
+    if pdf is None:
+        pdf = render_proms_report(report)
+        cache.set(key, pdf, REPORT_CACHE_TIMEOUT)
+    return pdf
+
+
+def report_filename(patient_name, patient_id=None):
+    name = patient_name.replace(" ", "_")
+    return f"proms_report_{name}_{str(patient_id)[:8]}.pdf" if patient_id else f"proms_report_{name}.pdf"
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(max_workers=settings.REPORT_RENDER_PROCESSES)
+    return _process_pool
+
+
+def panel_reports(doctor):
+    """(filename, cache_key, report_input) for every patient linked to the doctor"""
+    patients = list(
+        Patient.objects.filter(doctor_links__doctor=doctor).select_related('user').only('id', 'user__name').order_by('user__name')
+    )
+    scores = latest_scores(doctor)
+    return [
+        (report_filename(patient.user.name, patient.id), report_cache_key(doctor.id, patient.id, report), report)
+        for patient in patients
+        for report in [build_report_input(patient.user.name, doctor.user.name, scores.get(patient.id, {}))]
+    ]
+
+
+def render_reports(entries, processes=None):
+    """
+    Yield (filename, pdf) for panel entries in order, rendering cache misses in the process pool.
+
+    Newly rendered PDFs are written back to the cache in batches.
+    """
+    cached = cache.get_many([key for _, key, _ in entries])
+    misses = [report for _, key, report in entries if key not in cached]
+    own_pool = None
+    if len(misses) >= settings.REPORT_PROCESS_THRESHOLD:
+        if processes and processes != settings.REPORT_RENDER_PROCESSES:
+            # A one-off pool size (benchmarks); the shared pool stays as configured
+            pool = own_pool = ProcessPoolExecutor(max_workers=processes)
+        else:
+            processes = settings.REPORT_RENDER_PROCESSES
+            pool = _get_process_pool()
+        rendered = pool.map(render_proms_report, misses, chunksize=max(1, len(misses) // (processes * 4)))
+    else:
+        rendered = map(render_proms_report, misses)
+
+    try:
+        pending = {}
+        for filename, key, _ in entries:
+            pdf = cached.get(key)
+            if pdf is None:
+                pdf = next(rendered)
+                pending[key] = pdf
+                if len(pending) >= 100:
+                    cache.set_many(pending, REPORT_CACHE_TIMEOUT)
+                    pending = {}
+            yield filename, pdf
+        if pending:
+            cache.set_many(pending, REPORT_CACHE_TIMEOUT)
+    finally:
+        if own_pool:
+            own_pool.shutdown(cancel_futures=True)
+
+
+class _ZipStream:
+    """Write-only file object that hands out what zipfile has written so far"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_reports_zip(reports):
+    """Yield a ZIP archive of (filename, pdf) pairs chunk by chunk"""
+    stream = _ZipStream()
+    # PDFs are already compressed, so store them as-is
+    with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for filename, pdf in reports:
+            archive.writestr(filename, pdf)
+            yield stream.drain()
+    yield stream.drain()
@@ -0,0 +1,193 @@
+"""
+QR code rendering for doctor link tokens.
+
+A QR code is computed once as a module matrix. It is then drawn as SVG (a
+single vector path, no rasterizing), as PNG (Pillow, the historical format),
+or as reportlab rectangles for printable batch PDFs. Rendered images are
+cached per token until the token expires. Large batches compute their
+matrices in a process pool. qrcode, Pillow and reportlab are imported lazily
+so worker boot doesn't pay for them.
+"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from teddybridge.apps.core.models import QRToken
+
+logger = logging.getLogger(__name__)
+
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+QR_BORDER = 2
+QR_BOX_SIZE = 10
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def qr_link_url(request, token):
+    """Frontend URL a patient lands on when scanning the code"""
+    # Use environment variable for frontend URL, fallback to production or localhost
+    frontend_url = os.getenv('FRONTEND_URL', '')
+    if not frontend_url:
+        # In production, use Vercel URL; in development, use localhost
+        if not request.get_host().startswith('localhost') and not request.get_host().startswith('127.0.0.1'):
+            frontend_url = os.getenv('VITE_FRONTEND_URL', 'https://teddy-bridge-ai.vercel.app')
+        else:
+            frontend_url = 'http://localhost:5173'
+    return f"{frontend_url}/link/{token}"
+
+
+def qr_matrix(data):
+    """Module matrix (rows of booleans, quiet zone included) for the given payload"""
+    import qrcode
+    qr = qrcode.QRCode(version=1, border=QR_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def qr_matrices(payloads):
+    """Matrices for many payloads; large batches are spread over a process pool"""
+    if len(payloads) < settings.QR_BATCH_PROCESS_THRESHOLD:
+        return [qr_matrix(data) for data in payloads]
+    chunksize = max(1, len(payloads) // (settings.QR_RENDER_PROCESSES * 4))
+    return list(_get_process_pool().map(qr_matrix, payloads, chunksize=chunksize))
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(max_workers=settings.QR_RENDER_PROCESSES)
+    return _process_pool
+
+
+def _dark_runs(matrix):
+    """Yield (row, start column, length) for each horizontal run of dark modules"""
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            yield y, start, x - start
+
+
+def render_svg(matrix, box_size=QR_BOX_SIZE):
+    """Vector SVG of a matrix: one path with a horizontal segment per run of dark modules"""
+    size = len(matrix) * box_size
+    segments = [
+        f"M{x * box_size},{y * box_size}h{length * box_size}v{box_size}h-{length * box_size}z"
+        for y, x, length in _dark_runs(matrix)
+    ]
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" width="{size}" height="{size}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="#fff"/><path fill="#000" d="{"".join(segments)}"/></svg>'
+    ).encode()
+
+
+def render_png(matrix, box_size=QR_BOX_SIZE):
+    """PNG of a matrix (the format the QR generator page has always used)"""
+    from PIL import Image
+    modules = len(matrix)
+    img = Image.new('1', (modules, modules), 1)
+    img.putdata([0 if dark else 1 for row in matrix for dark in row])
+    img = img.resize((modules * box_size, modules * box_size), Image.NEAREST)
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_qr(token, link_url, fmt='png', expires_at=None):
+    """Rendered image bytes for a token, cached until the token expires"""
+    if fmt not in QR_FORMATS:
+        raise ValueError(f"Unsupported QR format: {fmt}")
+    # The link depends on FRONTEND_URL, so it is part of the key
+    key = f"qr:{fmt}:{token}:{hashlib.sha1(link_url.encode()).hexdigest()[:12]}"
+    image = cache.get(key)
+    if image is None:
+        matrix = qr_matrix(link_url)
+        image = render_svg(matrix) if fmt == 'svg' else render_png(matrix)
+        timeout = int((expires_at - timezone.now()).total_seconds()) if expires_at else settings.QR_TOKEN_TTL_HOURS * 3600
+        if timeout > 0:
+            cache.set(key, image, timeout)
+    return image
+
+
+def qr_data_url(image, fmt):
+    return f"data:{QR_FORMATS[fmt]};base64,{base64.b64encode(image).decode()}"
+
+
+def create_qr_tokens(doctor, count=1):
+    """Mint single-use link tokens for a doctor"""
+    expires_at = timezone.now() + timedelta(hours=settings.QR_TOKEN_TTL_HOURS)
+    return QRToken.objects.bulk_create([
+        QRToken(doctor=doctor, token=secrets.token_urlsafe(32), expires_at=expires_at)
+        for _ in range(count)
+    ])
+
+
+def render_qr_sheet(tokens, link_urls, doctor_name, columns=2, rows=3):
+    """Printable multi-page PDF with one QR card per token, drawn as vector rectangles"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    matrices = qr_matrices(link_urls)
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    page_width, page_height = letter
+    margin = 36
+    cell_width = (page_width - 2 * margin) / columns
+    cell_height = (page_height - 2 * margin) / rows
+    code_size = min(cell_width, cell_height) - 60
+    per_page = columns * rows
+
+    for index, (qr_token, matrix) in enumerate(zip(tokens, matrices)):
+        if index and index % per_page == 0:
+            pdf.showPage()
+        slot = index % per_page
+        cell_x = margin + (slot % columns) * cell_width
+        cell_top = page_height - margin - (slot // columns) * cell_height
+
+        module = code_size / len(matrix)
+        origin_x = cell_x + (cell_width - code_size) / 2
+        origin_y = cell_top - 20 - code_size
+        for y, x, length in _dark_runs(matrix):
+            pdf.rect(origin_x + x * module, origin_y + (len(matrix) - y - 1) * module,
+                     length * module, module, stroke=0, fill=1)
+
+        pdf.setFont('Helvetica-Bold', 11)
+        pdf.drawCentredString(cell_x + cell_width / 2, cell_top - 12, f"Link with Dr. {doctor_name}")
+        pdf.setFont('Helvetica', 8)
+        pdf.drawCentredString(cell_x + cell_width / 2, origin_y - 12,
+                              f"Single use - expires {qr_token.expires_at.strftime('%Y-%m-%d %H:%M')} UTC")
+
+    pdf.save()
+    return buffer.getvalue()
+
+
+def delete_expired_tokens(older_than=None, include_used=False):
+    """Delete tokens that expired before `older_than` (default: now); returns the number removed"""
+    cutoff = older_than or timezone.now()
+    stale = Q(expires_at__lt=cutoff)
+    if include_used:
+        stale |= Q(used=True, created_at__lt=cutoff)
+    deleted, _ = QRToken.objects.filter(stale).delete()
+    return deleted
@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('generate', views.generate_qr),
     path('tokens', views.get_qr_tokens),
+    path('batch', views.generate_qr_batch),
+    path('<str:token>/image', views.get_qr_image),
 ]
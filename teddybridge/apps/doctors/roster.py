@@ -0,0 +1,98 @@
+"""
+The doctor's patient roster (GET /api/doctor/patients).
+
+One page is one query: links are projected with .values(), and the last
+completed visit and unread message count come from correlated subqueries
+backed by the meetings_doctor_patient_visit and chat_messages_unread
+indexes (with sharding on, unread counts are read from the default
+database first). Pages use the same keyset cursors as the appointment lists.
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import Case, Count, DateTimeField, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Lower
+from teddybridge.apps.core.appointments import QueryParamError, paginate, parse_limit
+from teddybridge.apps.core.avatars import avatar_variant
+from teddybridge.apps.core.models import ChatMessage, DoctorPatientLink, Meeting
+from teddybridge.apps.core.sharding import sharding_enabled
+
+# Sort position for patients who have not had a completed visit yet
+NEVER = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# ?sort= value -> (annotated field, descending)
+ROSTER_SORTS = {
+    'linked': ('linked_at', True),
+    'last_visit': ('last_visit', True),
+    'unread': ('unread', True),
+    'name': ('sort_name', False),
+}
+
+ROSTER_FIELDS = (
+    'id', 'linked_at', 'patient_id', 'patient__user_id', 'patient__user__name', 'patient__user__email',
+    'patient__user__avatar_url', 'patient__phone', 'patient__date_of_birth', 'patient__procedure',
+    'last_visit', 'unread', 'sort_name',
+)
+
+
+def roster_links(doctor, user, q=None, procedure=None):
+    """The doctor's patient links annotated with last_visit, unread and sort_name"""
+    last_visit = Meeting.objects.filter(
+        doctor=doctor, patient=OuterRef('patient_id'), status='completed', scheduled_at__isnull=False,
+    ).order_by('-scheduled_at').values('scheduled_at')[:1]
+    if sharding_enabled():
+        # Chat stays on the default database while links live on the doctor's shard,
+        # so a subquery cannot reach it; fold the (few) per-sender counts in as constants
+        counts = ChatMessage.objects.filter(receiver=user, is_read=False).order_by().values_list('sender').annotate(count=Count('id'))
+        unread = Case(
+            *[When(patient__user_id=sender_id, then=Value(count)) for sender_id, count in counts],
+            default=Value(0), output_field=IntegerField(),
+        )
+    else:
+        unread = Coalesce(Subquery(ChatMessage.objects.filter(
+            receiver=user, sender=OuterRef('patient__user_id'), is_read=False,
+        ).order_by().values('sender').annotate(count=Count('id')).values('count'), output_field=IntegerField()), 0)
+
+    links = DoctorPatientLink.objects.filter(doctor=doctor)
+    if q:
+        links = links.filter(Q(patient__user__name__icontains=q) | Q(patient__user__email__icontains=q))
+    if procedure:
+        links = links.filter(patient__procedure__iexact=procedure)
+    return links.annotate(
+        last_visit=Coalesce(Subquery(last_visit, output_field=DateTimeField()), Value(NEVER, output_field=DateTimeField())),
+        unread=unread,
+        sort_name=Lower(Coalesce('patient__user__name', Value(''))),
+    )
+
+
+def roster_rows(doctor, user, q=None, procedure=None):
+    return roster_links(doctor, user, q=q, procedure=procedure).values(*ROSTER_FIELDS)
+
+
+def serialize_roster_row(row):
+    return {
+        'id': str(row['patient_id']),
+        'userId': str(row['patient__user_id']),
+        'name': row['patient__user__name'],
+        'email': row['patient__user__email'],
+        'avatar': avatar_variant(row['patient__user__avatar_url'], 48),
+        'phone': row['patient__phone'],
+        'dateOfBirth': row['patient__date_of_birth'].isoformat() if row['patient__date_of_birth'] else None,
+        'procedure': row['patient__procedure'],
+        'linkedAt': row['linked_at'].isoformat(),
+        'lastVisit': row['last_visit'].isoformat() if row['last_visit'] != NEVER else None,
+        'unreadMessageCount': row['unread'],
+    }
+
+
+def roster_page(params, doctor, user, default_limit):
+    """
+    One serialized roster page for ?q=, ?procedure=, ?sort=, ?limit= and ?cursor=.
+
+    Returns (items, next_cursor); raises QueryParamError for bad parameters.
+    """
+    sort = params.get('sort') or 'linked'
+    if sort not in ROSTER_SORTS:
+        raise QueryParamError(f"Unknown sort: {sort} (expected one of {', '.join(ROSTER_SORTS)})")
+    sort_field, descending = ROSTER_SORTS[sort]
+    rows = roster_rows(doctor, user, q=(params.get('q') or '').strip(), procedure=(params.get('procedure') or '').strip())
+    rows, next_cursor = paginate(rows, sort_field, parse_limit(params, default_limit), params.get('cursor'), descending=descending)
+    return [serialize_roster_row(row) for row in rows], next_cursor
@@ -1,10 +1,14 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.db.models import Count
 from teddybridge.apps.core.models import Doctor, Survey, SurveyResponse
 from teddybridge.apps.core.notifications import create_notification
+from teddybridge.apps.core.sharding import doctor_shard_alias, locate
+from teddybridge.apps.core.versions import conditional_get
 
 @api_view(['GET'])
+@conditional_get('surveys')
 def get_surveys(request):
     if not request.user.is_authenticated:
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -17,7 +21,8 @@ def get_surveys(request):
     except Doctor.DoesNotExist:
         doctor = Doctor.objects.create(user=request.user)
     
-    surveys = Survey.objects.filter(doctor=doctor)
+    # Responses live next to their survey on the doctor's shard, so one grouped query counts them
+    surveys = Survey.objects.using(doctor_shard_alias(doctor.id)).filter(doctor=doctor).annotate(response_count=Count('responses'))
     
     result = [{
         'id': str(s.id),
@@ -26,7 +31,7 @@ def get_surveys(request):
         'questionCount': len(s.questions) if s.questions else 0,
         'isActive': s.is_active,
         'createdAt': s.created_at.isoformat(),
-        'responseCount': SurveyResponse.objects.filter(survey=s).count(),
+        'responseCount': s.response_count,
     } for s in surveys]
     
     return Response(result)
@@ -83,7 +88,7 @@ def create_survey(request):
 @api_view(['GET'])
 def get_survey(request, survey_id):
     try:
-        survey = Survey.objects.select_related('doctor__user').get(id=survey_id)
+        survey = locate(Survey.objects.select_related('doctor__user'), id=survey_id)
         
         return Response({
             'id': str(survey.id),
@@ -112,7 +117,8 @@ def submit_survey_response(request, survey_id):
     answers = request.data.get('answers')
     
     try:
-        survey = Survey.objects.get(id=survey_id)
+        # The survey lives on its doctor's shard; the response goes next to it
+        survey = locate(Survey.objects, id=survey_id)
         SurveyResponse.objects.create(
             survey=survey,
             patient=patient,
@@ -4,6 +4,7 @@ from . import survey_views
 from . import meeting_views
 
 urlpatterns = [
+    path('dashboard', views.doctor_dashboard),
     path('stats', views.doctor_stats),
     path('patients', views.get_patients),
     path('patients/recent', views.get_patients_recent),
@@ -15,8 +16,11 @@ urlpatterns = [
     path('appointments/statistics', views.get_appointment_statistics),
     path('meetings', meeting_views.get_meetings),
     path('notes', meeting_views.get_notes),
+    path('notes/search', meeting_views.search_notes_view),
     path('qr/generate', views.generate_qr),
     path('qr/tokens', views.get_qr_tokens),
+    path('qr/batch', views.generate_qr_batch),
+    path('qr/<str:token>/image', views.get_qr_image),
     path('surveys', survey_views.get_surveys),
     path('surveys/create', survey_views.create_survey),
     path('surveys/<uuid:survey_id>', survey_views.get_survey_detail),
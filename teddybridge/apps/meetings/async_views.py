@@ -0,0 +1,233 @@
+"""
+Async (ASGI) variants of the meeting endpoints that wait on AssemblyAI and Groq.
+
+upload_recording talks to the AssemblyAI REST API over httpx instead of the
+blocking SDK, and both views generate notes with AsyncGroq, so a transcription
+that takes minutes no longer pins a worker. Used instead of the sync views when
+DJANGO_ASYNC_VIEWS is enabled.
+"""
+import asyncio
+import logging
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, HttpResponseNotAllowed
+from django.utils import timezone
+from teddybridge.apps.core.ai_client import get_async_groq_client
+from teddybridge.apps.core.async_views import get_request_user, parse_json_body
+from teddybridge.apps.core.models import Meeting
+from teddybridge.apps.core.sharding import locate
+from teddybridge.apps.core.transcripts import set_meeting_transcript
+from .note_generation import agenerate_call_notes, notes_cache_key
+from .views import (
+    format_speaker_transcript, note_participant_names, save_generated_note,
+    find_cached_note, store_generated_notes, persist_recording,
+    claim_note_generation, release_note_generation, NOTES_PENDING, NOTES_PENDING_RETRY_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+ASSEMBLYAI_BASE_URL = 'https://api.assemblyai.com/v2'
+TRANSCRIPTION_MAX_WAIT = 300  # seconds, same as the sync view
+TRANSCRIPTION_POLL_INTERVAL = 2
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def _read_upload(audio_file):
+    """Stream an uploaded file to httpx without reading it on the event loop"""
+    await sync_to_async(audio_file.seek)(0)
+    while True:
+        chunk = await sync_to_async(audio_file.read)(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def transcribe_with_assemblyai(audio_file, api_key, meeting_id):
+    """Upload audio, request a diarized transcript and poll until it finishes (or times out)"""
+    async with httpx.AsyncClient(
+        base_url=ASSEMBLYAI_BASE_URL,
+        headers={'authorization': api_key},
+        timeout=httpx.Timeout(60.0, connect=10.0)
+    ) as client:
+        upload = await client.post('/upload', content=_read_upload(audio_file))
+        upload.raise_for_status()
+
+        # Configure transcription with speaker diarization to distinguish doctor and patient
+        created = await client.post('/transcript', json={
+            'audio_url': upload.json()['upload_url'],
+            'speaker_labels': True,
+            'speakers_expected': 2,
+            'language_code': 'en',
+        })
+        created.raise_for_status()
+        transcript = created.json()
+        logger.info(f"Transcription started with speaker diarization, ID: {transcript['id']}, status: {transcript['status']}")
+
+        elapsed_time = 0
+        while transcript['status'] in ('queued', 'processing'):
+            if elapsed_time >= TRANSCRIPTION_MAX_WAIT:
+                logger.error(f"Transcription timeout for meeting {meeting_id} after {elapsed_time} seconds")
+                return None
+            await asyncio.sleep(TRANSCRIPTION_POLL_INTERVAL)
+            elapsed_time += TRANSCRIPTION_POLL_INTERVAL
+            polled = await client.get(f"/transcript/{transcript['id']}")
+            polled.raise_for_status()
+            transcript = polled.json()
+            logger.info(f"Transcription status: {transcript['status']}, elapsed: {elapsed_time}s")
+        return transcript
+
+
+async def _save_meeting(meeting):
+    """Save to the shard the meeting was located on"""
+    await sync_to_async(meeting.save)(using=meeting._state.db)
+
+
+async def _complete_meeting(meeting, status):
+    meeting.status = status
+    if not meeting.ended_at:
+        meeting.ended_at = timezone.now()
+    await _save_meeting(meeting)
+
+
+async def upload_recording(request, meeting_id):
+    """Async upload_recording: same form fields and response shape as the sync view"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    user = await get_request_user(request)
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+
+    try:
+        # The meeting can be on any of the user's shards, like in the sync view
+        meeting = await sync_to_async(locate)(Meeting.objects.select_related('doctor__user', 'patient__user'), id=meeting_id)
+    except (Meeting.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Meeting not found'}, status=404)
+
+    # Multipart parsing reads the spooled body from disk, keep it off the loop
+    files = await sync_to_async(lambda: request.FILES)()
+    audio_file = files.get('audio') or files.get('recording')
+
+    if not audio_file:
+        logger.warning(f"No recording file found in request for meeting {meeting_id}")
+        status = 'completed' if meeting.status in ['transcription_pending', 'in_progress'] else meeting.status
+        await _complete_meeting(meeting, status)
+        return JsonResponse({'success': True, 'status': meeting.status, 'message': 'No recording file provided, meeting marked as completed'})
+
+    # Keep the audio so doctors can play it back; transcription reads the same upload
+    await sync_to_async(persist_recording)(request, meeting, audio_file)
+
+    api_key = settings.ASSEMBLYAI_API_KEY
+    if not api_key:
+        logger.warning("ASSEMBLYAI_API_KEY not configured, skipping transcription")
+        await _complete_meeting(meeting, 'completed')
+        return JsonResponse({'success': True, 'message': 'Recording uploaded but transcription skipped (AssemblyAI not configured)'})
+
+    logger.info(f"Starting transcription with AssemblyAI for meeting {meeting_id}, file size: {audio_file.size} bytes")
+
+    try:
+        transcript = await transcribe_with_assemblyai(audio_file, api_key, meeting_id)
+        if transcript is None:
+            meeting.status = 'transcription_failed'
+            await _save_meeting(meeting)
+            return JsonResponse({'success': False, 'error': 'Transcription timeout'}, status=500)
+
+        if transcript['status'] == 'completed':
+            text = transcript.get('text') or ''
+            logger.info(f"Transcription completed for meeting {meeting_id}, text length: {len(text)}")
+
+            utterances = [(u['speaker'], u['text']) for u in transcript['utterances']] if transcript.get('utterances') else None
+            formatted_transcript = format_speaker_transcript(utterances, text)
+
+            await sync_to_async(set_meeting_transcript)(meeting, formatted_transcript)
+            meeting.status = 'transcription_completed'
+            await _save_meeting(meeting)
+
+            groq_client = get_async_groq_client()
+            if groq_client:
+                logger.info("Generating AI notes with Groq using speaker-labeled transcript...")
+                doctor_name, patient_name = note_participant_names(meeting)
+                try:
+                    result = await agenerate_call_notes(
+                        groq_client,
+                        formatted_transcript,
+                        style='speaker',
+                        doctor_name=doctor_name,
+                        patient_name=patient_name
+                    )
+                    await sync_to_async(save_generated_note)(meeting, result, formatted_transcript, text, utterances is not None)
+                except Exception as groq_err:
+                    logger.error(f"Error generating AI notes with Groq: {str(groq_err)}")
+                    # Still mark as completed even if AI fails
+                    meeting.status = 'completed'
+                    await _save_meeting(meeting)
+            else:
+                logger.warning("Groq client not available, skipping AI note generation")
+                meeting.status = 'completed'
+                await _save_meeting(meeting)
+        else:
+            logger.error(f"Transcription failed for meeting {meeting_id}: {transcript.get('error') or transcript['status']}")
+            meeting.status = 'transcription_failed'
+            await _save_meeting(meeting)
+    except Exception as transcribe_err:
+        logger.error(f"Error during transcription: {str(transcribe_err)}")
+        meeting.status = 'transcription_failed'
+        await _save_meeting(meeting)
+
+    # Ensure ended_at is set
+    if not meeting.ended_at:
+        meeting.ended_at = timezone.now()
+        await _save_meeting(meeting)
+
+    logger.info(f"Meeting {meeting_id} upload_recording endpoint completed, status: {meeting.status}")
+    return JsonResponse({'success': True, 'status': meeting.status})
+
+
+async def generate_notes(request):
+    """Async generate_notes: cache lookup and storage are shared with the sync view"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    user = await get_request_user(request)
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+
+    if user.role != 'doctor':
+        return JsonResponse({'error': 'Only doctors can generate notes'}, status=403)
+
+    try:
+        body = parse_json_body(request)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid request format'}, status=400)
+    meeting_id = body.get('meeting_id')
+    transcript = body.get('transcript')
+
+    try:
+        meeting = await Meeting.objects.aget(id=meeting_id, doctor__user=user)
+    except (Meeting.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Meeting not found'}, status=404)
+
+    # Identical transcript + prompt version + model: return the note we already paid for
+    cache_key = notes_cache_key(transcript, style='markdown')
+    cached = await sync_to_async(find_cached_note)(meeting, cache_key)
+    if cached:
+        return JsonResponse(cached)
+
+    groq_client = get_async_groq_client()
+    if not groq_client:
+        return JsonResponse({'error': 'AI service not configured'}, status=503)
+
+    # An identical request is already paying for this note: the client retries and gets it from the cache
+    if not await sync_to_async(claim_note_generation)(meeting, cache_key):
+        response = JsonResponse(NOTES_PENDING, status=202)
+        response['Retry-After'] = str(NOTES_PENDING_RETRY_SECONDS)
+        return response
+
+    try:
+        result = await agenerate_call_notes(groq_client, transcript, style='markdown')
+        return JsonResponse(await sync_to_async(store_generated_notes)(meeting, result, cache_key))
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    finally:
+        await sync_to_async(release_note_generation)(meeting, cache_key)
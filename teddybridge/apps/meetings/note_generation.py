@@ -0,0 +1,403 @@
+"""
+Clinical note generation from consultation transcripts.
+
+Short transcripts are summarized in a single Groq call. Long ones (hour-long
+visits) would overflow the context window or take a long time in one serial
+call, so they go through a map-reduce pipeline instead: the transcript is split
+on utterance boundaries, findings are extracted from each chunk in parallel
+over a bounded thread pool, and a final reduce call merges them into the
+CallNote schema. agenerate_call_notes runs the same pipeline on AsyncGroq for
+the ASGI views.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from teddybridge.apps.core.ai_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+NOTES_MODEL = "openai/gpt-oss-120b"
+
+# Bump whenever a prompt or the merge logic changes so cached notes are not reused
+NOTES_PROMPT_VERSION = 1
+
+# JSON keys returned by the model -> CallNote fields
+NOTE_FIELDS = {
+    'chiefComplaint': 'chief_complaint',
+    'hpi': 'hpi',
+    'pastMedicalHistory': 'past_medical_history',
+    'medications': 'medications',
+    'allergies': 'allergies',
+    'examObservations': 'exam_observations',
+    'assessment': 'assessment',
+    'plan': 'plan',
+    'urgentFlags': 'urgent_flags',
+    'followUpQuestions': 'follow_up_questions',
+}
+LIST_FIELDS = ('urgentFlags', 'followUpQuestions')
+
+SPEAKER_SCHEMA = """{
+  "chiefComplaint": "Main reason for visit (from patient's statements)",
+  "hpi": "History of present illness (from patient's description and doctor's questions)",
+  "pastMedicalHistory": "Past medical conditions mentioned by patient",
+  "medications": "Current medications mentioned by patient",
+  "allergies": "Known allergies mentioned by patient",
+  "examObservations": "Physical examination findings mentioned by doctor",
+  "assessment": "Clinical assessment and diagnosis from doctor",
+  "plan": "Treatment plan, tests ordered, prescriptions, and follow-up instructions from doctor",
+  "urgentFlags": ["Any urgent issues that need immediate attention"],
+  "followUpQuestions": ["3 short follow-up questions for the patient"]
+}"""
+
+MARKDOWN_SCHEMA = """{
+  "chiefComplaint": "...",
+  "hpi": "...",
+  "pastMedicalHistory": "...",
+  "medications": "...",
+  "allergies": "...",
+  "examObservations": "...",
+  "assessment": "...",
+  "plan": "...",
+  "urgentFlags": [...],
+  "followUpQuestions": [...]
+}"""
+
+SPEAKER_INSTRUCTIONS = """CRITICAL INSTRUCTIONS:
+- Extract information from BOTH patient responses AND doctor questions/observations
+- Do NOT hallucinate medications or tests - only include what was actually mentioned
+- If something is uncertain, mark it as "uncertain" or "not mentioned"
+- Keep all fields brief and factual
+- The patient's statements contain their symptoms and history
+- The doctor's statements contain observations, assessments, and treatment plans"""
+
+MARKDOWN_INSTRUCTIONS = """IMPORTANT:
+- Use markdown formatting (not HTML) for text fields
+- Use **bold** for emphasis, not HTML tags
+- Use newlines and markdown lists, not <br> or HTML entities
+- Use markdown tables for structured data
+- Do NOT use HTML tags like <br>, &nbsp;, etc."""
+
+MAP_PROMPT = """You are a clinical summarization assistant. Below is part {index} of {total} of a medical consultation transcript.
+{speaker_hint}
+Extract every clinically relevant finding stated in THIS PART ONLY. Do not guess about the rest of the visit.
+
+Transcript part:
+{chunk}
+
+Return ONLY valid JSON (no markdown) with these keys, leaving a field empty ("" or []) when this part does not mention it:
+{schema}
+
+- Do NOT hallucinate medications or tests - only include what was actually mentioned
+- Keep all fields brief and factual"""
+
+REDUCE_PROMPT = """You are a clinical summarization assistant. A long medical consultation transcript was split into {total} consecutive parts and findings were extracted from each part. Merge them into one set of clinical notes for the whole visit.
+{speaker_hint}
+Findings per part, in chronological order:
+{findings}
+
+Merge rules:
+- Combine and de-duplicate information across parts; later parts may refine or correct earlier ones
+- Keep only what appears in the findings, never add new facts
+- "followUpQuestions" should contain the 3 most useful questions
+
+Provide a JSON object with the following structure (return ONLY valid JSON, no markdown):
+{schema}
+
+{instructions}"""
+
+
+def _speaker_hint(doctor_name, patient_name):
+    return f"""
+IMPORTANT: This transcript contains a TWO-WAY conversation between a doctor and patient. The transcript includes speaker labels (Speaker A, Speaker B, etc.).
+- Speaker A is typically the {doctor_name} (doctor)
+- Speaker B is typically the {patient_name} (patient)
+"""
+
+
+def build_speaker_prompt(transcript, doctor_name, patient_name):
+    """Single-shot prompt for speaker-labelled transcripts from AssemblyAI"""
+    return f"""You are a clinical summarization assistant. Analyze this medical consultation transcript and extract structured clinical notes.
+{_speaker_hint(doctor_name, patient_name)}
+Focus on extracting information from BOTH the patient's statements (chief complaint, symptoms, history) AND the doctor's observations and assessments.
+
+Transcript with speaker labels:
+{transcript}
+
+Provide a JSON object with the following structure (return ONLY valid JSON, no markdown):
+{SPEAKER_SCHEMA}
+
+{SPEAKER_INSTRUCTIONS}"""
+
+
+def build_markdown_prompt(transcript):
+    """Single-shot prompt for transcripts posted to generate_notes"""
+    return f"""Analyze this medical consultation transcript and extract structured clinical notes. Return the response in valid JSON format with the following structure:
+
+{MARKDOWN_SCHEMA}
+
+{MARKDOWN_INSTRUCTIONS}
+
+Transcript:
+{transcript}
+
+Return ONLY valid JSON, no additional text or markdown code blocks."""
+
+
+def parse_notes_json(ai_response):
+    """Parse the model's JSON answer, tolerating ```json fences (raises json.JSONDecodeError)"""
+    cleaned = re.sub(r'```json\s*', '', ai_response or '')
+    cleaned = re.sub(r'```\s*$', '', cleaned).strip()
+    return json.loads(cleaned)
+
+
+def call_note_fields(notes_data):
+    """Map parsed notes onto CallNote model field kwargs"""
+    return {
+        field: notes_data.get(key, [] if key in LIST_FIELDS else '')
+        for key, field in NOTE_FIELDS.items()
+    }
+
+
+def _split_long_utterance(text, max_tokens):
+    """Split a single oversized utterance (or an undiarized transcript) on sentence boundaries"""
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    pieces, current = [], ''
+    for sentence in sentences:
+        candidate = f"{current} {sentence}".strip()
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_transcript(transcript, max_tokens):
+    """Split a transcript into chunks of at most max_tokens, never cutting an utterance in half"""
+    utterances = []
+    for line in transcript.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if estimate_tokens(line) > max_tokens:
+            utterances.extend(_split_long_utterance(line, max_tokens))
+        else:
+            utterances.append(line)
+
+    chunks, current, current_tokens = [], [], 0
+    for utterance in utterances:
+        tokens = estimate_tokens(utterance)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(utterance)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def notes_cache_key(transcript, style='markdown'):
+    """Content address of a note: same transcript, prompt version, style and model give the same note"""
+    material = f"{NOTES_PROMPT_VERSION}:{NOTES_MODEL}:{style}:{transcript or ''}"
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _add_usage(total, usage):
+    total['prompt_tokens'] += usage['prompt_tokens']
+    total['completion_tokens'] += usage['completion_tokens']
+    total['calls'] += usage['calls']
+    return total
+
+
+def _completion_kwargs(prompt, max_tokens):
+    return {
+        'model': NOTES_MODEL,
+        'messages': [{"role": "user", "content": prompt}],
+        'temperature': 0.3,
+        'max_tokens': max_tokens,
+    }
+
+
+def _completion_result(response, prompt):
+    text = (response.choices[0].message.content or '').strip()
+    usage = getattr(response, 'usage', None)
+    return text, {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', None) or estimate_tokens(prompt),
+        'completion_tokens': getattr(usage, 'completion_tokens', None) or estimate_tokens(text),
+        'calls': 1,
+    }
+
+
+def _complete(groq_client, prompt, max_tokens):
+    response = groq_client.chat.completions.create(**_completion_kwargs(prompt, max_tokens))
+    return _completion_result(response, prompt)
+
+
+async def _acomplete(async_groq_client, prompt, max_tokens):
+    response = await async_groq_client.chat.completions.create(**_completion_kwargs(prompt, max_tokens))
+    return _completion_result(response, prompt)
+
+
+def _map_prompt(chunk, index, total, speaker_hint):
+    return MAP_PROMPT.format(
+        index=index,
+        total=total,
+        speaker_hint=speaker_hint,
+        chunk=chunk,
+        schema=MARKDOWN_SCHEMA,
+    )
+
+
+def _chunk_findings(ai_response, index, total):
+    try:
+        return parse_notes_json(ai_response)
+    except json.JSONDecodeError:
+        # Keep the raw text; the reduce step can still read it
+        logger.warning(f"Chunk {index}/{total} findings were not valid JSON, passing raw text to reduce")
+        return {'raw': ai_response}
+
+
+def _reduce_prompt(findings, plan):
+    findings_text = "\n\n".join(
+        f"Part {index}:\n{json.dumps(finding, ensure_ascii=False)}"
+        for index, finding in enumerate(findings, start=1)
+    )
+    return REDUCE_PROMPT.format(
+        total=len(findings),
+        speaker_hint=plan['speaker_hint'],
+        findings=findings_text,
+        schema=plan['schema'],
+        instructions=plan['instructions'],
+    )
+
+
+def _extract_chunk_findings(groq_client, chunk, index, total, speaker_hint):
+    ai_response, usage = _complete(groq_client, _map_prompt(chunk, index, total, speaker_hint), settings.NOTES_MAP_MAX_TOKENS)
+    return _chunk_findings(ai_response, index, total), usage
+
+
+def _map_reduce_notes(groq_client, chunks, plan):
+    total = len(chunks)
+    workers = max(1, min(settings.NOTES_MAP_WORKERS, total))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notes-map') as executor:
+        futures = [
+            executor.submit(_extract_chunk_findings, groq_client, chunk, index, total, plan['speaker_hint'])
+            for index, chunk in enumerate(chunks, start=1)
+        ]
+        results = [future.result() for future in futures]
+
+    total_usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'calls': 0}
+    for _, usage in results:
+        _add_usage(total_usage, usage)
+    ai_response, usage = _complete(groq_client, _reduce_prompt([finding for finding, _ in results], plan), plan['max_tokens'])
+    return ai_response, _add_usage(total_usage, usage)
+
+
+async def _amap_reduce_notes(async_groq_client, chunks, plan):
+    total = len(chunks)
+    # Same concurrency bound as the thread pool, without tying up a thread per call
+    semaphore = asyncio.Semaphore(max(1, settings.NOTES_MAP_WORKERS))
+
+    async def extract(chunk, index):
+        async with semaphore:
+            ai_response, usage = await _acomplete(
+                async_groq_client, _map_prompt(chunk, index, total, plan['speaker_hint']), settings.NOTES_MAP_MAX_TOKENS
+            )
+        return _chunk_findings(ai_response, index, total), usage
+
+    results = await asyncio.gather(*(extract(chunk, index) for index, chunk in enumerate(chunks, start=1)))
+
+    total_usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'calls': 0}
+    for _, usage in results:
+        _add_usage(total_usage, usage)
+    ai_response, usage = await _acomplete(async_groq_client, _reduce_prompt([finding for finding, _ in results], plan), plan['max_tokens'])
+    return ai_response, _add_usage(total_usage, usage)
+
+
+def _prompt_plan(transcript, style, doctor_name, patient_name):
+    """Pick prompts for the style and decide between single-shot and map-reduce"""
+    if style == 'speaker':
+        plan = {
+            'single_prompt': build_speaker_prompt(transcript, doctor_name, patient_name),
+            'speaker_hint': _speaker_hint(doctor_name, patient_name),
+            'schema': SPEAKER_SCHEMA,
+            'instructions': SPEAKER_INSTRUCTIONS,
+            'max_tokens': 2000,
+        }
+    else:
+        plan = {
+            'single_prompt': build_markdown_prompt(transcript),
+            'speaker_hint': '',
+            'schema': MARKDOWN_SCHEMA,
+            'instructions': MARKDOWN_INSTRUCTIONS,
+            'max_tokens': 3000,
+        }
+
+    plan['transcript_tokens'] = estimate_tokens(transcript)
+    if estimate_tokens(plan['single_prompt']) <= settings.NOTES_SINGLE_SHOT_TOKEN_LIMIT:
+        plan['strategy'] = 'single_shot'
+        plan['chunks'] = None
+    else:
+        plan['strategy'] = 'map_reduce'
+        plan['chunks'] = split_transcript(transcript, settings.NOTES_CHUNK_TOKENS)
+        logger.info(f"Transcript is ~{plan['transcript_tokens']} tokens, generating notes with map-reduce over {len(plan['chunks'])} chunks")
+    return plan
+
+
+def _notes_result(ai_response, plan, usage):
+    logger.info(f"AI notes response received ({plan['strategy']}), length: {len(ai_response)}")
+
+    result = {
+        'raw_response': ai_response,
+        'notes': None,
+        'strategy': plan['strategy'],
+        'chunks': len(plan['chunks']) if plan['chunks'] else 1,
+        'transcript_tokens': plan['transcript_tokens'],
+        'usage': usage,
+        'error': None,
+    }
+    try:
+        notes = parse_notes_json(ai_response)
+        if not isinstance(notes, dict):
+            raise json.JSONDecodeError('Expected a JSON object', ai_response, 0)
+        result['notes'] = notes
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Failed to parse AI response as JSON: {json_err}")
+        logger.error(f"AI response was: {ai_response[:500]}")
+        result['error'] = str(json_err)
+    return result
+
+
+def generate_call_notes(groq_client, transcript, style='markdown', doctor_name='Doctor', patient_name='Patient'):
+    """
+    Generate structured clinical notes for a transcript.
+
+    style is 'speaker' for diarized AssemblyAI transcripts and 'markdown' for
+    transcripts posted by the client. Returns a dict with the raw model
+    response, the parsed notes (None when the answer was not valid JSON), the
+    strategy used, the chunk count and the token usage summed over all calls.
+    Groq errors propagate to the caller.
+    """
+    plan = _prompt_plan(transcript, style, doctor_name, patient_name)
+    if plan['strategy'] == 'single_shot':
+        ai_response, usage = _complete(groq_client, plan['single_prompt'], plan['max_tokens'])
+    else:
+        ai_response, usage = _map_reduce_notes(groq_client, plan['chunks'], plan)
+    return _notes_result(ai_response, plan, usage)
+
+
+async def agenerate_call_notes(async_groq_client, transcript, style='markdown', doctor_name='Doctor', patient_name='Patient'):
+    """Async variant of generate_call_notes for the ASGI views (takes an AsyncGroq client)"""
+    plan = _prompt_plan(transcript, style, doctor_name, patient_name)
+    if plan['strategy'] == 'single_shot':
+        ai_response, usage = await _acomplete(async_groq_client, plan['single_prompt'], plan['max_tokens'])
+    else:
+        ai_response, usage = await _amap_reduce_notes(async_groq_client, plan['chunks'], plan)
+    return _notes_result(ai_response, plan, usage)
@@ -0,0 +1,182 @@
+"""
+Daily.co room provisioning.
+
+HTTP calls share one pooled requests.Session and run on a bounded thread
+pool. Each call has a timeout and retries with exponential backoff on
+connection errors, 429 and 5xx responses. Room URLs are written back with
+batched bulk_update calls from the calling thread, so worker threads never
+touch the database. The API base URL is a setting, so the service can be
+pointed at a local stub server.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.db import close_old_connections
+from teddybridge.apps.core.models import Meeting
+from teddybridge.apps.core.sharding import current_shards, use_shard
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30
+
+ROOM_PROPERTIES = {
+    'enable_screenshare': True,
+    'enable_chat': True,
+    'start_video_off': False,
+    'start_audio_off': False
+}
+
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+# Pre-provisioning for newly created meetings runs off the request thread
+_provision_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='room-provision')
+
+
+class RoomProvisioningError(Exception):
+    pass
+
+
+def get_daily_session(workers=None):
+    """
+    Shared Session with a connection per provisioning worker.
+
+    A caller with more workers than the current pool (fix_meeting_rooms
+    --workers) gets a larger replacement; threads still holding the old
+    session finish on it.
+    """
+    global _session, _session_pool_size
+    pool_size = max(workers or 0, settings.DAILY_PROVISION_WORKERS)
+    if _session is None or _session_pool_size < pool_size:
+        with _session_lock:
+            if _session is None or _session_pool_size < pool_size:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session, _session_pool_size = session, pool_size
+    return _session
+
+
+def _backoff_delay(attempt, response=None):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    # Full jitter keeps parallel workers from retrying in lockstep
+    return random.uniform(0, min(BACKOFF_BASE_SECONDS * (2 ** attempt), BACKOFF_MAX_SECONDS))
+
+
+def daily_request(method, path, api_key, session=None, **kwargs):
+    """Call the Daily.co API, retrying transient failures; returns the final response"""
+    import requests
+    session = session or get_daily_session()
+    url = f"{settings.DAILY_API_BASE_URL.rstrip('/')}{path}"
+    headers = {'Authorization': f'Bearer {api_key}'}
+    max_retries = settings.DAILY_MAX_RETRIES
+
+    for attempt in range(max_retries + 1):
+        response = None
+        try:
+            response = session.request(method, url, headers=headers, timeout=settings.DAILY_REQUEST_TIMEOUT, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            error = f"HTTP {response.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = str(e)
+
+        if attempt == max_retries:
+            if response is not None:
+                return response
+            raise RoomProvisioningError(f"{method} {path} failed after {attempt + 1} attempts: {error}")
+
+        delay = _backoff_delay(attempt, response)
+        logger.warning(f"Daily.co {method} {path} failed ({error}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+
+def provision_room(room_name, api_key, session=None):
+    """Create the Daily.co room for a meeting (or fetch it if it already exists) and return its URL"""
+    response = daily_request('POST', '/rooms', api_key, session=session, json={
+        'name': room_name,
+        'privacy': 'public',
+        'properties': ROOM_PROPERTIES
+    })
+    if response.status_code == 400 and 'already exists' in response.text:
+        response = daily_request('GET', f'/rooms/{room_name}', api_key, session=session)
+
+    if response.status_code != 200:
+        raise RoomProvisioningError(f"{response.status_code} - {response.text[:200]}")
+    room_url = response.json().get('url')
+    if not room_url:
+        raise RoomProvisioningError('Response did not include a room URL')
+    return room_url
+
+
+def provision_rooms(meetings, api_key=None, workers=None, batch_size=None):
+    """
+    Provision rooms for meetings concurrently and save their daily_room_url.
+
+    Returns (provisioned, failures) where failures maps meeting id to an error message.
+    """
+    api_key = api_key or settings.DAILY_API_KEY
+    if not api_key:
+        raise RoomProvisioningError('DAILY_API_KEY not configured')
+    workers = workers or settings.DAILY_PROVISION_WORKERS
+    batch_size = batch_size or settings.DAILY_PROVISION_BATCH_SIZE
+
+    session = get_daily_session(workers)
+    provisioned = 0
+    failures = {}
+    pending = []
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='daily-rooms') as executor:
+        futures = {executor.submit(provision_room, str(meeting.id), api_key, session): meeting for meeting in meetings}
+        for future in as_completed(futures):
+            meeting = futures[future]
+            try:
+                meeting.daily_room_url = future.result()
+            except Exception as e:
+                failures[meeting.id] = str(e)
+                logger.error(f"Failed to provision Daily.co room for meeting {meeting.id}: {str(e)}")
+                continue
+            pending.append(meeting)
+            if len(pending) >= batch_size:
+                Meeting.objects.bulk_update(pending, ['daily_room_url'])
+                provisioned += len(pending)
+                pending = []
+
+    if pending:
+        Meeting.objects.bulk_update(pending, ['daily_room_url'])
+        provisioned += len(pending)
+    return provisioned, failures
+
+
+def _provision_in_background(meeting_ids, shard):
+    close_old_connections()
+    try:
+        with use_shard(shard):
+            meetings = list(Meeting.objects.filter(id__in=meeting_ids, daily_room_url__isnull=True).only('id', 'daily_room_url'))
+            if meetings:
+                provision_rooms(meetings)
+    except Exception as e:
+        logger.error(f"Background room provisioning failed for {meeting_ids}: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def provision_rooms_in_background(meeting_ids):
+    """Queue room provisioning for new meetings; a no-op when Daily.co is not configured"""
+    if settings.DAILY_API_KEY and meeting_ids:
+        # Worker threads do not inherit the request's shard
+        _provision_executor.submit(_provision_in_background, list(meeting_ids), current_shards()[0])
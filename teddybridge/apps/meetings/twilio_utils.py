@@ -1,23 +1,39 @@
-from twilio.jwt.access_token import AccessToken
-from twilio.jwt.access_token.grants import VideoGrant
-import os
+"""
+Twilio Video access tokens.
+
+Credentials are read and validated once per process. Each (room, identity)
+token is minted once and cached until shortly before it expires, so page
+loads and reconnects reuse it instead of signing a new JWT each time.
+Identities are stable per user: when a user reconnects, Twilio replaces their
+previous connection instead of leaving a ghost participant in the room.
+"""
+import functools
+import hashlib
 import logging
 import re
 import time
-import uuid
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
-def generate_twilio_token(room_name, identity):
+TwilioCredentials = namedtuple('TwilioCredentials', ['account_sid', 'api_key', 'api_secret'])
+
+TOKEN_CACHE_PREFIX = 'twilio:token'
+
+
+@functools.lru_cache(maxsize=1)
+def get_twilio_credentials():
     """
-    Generate a Twilio access token for video calls.
-    
-    Returns None if Twilio credentials are not configured.
+    Load and validate Twilio credentials from settings (once per process).
+
+    Returns None if they are missing or malformed.
     """
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-    api_key = os.getenv('TWILIO_API_KEY')
-    api_secret = os.getenv('TWILIO_API_SECRET')
-    
+    account_sid = settings.TWILIO_ACCOUNT_SID
+    api_key = settings.TWILIO_API_KEY
+    api_secret = settings.TWILIO_API_SECRET
+
     # Check if all required credentials are present
     if not account_sid or not api_key or not api_secret:
         logger.warning(
@@ -25,49 +41,97 @@ def generate_twilio_token(room_name, identity):
             "Set TWILIO_ACCOUNT_SID, TWILIO_API_KEY, and TWILIO_API_SECRET environment variables."
         )
         return None
-    
-    # Sanitize identity: Twilio only allows alphanumeric and underscore characters
-    # Replace invalid characters with underscores
-    sanitized_identity = re.sub(r'[^a-zA-Z0-9_]', '_', str(identity))
-    
-    # Ensure identity is not empty and not too long (max 128 chars)
-    if not sanitized_identity:
-        sanitized_identity = 'user_' + str(hash(identity))[:20]
-    
-    # Add timestamp and UUID suffix to make identity unique per connection
-    # This prevents "duplicate identity" errors when the same user tries to reconnect
-    timestamp = str(int(time.time() * 1000))[-8:]  # Last 8 digits of timestamp
-    unique_id = str(uuid.uuid4())[:8]  # First 8 characters of UUID
-    sanitized_identity = f"{sanitized_identity}_{timestamp}_{unique_id}"
-    
-    # Truncate to 128 chars max (Twilio limit)
-    sanitized_identity = sanitized_identity[:128]
-    
-    try:
-        # Log credential presence (without exposing secrets)
-        logger.info(f"Generating Twilio token for room: {room_name}, identity: {sanitized_identity}")
-        logger.info(f"Account SID present: {bool(account_sid)}, API Key present: {bool(api_key)}, API Secret present: {bool(api_secret)}")
-        
-        # Validate Account SID format (should start with AC)
-        if account_sid and not account_sid.startswith('AC'):
-            logger.error(f"Invalid Account SID format: {account_sid[:10]}... (should start with AC)")
-            return None
-        
-        # Validate API Key format (should start with SK)
-        if api_key and not api_key.startswith('SK'):
-            logger.error(f"Invalid API Key format: {api_key[:10]}... (should start with SK)")
-            return None
-        
-        token = AccessToken(account_sid, api_key, api_secret, identity=sanitized_identity)
-        video_grant = VideoGrant(room=room_name)
-        token.add_grant(video_grant)
-        
-        jwt_token = token.to_jwt()
-        logger.info(f"Twilio token generated successfully (length: {len(jwt_token)})")
-        return jwt_token
-    except Exception as e:
-        logger.error(f"Failed to generate Twilio token: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+
+    # Validate Account SID format (should start with AC)
+    if not account_sid.startswith('AC'):
+        logger.error(f"Invalid Account SID format: {account_sid[:10]}... (should start with AC)")
+        return None
+
+    # Validate API Key format (should start with SK)
+    if not api_key.startswith('SK'):
+        logger.error(f"Invalid API Key format: {api_key[:10]}... (should start with SK)")
+        return None
+
+    return TwilioCredentials(account_sid, api_key, api_secret)
+
+
+def participant_identity(identity):
+    """
+    Stable Twilio identity for a user (e.g. their email).
+
+    Twilio only allows alphanumeric and underscore characters, up to 128 chars.
+    A short digest of the raw value keeps identities that sanitize to the same
+    string (a.b@x vs a_b@x) distinct.
+    """
+    raw = str(identity)
+    digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]
+    sanitized = re.sub(r'[^a-zA-Z0-9_]', '_', raw)[:110] or 'user'
+    return f"{sanitized}_{digest}"
+
+
+def _token_cache_key(room_name, identity):
+    return f"{TOKEN_CACHE_PREFIX}:{room_name}:{identity}"
+
+
+def _mint_token(credentials, room_name, identity):
+    # Imported here so workers don't load the Twilio SDK until a call is joined
+    from twilio.jwt.access_token import AccessToken
+    from twilio.jwt.access_token.grants import VideoGrant
+
+    token = AccessToken(
+        credentials.account_sid,
+        credentials.api_key,
+        credentials.api_secret,
+        identity=identity,
+        ttl=settings.TWILIO_TOKEN_TTL
+    )
+    token.add_grant(VideoGrant(room=room_name))
+    return {
+        'token': token.to_jwt(),
+        'identity': identity,
+        'expires_at': int(time.time()) + settings.TWILIO_TOKEN_TTL,
+    }
+
+
+def get_room_tokens(room_names, identity):
+    """
+    Return {room_name: {'token', 'identity', 'expires_at'}} for one user.
+
+    Cached tokens are reused while they have more than TWILIO_TOKEN_REFRESH_MARGIN
+    seconds left; the rest are minted and cached in a single round trip.
+    Returns None if Twilio credentials are not configured.
+    """
+    credentials = get_twilio_credentials()
+    if credentials is None:
+        return None
+
+    identity = participant_identity(identity)
+    keys = {_token_cache_key(room_name, identity): room_name for room_name in room_names}
+    found = cache.get_many(list(keys))
+    tokens = {keys[key]: entry for key, entry in found.items()}
+
+    missing = [room_name for room_name in room_names if room_name not in tokens]
+    if missing:
+        timeout = max(settings.TWILIO_TOKEN_TTL - settings.TWILIO_TOKEN_REFRESH_MARGIN, 0)
+        minted = {}
+        for room_name in missing:
+            try:
+                tokens[room_name] = minted[_token_cache_key(room_name, identity)] = _mint_token(credentials, room_name, identity)
+            except Exception as e:
+                logger.error(f"Failed to generate Twilio token for room {room_name}: {str(e)}")
+        if minted and timeout:
+            cache.set_many(minted, timeout)
+        logger.debug(f"Minted {len(minted)} Twilio token(s) for {identity}, {len(found)} served from cache")
+    return tokens
+
+
+def generate_twilio_token(room_name, identity):
+    """
+    Get a Twilio access token for video calls.
+
+    Returns None if Twilio credentials are not configured or minting failed.
+    """
+    tokens = get_room_tokens([room_name], identity)
+    if not tokens or room_name not in tokens:
         return None
+    return tokens[room_name]['token']
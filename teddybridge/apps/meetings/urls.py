@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    from . import async_views as transcription_views
+else:
+    transcription_views = views
+
 urlpatterns = [
     path('', views.create_meeting),
+    path('/tokens/prefetch', views.prefetch_meeting_tokens),
     path('/<uuid:meeting_id>', views.get_meeting),
     path('/<uuid:meeting_id>/delete', views.delete_meeting),
     path('/<uuid:meeting_id>/reschedule', views.reschedule_meeting),
@@ -10,7 +17,8 @@ urlpatterns = [
     path('/<uuid:meeting_id>/startRecording', views.start_recording),
     path('/<uuid:meeting_id>/stopRecording', views.stop_recording),
     path('/<uuid:meeting_id>/endMeeting', views.end_meeting),
-    path('/<uuid:meeting_id>/uploadRecording', views.upload_recording),
+    path('/<uuid:meeting_id>/uploadRecording', transcription_views.upload_recording),
+    path('/<uuid:meeting_id>/recording', views.get_recording),
     path('/<uuid:meeting_id>/participant-event', views.participant_event),
-    path('/notes/generate', views.generate_notes),
+    path('/notes/generate', transcription_views.generate_notes),
 ]
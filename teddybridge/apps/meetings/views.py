@@ -1,21 +1,33 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from django.utils import timezone
-from groq import Groq
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from datetime import timedelta
 import os
 import logging
+from teddybridge.apps.core.ai_client import get_groq_client
 from teddybridge.apps.core.models import Meeting, Doctor, Patient, RecordingConsent, CallNote
 from teddybridge.apps.core.notifications import create_notification
-from .twilio_utils import generate_twilio_token
+from teddybridge.apps.core.sharding import locate
+from teddybridge.apps.core.storage import get_media_storage, store_recording
+from teddybridge.apps.core.transcripts import set_meeting_transcript, store_text
+from .room_provisioning import provision_rooms_in_background
+from .twilio_utils import generate_twilio_token, get_room_tokens
+from .note_generation import (
+    generate_call_notes, call_note_fields, notes_cache_key, NOTES_MODEL, NOTES_PROMPT_VERSION
+)
 
 logger = logging.getLogger(__name__)
 
-def get_groq_client():
-    if settings.GROQ_API_KEY:
-        return Groq(api_key=settings.GROQ_API_KEY)
-    return None
+NOTES_LOCK_KEY = 'notes-generating:{meeting_id}:{cache_key}'
+NOTES_LOCK_SECONDS = 180  # Longer than a map-reduce generation; expires if the worker dies
+NOTES_PENDING_RETRY_SECONDS = 5  # Retry-After for an identical request while the first one generates
+NOTES_PENDING = {'success': False, 'pending': True, 'message': 'These notes are already being generated; retry shortly'}
 
 @api_view(['POST'])
 def create_meeting(request):
@@ -58,6 +70,10 @@ def create_meeting(request):
         status=status
     )
     
+    # Scheduled calls get their room ahead of time instead of when someone joins
+    if status == 'scheduled':
+        transaction.on_commit(lambda: provision_rooms_in_background([meeting.id]))
+    
     # Create notification for the other party
     if request.user.role == 'doctor':
         notification_user = patient.user
@@ -89,7 +105,7 @@ def delete_meeting(request, meeting_id):
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
     try:
-        meeting = Meeting.objects.get(id=meeting_id)
+        meeting = locate(Meeting.objects, id=meeting_id)
         
         if request.user.role == 'doctor' and meeting.doctor.user != request.user:
             return Response({'error': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
@@ -105,7 +121,7 @@ def reschedule_meeting(request, meeting_id):
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
     try:
-        meeting = Meeting.objects.get(id=meeting_id)
+        meeting = locate(Meeting.objects, id=meeting_id)
         
         if request.user.role == 'doctor' and meeting.doctor.user != request.user:
             return Response({'error': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
@@ -129,7 +145,7 @@ def reschedule_meeting(request, meeting_id):
         
         return Response({
             'success': True,
-            'scheduledAt': meeting.scheduled_at.isoformat()
+            'scheduledAt': meeting.scheduled_at if isinstance(meeting.scheduled_at, str) else meeting.scheduled_at.isoformat()
         })
     except Meeting.DoesNotExist:
         return Response({'error': 'Meeting not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -140,7 +156,7 @@ def get_meeting(request, meeting_id):
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
     try:
-        meeting = Meeting.objects.select_related('doctor__user', 'patient__user').get(id=meeting_id)
+        meeting = locate(Meeting.objects.select_related('doctor__user', 'patient__user'), id=meeting_id)
         
         consent = RecordingConsent.objects.filter(meeting=meeting, user=request.user).first()
         
@@ -172,6 +188,7 @@ def get_meeting(request, meeting_id):
                 'roomName': room_name,
                 'meetingType': meeting_type,
                 'recordingEnabled': recording_enabled,
+                'recordingUrl': meeting.recording_url if meeting.recording_path else None,
             })
         
         logger.info(f"Twilio token generated successfully for meeting {meeting.id}")
@@ -196,10 +213,59 @@ def get_meeting(request, meeting_id):
             'roomName': room_name,
             'meetingType': meeting_type,
             'recordingEnabled': recording_enabled,
+            'recordingUrl': meeting.recording_url if meeting.recording_path else None,
         })
     except Meeting.DoesNotExist:
         return Response({'error': 'Meeting not found'}, status=status.HTTP_404_NOT_FOUND)
 
+# Upper bound on tokens minted by a single prefetch request
+MAX_PREFETCH_MEETINGS = 50
+
+@api_view(['POST'])
+def prefetch_meeting_tokens(request):
+    """Pre-mint Twilio tokens for the doctor's upcoming meetings so joining a call doesn't wait on signing"""
+    if not request.user.is_authenticated:
+        return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    if request.user.role != 'doctor':
+        return Response({'error': 'Only doctors can prefetch meeting tokens'}, status=status.HTTP_403_FORBIDDEN)
+
+    now = timezone.now()
+    meetings = Meeting.objects.filter(doctor__user=request.user)
+    meeting_ids = request.data.get('meetingIds')
+    if meeting_ids:
+        if not isinstance(meeting_ids, list):
+            return Response({'error': 'meetingIds must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            meetings = meetings.filter(id__in=meeting_ids)
+        except ValidationError:
+            return Response({'error': 'Invalid meeting ID'}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        # Calls in progress plus anything starting within the prefetch window
+        meetings = meetings.filter(
+            Q(status='in_progress') |
+            Q(status='scheduled', scheduled_at__gte=now - timedelta(hours=1),
+              scheduled_at__lte=now + timedelta(hours=settings.TWILIO_PREFETCH_WINDOW_HOURS))
+        ).order_by('scheduled_at')
+
+    room_names = [str(meeting_id) for meeting_id in meetings.values_list('id', flat=True)[:MAX_PREFETCH_MEETINGS]]
+
+    tokens = get_room_tokens(room_names, request.user.email) if room_names else {}
+    if tokens is None:
+        return Response({'error': 'Video service not configured'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    return Response({
+        'tokens': [
+            {
+                'meetingId': room_name,
+                'roomName': room_name,
+                'twilioToken': tokens[room_name]['token'],
+                'expiresAt': tokens[room_name]['expires_at'],
+            }
+            for room_name in room_names if room_name in tokens
+        ],
+    })
+
 @api_view(['POST'])
 def update_consent(request, meeting_id):
     if not request.user.is_authenticated:
@@ -208,7 +274,7 @@ def update_consent(request, meeting_id):
     consent_status = request.data.get('status')
     
     try:
-        meeting = Meeting.objects.get(id=meeting_id)
+        meeting = locate(Meeting.objects, id=meeting_id)
         consent, created = RecordingConsent.objects.get_or_create(
             meeting=meeting,
             user=request.user,
@@ -232,7 +298,7 @@ def participant_event(request, meeting_id):
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
     try:
-        meeting = Meeting.objects.select_related('doctor__user', 'patient__user').get(id=meeting_id)
+        meeting = locate(Meeting.objects.select_related('doctor__user', 'patient__user'), id=meeting_id)
         event = request.data.get('event')  # 'joined' or 'left'
         participant_name = request.data.get('participantName', request.user.name)
         
@@ -275,7 +341,7 @@ def start_recording(request, meeting_id):
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
     try:
-        meeting = Meeting.objects.get(id=meeting_id)
+        meeting = locate(Meeting.objects, id=meeting_id)
         meeting.status = 'in_progress'
         meeting.started_at = timezone.now()
         meeting.save()
@@ -291,7 +357,7 @@ def stop_recording(request, meeting_id):
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
     try:
-        meeting = Meeting.objects.get(id=meeting_id)
+        meeting = locate(Meeting.objects, id=meeting_id)
         # Don't change status here - recording will be uploaded when MediaRecorder stops
         # The status will be updated by upload_recording endpoint
         logger.info(f"Recording stopped for meeting {meeting_id} by {request.user.email}")
@@ -309,7 +375,7 @@ def end_meeting(request, meeting_id):
         return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
     try:
-        meeting = Meeting.objects.get(id=meeting_id)
+        meeting = locate(Meeting.objects, id=meeting_id)
         
         # Set ended_at timestamp
         if not meeting.ended_at:
@@ -341,6 +407,104 @@ def end_meeting(request, meeting_id):
         logger.error(f"Traceback: {traceback.format_exc()}")
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def format_speaker_transcript(utterances, text):
+    """Render (speaker, text) utterances as "Speaker A: ..." lines, falling back to the plain text"""
+    if utterances:
+        # Build a formatted transcript with speaker labels (Speaker A, Speaker B, etc.)
+        formatted_transcript = "\n".join(f"Speaker {speaker}: {utterance_text}" for speaker, utterance_text in utterances)
+        logger.info(f"Formatted transcript with {len(utterances)} utterances from {len(set(speaker for speaker, _ in utterances))} speakers")
+        return formatted_transcript
+    # Fallback to plain text if utterances not available
+    logger.warning("Speaker diarization utterances not available, using plain transcript")
+    return text
+
+def note_participant_names(meeting):
+    doctor_name = meeting.doctor.user.name if meeting.doctor else "Doctor"
+    patient_name = meeting.patient.user.name if meeting.patient else "Patient"
+    return doctor_name, patient_name
+
+def save_generated_note(meeting, result, formatted_transcript, original_transcript, has_speaker_labels):
+    """Store the CallNote for a transcribed recording, notify the doctor and complete the meeting"""
+    ai_response = result['raw_response']
+    if result['notes'] is not None:
+        # Create CallNote with parsed data; transcripts are kept compressed in
+        # transcript_blobs (the formatted one is meeting.transcript)
+        call_note, _ = create_cached_note(
+            meeting,
+            notes_cache_key(formatted_transcript, style='speaker'),
+            **call_note_fields(result['notes']),
+            source_transcript=store_text(original_transcript),
+            ai_metadata={
+                'parsed': True,
+                'has_speaker_labels': has_speaker_labels,
+                'prompt_version': NOTES_PROMPT_VERSION,
+                'model': NOTES_MODEL,
+                'strategy': result['strategy'],
+                'chunks': result['chunks'],
+                'usage': result['usage']
+            }
+        )
+        
+        logger.info(f"CallNote created successfully for meeting {meeting.id}, note ID: {call_note.id}")
+        
+        # Notify doctor that notes are ready
+        create_notification(
+            user=meeting.doctor.user,
+            notification_type='note',
+            title='AI Notes Ready',
+            message=f'Clinical notes for {meeting.patient.user.name if meeting.patient else "patient"} are ready',
+            link='/doctor/notes'
+        )
+        
+        meeting.status = 'completed'
+        meeting.save()
+        
+        logger.info(f"Meeting {meeting.id} completed successfully with AI notes")
+    else:
+        # Fallback: create note with raw response
+        CallNote.objects.create(
+            meeting=meeting,
+            chief_complaint=ai_response[:500] if ai_response else '',
+            source_transcript=store_text(original_transcript),
+            raw_response=store_text(ai_response),
+            ai_metadata={'parsed': False, 'error': result['error']}
+        )
+        meeting.status = 'completed'
+        meeting.save()
+        logger.warning(f"Created CallNote with unparsed AI response for meeting {meeting.id}")
+
+def persist_recording(request, meeting, audio_file):
+    """Store the uploaded recording and expose it through the recording endpoint"""
+    try:
+        store_recording(meeting, audio_file)
+    except Exception as e:
+        # Losing the copy must not cost the doctor their transcript and notes
+        logger.error(f"Failed to store recording for meeting {meeting.id}: {str(e)}")
+        return
+    meeting.recording_url = request.build_absolute_uri(f'/api/meetings/{meeting.id}/recording')
+    meeting.save(update_fields=['recording_url'])
+
+@api_view(['GET'])
+def get_recording(request, meeting_id):
+    """Stream a meeting recording to its doctor or patient (supports Range for seeking)"""
+    if not request.user.is_authenticated:
+        return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    try:
+        meeting = locate(Meeting.objects.select_related('doctor__user', 'patient__user'), id=meeting_id)
+    except Meeting.DoesNotExist:
+        return Response({'error': 'Meeting not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    participants = [meeting.doctor.user_id, meeting.patient.user_id if meeting.patient else None]
+    if request.user.id not in participants:
+        return Response({'error': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
+    
+    storage = get_media_storage()
+    if not meeting.recording_path or not storage.exists(meeting.recording_path):
+        return Response({'error': 'Recording not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return storage.serve(request, meeting.recording_path, cache_control='private, max-age=86400')
+
 @api_view(['POST'])
 def upload_recording(request, meeting_id):
     if not request.user.is_authenticated:
@@ -349,7 +513,7 @@ def upload_recording(request, meeting_id):
     try:
         import assemblyai as aai
         
-        meeting = Meeting.objects.get(id=meeting_id)
+        meeting = locate(Meeting.objects, id=meeting_id)
         
         # Check for both 'audio' and 'recording' field names
         audio_file = None
@@ -359,6 +523,8 @@ def upload_recording(request, meeting_id):
             audio_file = request.FILES['recording']
         
         if audio_file:
+            # Keep the audio so doctors can play it back; transcription reads the same upload
+            persist_recording(request, meeting, audio_file)
             
             assemblyai_key = os.getenv('ASSEMBLYAI_API_KEY')
             if not assemblyai_key:
@@ -409,21 +575,10 @@ def upload_recording(request, meeting_id):
                     
                     # Format transcript with speaker labels for better AI understanding
                     # AssemblyAI provides utterances with speaker labels when diarization is enabled
-                    formatted_transcript = transcript.text
-                    if hasattr(transcript, 'utterances') and transcript.utterances:
-                        # Build a formatted transcript with speaker labels (Speaker A, Speaker B, etc.)
-                        formatted_parts = []
-                        for utterance in transcript.utterances:
-                            speaker_label = f"Speaker {utterance.speaker}"
-                            formatted_parts.append(f"{speaker_label}: {utterance.text}")
-                        formatted_transcript = "\n".join(formatted_parts)
-                        logger.info(f"Formatted transcript with {len(transcript.utterances)} utterances from {len(set(u.speaker for u in transcript.utterances))} speakers")
-                    else:
-                        # Fallback to plain text if utterances not available
-                        formatted_transcript = transcript.text
-                        logger.warning("Speaker diarization utterances not available, using plain transcript")
+                    utterances = [(u.speaker, u.text) for u in transcript.utterances] if getattr(transcript, 'utterances', None) else None
+                    formatted_transcript = format_speaker_transcript(utterances, transcript.text)
                     
-                    meeting.transcript_text = formatted_transcript
+                    set_meeting_transcript(meeting, formatted_transcript)
                     meeting.status = 'transcription_completed'
                     meeting.save()
                     
@@ -433,115 +588,17 @@ def upload_recording(request, meeting_id):
                         logger.info("Generating AI notes with Groq using speaker-labeled transcript...")
                         
                         # Get doctor and patient names for better context
-                        doctor_name = meeting.doctor.user.name if meeting.doctor else "Doctor"
-                        patient_name = meeting.patient.user.name if meeting.patient else "Patient"
-                        
-                        prompt = f"""You are a clinical summarization assistant. Analyze this medical consultation transcript and extract structured clinical notes.
-
-IMPORTANT: This transcript contains a TWO-WAY conversation between a doctor and patient. The transcript includes speaker labels (Speaker A, Speaker B, etc.). 
-- Speaker A is typically the {doctor_name} (doctor)
-- Speaker B is typically the {patient_name} (patient)
-
-Focus on extracting information from BOTH the patient's statements (chief complaint, symptoms, history) AND the doctor's observations and assessments.
-
-Transcript with speaker labels:
-{formatted_transcript}
-
-Provide a JSON object with the following structure (return ONLY valid JSON, no markdown):
-{{
-  "chiefComplaint": "Main reason for visit (from patient's statements)",
-  "hpi": "History of present illness (from patient's description and doctor's questions)",
-  "pastMedicalHistory": "Past medical conditions mentioned by patient",
-  "medications": "Current medications mentioned by patient",
-  "allergies": "Known allergies mentioned by patient",
-  "examObservations": "Physical examination findings mentioned by doctor",
-  "assessment": "Clinical assessment and diagnosis from doctor",
-  "plan": "Treatment plan, tests ordered, prescriptions, and follow-up instructions from doctor",
-  "urgentFlags": ["Any urgent issues that need immediate attention"],
-  "followUpQuestions": ["3 short follow-up questions for the patient"]
-}}
-
-CRITICAL INSTRUCTIONS:
-- Extract information from BOTH patient responses AND doctor questions/observations
-- Do NOT hallucinate medications or tests - only include what was actually mentioned
-- If something is uncertain, mark it as "uncertain" or "not mentioned"
-- Keep all fields brief and factual
-- The patient's statements contain their symptoms and history
-- The doctor's statements contain observations, assessments, and treatment plans"""
+                        doctor_name, patient_name = note_participant_names(meeting)
                         
                         try:
-                            response = groq_client.chat.completions.create(
-                                model="openai/gpt-oss-120b",
-                                messages=[{"role": "user", "content": prompt}],
-                                temperature=0.3,
-                                max_tokens=2000
+                            result = generate_call_notes(
+                                groq_client,
+                                formatted_transcript,
+                                style='speaker',
+                                doctor_name=doctor_name,
+                                patient_name=patient_name
                             )
-                            
-                            ai_response = response.choices[0].message.content
-                            logger.info(f"AI response received, length: {len(ai_response)}")
-                            
-                            # Try to parse JSON response
-                            import json
-                            import re
-                            
-                            # Remove markdown code blocks if present
-                            ai_response_cleaned = re.sub(r'```json\s*', '', ai_response)
-                            ai_response_cleaned = re.sub(r'```\s*$', '', ai_response_cleaned).strip()
-                            
-                            try:
-                                notes_data = json.loads(ai_response_cleaned)
-                                
-                                # Create CallNote with parsed data including speaker-labeled transcript
-                                call_note = CallNote.objects.create(
-                                    meeting=meeting,
-                                    chief_complaint=notes_data.get('chiefComplaint', ''),
-                                    hpi=notes_data.get('hpi', ''),
-                                    past_medical_history=notes_data.get('pastMedicalHistory', ''),
-                                    medications=notes_data.get('medications', ''),
-                                    allergies=notes_data.get('allergies', ''),
-                                    exam_observations=notes_data.get('examObservations', ''),
-                                    assessment=notes_data.get('assessment', ''),
-                                    plan=notes_data.get('plan', ''),
-                                    urgent_flags=notes_data.get('urgentFlags', []),
-                                    follow_up_questions=notes_data.get('followUpQuestions', []),
-                                    ai_metadata={
-                                        'raw_response': ai_response, 
-                                        'transcript': formatted_transcript, 
-                                        'original_transcript': transcript.text,
-                                        'parsed': True,
-                                        'has_speaker_labels': hasattr(transcript, 'utterances') and transcript.utterances is not None
-                                    }
-                                )
-                                
-                                logger.info(f"CallNote created successfully for meeting {meeting_id}, note ID: {call_note.id}")
-                                
-                                # Notify doctor that notes are ready
-                                create_notification(
-                                    user=meeting.doctor.user,
-                                    notification_type='note',
-                                    title='AI Notes Ready',
-                                    message=f'Clinical notes for {meeting.patient.user.name if meeting.patient else "patient"} are ready',
-                                    link='/doctor/notes'
-                                )
-                                
-                                meeting.status = 'completed'
-                                meeting.save()
-                                
-                                logger.info(f"Meeting {meeting_id} completed successfully with AI notes")
-                                
-                            except json.JSONDecodeError as json_err:
-                                logger.error(f"Failed to parse AI response as JSON: {json_err}")
-                                logger.error(f"AI response was: {ai_response_cleaned[:500]}")
-                                
-                                # Fallback: create note with raw response
-                                CallNote.objects.create(
-                                    meeting=meeting,
-                                    chief_complaint=ai_response[:500] if ai_response else '',
-                                    ai_metadata={'raw_response': ai_response, 'transcript': transcript.text, 'parsed': False, 'error': str(json_err)}
-                                )
-                                meeting.status = 'completed'
-                                meeting.save()
-                                logger.warning(f"Created CallNote with unparsed AI response for meeting {meeting_id}")
+                            save_generated_note(meeting, result, formatted_transcript, transcript.text, utterances is not None)
                                 
                         except Exception as groq_err:
                             logger.error(f"Error generating AI notes with Groq: {str(groq_err)}")
@@ -594,6 +651,91 @@ CRITICAL INSTRUCTIONS:
         logger.error(f"Traceback: {traceback.format_exc()}")
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _call_note_payload(call_note):
+    return {
+        'chiefComplaint': call_note.chief_complaint,
+        'hpi': call_note.hpi,
+        'pastMedicalHistory': call_note.past_medical_history,
+        'medications': call_note.medications,
+        'allergies': call_note.allergies,
+        'examObservations': call_note.exam_observations,
+        'assessment': call_note.assessment,
+        'plan': call_note.plan,
+        'urgentFlags': call_note.urgent_flags,
+        'followUpQuestions': call_note.follow_up_questions,
+    }
+
+def create_cached_note(meeting, cache_key, **fields):
+    """(note, created): a new CallNote under cache_key, or the one a concurrent request stored first"""
+    try:
+        with transaction.atomic(using=meeting._state.db):
+            return CallNote.objects.using(meeting._state.db).create(meeting=meeting, content_hash=cache_key, **fields), True
+    except IntegrityError:
+        # call_notes_meeting_content_hash: an identical request won the race
+        return CallNote.objects.using(meeting._state.db).get(meeting=meeting, content_hash=cache_key), False
+
+def claim_note_generation(meeting, cache_key):
+    """Take the short lock for generating this note; False if an identical request holds it"""
+    return cache.add(NOTES_LOCK_KEY.format(meeting_id=meeting.id, cache_key=cache_key), 1, NOTES_LOCK_SECONDS)
+
+def release_note_generation(meeting, cache_key):
+    cache.delete(NOTES_LOCK_KEY.format(meeting_id=meeting.id, cache_key=cache_key))
+
+def find_cached_note(meeting, cache_key):
+    """Return the response payload for an already generated note (counting the hit), or None"""
+    cached_note = CallNote.objects.filter(meeting=meeting, content_hash=cache_key).order_by('created_at').first()
+    if not cached_note:
+        return None
+    CallNote.objects.filter(id=cached_note.id).update(cache_hits=F('cache_hits') + 1)
+    logger.info(f"Note cache hit for meeting {meeting.id}, note ID: {cached_note.id}")
+    return {
+        'success': True,
+        'noteId': str(cached_note.id),
+        'notes': _call_note_payload(cached_note),
+        'cached': True,
+    }
+
+def store_generated_notes(meeting, result, cache_key):
+    """Store the CallNote for a generate_notes result and return the response payload"""
+    ai_response = result['raw_response']
+    ai_metadata = {
+        'prompt_version': NOTES_PROMPT_VERSION,
+        'model': NOTES_MODEL,
+        'strategy': result['strategy'],
+        'chunks': result['chunks'],
+        'usage': result['usage'],
+    }
+    
+    if result['notes'] is not None:
+        # Create CallNote with parsed data; only parsed notes are cached
+        call_note, created = create_cached_note(
+            meeting,
+            cache_key,
+            **call_note_fields(result['notes']),
+            ai_metadata={**ai_metadata, 'parsed': True}
+        )
+        
+        return {
+            'success': True,
+            'noteId': str(call_note.id),
+            'notes': _call_note_payload(call_note),
+            'cached': not created,
+        }
+    
+    # If JSON parsing fails, store as raw text in chief_complaint
+    CallNote.objects.create(
+        meeting=meeting,
+        chief_complaint=ai_response[:1000],  # Store more characters
+        raw_response=store_text(ai_response),
+        ai_metadata={**ai_metadata, 'parsed': False}
+    )
+    
+    return {
+        'success': True,
+        'notes': {'raw': ai_response},
+        'warning': 'Note stored as raw text - JSON parsing failed'
+    }
+
 @api_view(['POST'])
 def generate_notes(request):
     if not request.user.is_authenticated:
@@ -610,102 +752,26 @@ def generate_notes(request):
     except Meeting.DoesNotExist:
         return Response({'error': 'Meeting not found'}, status=status.HTTP_404_NOT_FOUND)
     
+    # Identical transcript + prompt version + model: return the note we already paid for
+    cache_key = notes_cache_key(transcript, style='markdown')
+    cached = find_cached_note(meeting, cache_key)
+    if cached:
+        return Response(cached)
+    
     groq_client = get_groq_client()
     if not groq_client:
         return Response({'error': 'AI service not configured'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     
-    prompt = f"""Analyze this medical consultation transcript and extract structured clinical notes. Return the response in valid JSON format with the following structure:
-
-{{
-  "chiefComplaint": "...",
-  "hpi": "...",
-  "pastMedicalHistory": "...",
-  "medications": "...",
-  "allergies": "...",
-  "examObservations": "...",
-  "assessment": "...",
-  "plan": "...",
-  "urgentFlags": [...],
-  "followUpQuestions": [...]
-}}
-
-IMPORTANT: 
-- Use markdown formatting (not HTML) for text fields
-- Use **bold** for emphasis, not HTML tags
-- Use newlines and markdown lists, not <br> or HTML entities
-- Use markdown tables for structured data
-- Do NOT use HTML tags like <br>, &nbsp;, etc.
-
-Transcript:
-{transcript}
-
-Return ONLY valid JSON, no additional text or markdown code blocks."""
+    # An identical request is already paying for this note: the client retries and gets it from the cache
+    if not claim_note_generation(meeting, cache_key):
+        response = Response(NOTES_PENDING, status=status.HTTP_202_ACCEPTED)
+        response['Retry-After'] = str(NOTES_PENDING_RETRY_SECONDS)
+        return response
     
     try:
-        response = groq_client.chat.completions.create(
-            model="openai/gpt-oss-120b",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=3000
-        )
-        
-        ai_response = response.choices[0].message.content.strip()
-        
-        # Try to parse JSON response
-        import json
-        import re
-        
-        # Remove markdown code blocks if present
-        ai_response_cleaned = re.sub(r'```json\s*', '', ai_response)
-        ai_response_cleaned = re.sub(r'```\s*$', '', ai_response_cleaned).strip()
-        
-        try:
-            notes_data = json.loads(ai_response_cleaned)
-            
-            # Create CallNote with parsed data
-            call_note = CallNote.objects.create(
-                meeting=meeting,
-                chief_complaint=notes_data.get('chiefComplaint', ''),
-                hpi=notes_data.get('hpi', ''),
-                past_medical_history=notes_data.get('pastMedicalHistory', ''),
-                medications=notes_data.get('medications', ''),
-                allergies=notes_data.get('allergies', ''),
-                exam_observations=notes_data.get('examObservations', ''),
-                assessment=notes_data.get('assessment', ''),
-                plan=notes_data.get('plan', ''),
-                urgent_flags=notes_data.get('urgentFlags', []),
-                follow_up_questions=notes_data.get('followUpQuestions', []),
-                ai_metadata={'raw_response': ai_response, 'parsed': True}
-            )
-            
-            return Response({
-                'success': True,
-                'noteId': str(call_note.id),
-                'notes': {
-                    'chiefComplaint': call_note.chief_complaint,
-                    'hpi': call_note.hpi,
-                    'pastMedicalHistory': call_note.past_medical_history,
-                    'medications': call_note.medications,
-                    'allergies': call_note.allergies,
-                    'examObservations': call_note.exam_observations,
-                    'assessment': call_note.assessment,
-                    'plan': call_note.plan,
-                    'urgentFlags': call_note.urgent_flags,
-                    'followUpQuestions': call_note.follow_up_questions,
-                }
-            })
-        except json.JSONDecodeError:
-            # If JSON parsing fails, store as raw text in chief_complaint
-            CallNote.objects.create(
-                meeting=meeting,
-                chief_complaint=ai_response[:1000],  # Store more characters
-                ai_metadata={'raw_response': ai_response, 'parsed': False}
-            )
-            
-            return Response({
-                'success': True,
-                'notes': {'raw': ai_response},
-                'warning': 'Note stored as raw text - JSON parsing failed'
-            })
+        result = generate_call_notes(groq_client, transcript, style='markdown')
+        return Response(store_generated_notes(meeting, result, cache_key))
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    finally:
+        release_note_generation(meeting, cache_key)
@@ -0,0 +1,211 @@
+"""
+Patient dashboard sections.
+
+Each section is a function of (patient, user, params). The standalone
+endpoints (stats, doctors, surveys/pending, appointments/upcoming, ...)
+and /api/patient/dashboard, which bundles them (see core/dashboard.py),
+call the same functions.
+
+A patient's doctors can be on different shards, so sections that read
+clinical data run once per shard (sharding.scatter) and merge the results
+in creation order.
+"""
+from datetime import timedelta
+from operator import itemgetter
+from django.db.models import Avg, Count, Max, Q
+from django.utils import timezone
+from teddybridge.apps.core.appointments import (
+    UPCOMING_STATUSES, appointment_page, appointment_statistics, parse_statuses, period_range
+)
+from teddybridge.apps.core.avatars import avatar_variant
+from teddybridge.apps.core.models import ChatMessage, DoctorPatientLink, DoctorReview, Meeting, Survey, SurveyResponse
+from teddybridge.apps.core.notifications import notification_feed
+from teddybridge.apps.core.sharding import scatter
+
+STATS_PERIOD_DAYS = {'week': 7, 'month': 30, 'year': 365}
+
+
+def _open_surveys(patient):
+    """Active surveys from the patient's doctors that the patient has not answered"""
+    # A literal id list, not a subquery: planners size an IN (subquery) as if it returned many
+    # doctors and then scan surveys on small tables instead of using (doctor, is_active)
+    doctor_ids = list(DoctorPatientLink.objects.filter(patient=patient).values_list('doctor_id', flat=True))
+    return Survey.objects.filter(doctor_id__in=doctor_ids, is_active=True).exclude(responses__patient=patient)
+
+
+def stats(patient, user, params):
+    """Headline counters for ?period= (week/month/year) and the period before it"""
+    now = timezone.now()
+    period_days = STATS_PERIOD_DAYS.get(params.get('period', 'month'), 30)
+    start_date = now - timedelta(days=period_days)
+    previous_start = start_date - timedelta(days=period_days)
+    parts = scatter(lambda: _shard_stats(patient, start_date, previous_start))
+    return {key: sum(part[key] for part in parts) for key in parts[0]}
+
+
+def _shard_stats(patient, start_date, previous_start):
+    current = Q(scheduled_at__gte=start_date)
+    previous = Q(scheduled_at__gte=previous_start, scheduled_at__lt=start_date)
+
+    meetings = Meeting.objects.filter(patient=patient).aggregate(
+        upcoming=Count('id', filter=Q(status__in=UPCOMING_STATUSES)),
+        completed=Count('id', filter=Q(status='completed') & current),
+        cancelled=Count('id', filter=Q(status='cancelled') & current),
+        previous_completed=Count('id', filter=Q(status='completed') & previous),
+        previous_cancelled=Count('id', filter=Q(status='cancelled') & previous),
+        total=Count('id'),
+    )
+    links = DoctorPatientLink.objects.filter(patient=patient).aggregate(
+        total=Count('id'),
+        previous=Count('id', filter=Q(linked_at__gte=previous_start, linked_at__lt=start_date)),
+    )
+    responses = SurveyResponse.objects.filter(patient=patient).aggregate(
+        total=Count('id'),
+        previous=Count('id', filter=Q(submitted_at__gte=previous_start, submitted_at__lt=start_date)),
+    )
+
+    return {
+        'totalDoctors': links['total'],
+        'upcomingAppointments': meetings['upcoming'],
+        'completedAppointments': meetings['completed'],
+        'cancelledAppointments': meetings['cancelled'],
+        'totalConsultations': meetings['total'],
+        'pendingSurveys': _open_surveys(patient).count(),
+        'completedSurveys': responses['total'],
+        # Previous period data for growth calculation
+        'previousTotalDoctors': links['previous'],
+        'previousCompletedSurveys': responses['previous'],
+        'previousCompletedAppointments': meetings['previous_completed'],
+        'previousCancelledAppointments': meetings['previous_cancelled'],
+    }
+
+
+def doctors(patient, user, params):
+    """The patient's doctors with ratings, unread messages and appointment history"""
+    merged = [doctor for part in scatter(lambda: _shard_doctors(patient, user)) for doctor in part]
+    return sorted(merged, key=itemgetter('linkedAt'))
+
+
+def _shard_doctors(patient, user):
+    links = DoctorPatientLink.objects.filter(patient=patient).select_related('doctor__user')
+
+    # Get reviews for each doctor
+    doctor_ids = [link.doctor.id for link in links]
+    reviews_data = DoctorReview.objects.filter(doctor_id__in=doctor_ids).values('doctor_id').annotate(
+        avg_rating=Avg('rating'),
+        review_count=Count('id')
+    )
+    reviews_dict = {str(r['doctor_id']): {'avgRating': float(r['avg_rating']) if r['avg_rating'] else None, 'reviewCount': r['review_count']} for r in reviews_data}
+
+    # Check if patient has reviewed each doctor
+    patient_reviews = {str(r['doctor_id']): r['rating'] for r in DoctorReview.objects.filter(patient=patient, doctor_id__in=doctor_ids).values('doctor_id', 'rating')}
+
+    # Get unread message counts for each doctor
+    doctor_user_ids = [link.doctor.user.id for link in links]
+    unread_counts = ChatMessage.objects.filter(
+        sender_id__in=doctor_user_ids,
+        receiver=user,
+        is_read=False
+    ).values('sender_id').annotate(count=Count('id'))
+    unread_dict = {str(r['sender_id']): r['count'] for r in unread_counts}
+
+    # Get appointment counts and last consultation date for each doctor
+    appointment_counts = Meeting.objects.filter(
+        patient=patient,
+        doctor_id__in=doctor_ids
+    ).values('doctor_id').annotate(
+        appointment_count=Count('id'),
+        last_consultation=Max('scheduled_at')
+    )
+    appointments_dict = {
+        str(r['doctor_id']): {
+            'appointmentCount': r['appointment_count'],
+            'lastConsultation': r['last_consultation'].isoformat() if r['last_consultation'] else None
+        }
+        for r in appointment_counts
+    }
+
+    result = []
+    for link in links:
+        doctor_id_str = str(link.doctor.id)
+        doctor_user_id_str = str(link.doctor.user.id)
+        review_info = reviews_dict.get(doctor_id_str, {'avgRating': None, 'reviewCount': 0})
+        patient_rating = patient_reviews.get(doctor_id_str)
+        unread_count = unread_dict.get(doctor_user_id_str, 0)
+        appointment_info = appointments_dict.get(doctor_id_str, {'appointmentCount': 0, 'lastConsultation': None})
+
+        result.append({
+            'id': doctor_id_str,  # Doctor model ID (for reviews)
+            'userId': doctor_user_id_str,  # User ID (for peer chat)
+            'name': link.doctor.user.name,
+            'email': link.doctor.user.email,
+            'specialty': link.doctor.specialty,
+            'avatar': avatar_variant(link.doctor.user.avatar_url, 128),
+            'bio': link.doctor.bio,
+            'linkedAt': link.linked_at.isoformat(),
+            'avgRating': review_info['avgRating'],
+            'reviewCount': review_info['reviewCount'],
+            'patientRating': patient_rating,
+            'unreadMessageCount': unread_count,
+            'appointmentCount': appointment_info['appointmentCount'],
+            'lastConsultation': appointment_info['lastConsultation'],
+        })
+
+    return result
+
+
+def pending_surveys(patient, user, params):
+    merged = [survey for part in scatter(lambda: _shard_pending_surveys(patient)) for survey in part]
+    return sorted(merged, key=itemgetter('assignedAt'))
+
+
+def _shard_pending_surveys(patient):
+    result = []
+    for s in _open_surveys(patient).select_related('doctor__user'):
+        # If assigned_patients is None or empty, show to all patients
+        # Otherwise, only show if patient ID is in the list
+        if not s.assigned_patients or str(patient.id) in s.assigned_patients:
+            result.append({
+                'id': str(s.id),
+                'title': s.title,
+                'doctorName': s.doctor.user.name,
+                'assignedAt': s.created_at.isoformat(),
+                'questionCount': len(s.questions) if s.questions else 0,
+            })
+    return result
+
+
+def upcoming_appointments(patient, user, params):
+    start_date, end_date = period_range(params.get('filter', 'all'))  # today, week, month, all
+    return appointment_page(
+        params, 'patient', 20, descending=False,
+        patient=patient, statuses=UPCOMING_STATUSES, start=start_date, end=end_date,
+    )
+
+
+def recent_appointments(patient, user, params):
+    # status: all, completed, upcoming, cancelled (or a single meeting status)
+    return appointment_page(
+        params, 'patient', 10,
+        patient=patient, statuses=parse_statuses(params.get('status', 'all')),
+    )
+
+
+def appointment_chart(patient, user, params):
+    return appointment_statistics(params.get('period', 'monthly'), 'upcoming', patient=patient)  # monthly, weekly, yearly
+
+
+def notifications(patient, user, params):
+    return notification_feed(user)
+
+
+SECTIONS = {
+    'stats': stats,
+    'doctors': doctors,
+    'pendingSurveys': pending_surveys,
+    'upcomingAppointments': upcoming_appointments,
+    'recentAppointments': recent_appointments,
+    'appointmentStatistics': appointment_chart,
+    'notifications': notifications,
+}
+PAGED_SECTIONS = {'upcomingAppointments', 'recentAppointments'}
@@ -2,6 +2,8 @@ from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from teddybridge.apps.core.models import Patient, DoctorPatientLink, Meeting, Doctor, DoctorReview
+from teddybridge.apps.core.avatars import avatar_variant
+from teddybridge.apps.core.sharding import doctor_shard_alias
 
 @api_view(['POST'])
 def submit_review(request):
@@ -34,8 +36,11 @@ def submit_review(request):
     except Doctor.DoesNotExist:
         return Response({'error': 'Doctor not found'}, status=status.HTTP_404_NOT_FOUND)
     
+    # Links, meetings and reviews live on the doctor's shard
+    shard = doctor_shard_alias(doctor.id)
+    
     # Check if patient is linked to this doctor
-    link = DoctorPatientLink.objects.filter(patient=patient, doctor=doctor).first()
+    link = DoctorPatientLink.objects.using(shard).filter(patient=patient, doctor=doctor).first()
     if not link:
         return Response({'error': 'You must be linked to this doctor to submit a review'}, status=status.HTTP_403_FORBIDDEN)
     
@@ -43,11 +48,11 @@ def submit_review(request):
     meeting = None
     if meeting_id:
         try:
-            meeting = Meeting.objects.get(id=meeting_id, patient=patient, doctor=doctor)
+            meeting = Meeting.objects.using(shard).get(id=meeting_id, patient=patient, doctor=doctor)
         except Meeting.DoesNotExist:
             pass
     
-    review, created = DoctorReview.objects.update_or_create(
+    review, created = DoctorReview.objects.using(shard).update_or_create(
         doctor=doctor,
         patient=patient,
         defaults={
@@ -74,14 +79,14 @@ def get_doctor_reviews(request, doctor_id):
     except Doctor.DoesNotExist:
         return Response({'error': 'Doctor not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    reviews = DoctorReview.objects.filter(doctor=doctor).select_related('patient__user').order_by('-created_at')
+    reviews = DoctorReview.objects.using(doctor_shard_alias(doctor.id)).filter(doctor=doctor).select_related('patient__user').order_by('-created_at')
     
     result = [{
         'id': str(r.id),
         'rating': r.rating,
         'comment': r.comment,
         'patientName': 'Anonymous' if r.is_anonymous else r.patient.user.name,
-        'patientAvatar': None if r.is_anonymous else r.patient.user.avatar_url,
+        'patientAvatar': None if r.is_anonymous else avatar_variant(r.patient.user.avatar_url, 48),
         'createdAt': r.created_at.isoformat(),
         'updatedAt': r.updated_at.isoformat(),
     } for r in reviews]
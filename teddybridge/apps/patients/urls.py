@@ -2,6 +2,7 @@ from django.urls import path
 from . import views, review_views
 
 urlpatterns = [
+    path('dashboard', views.patient_dashboard),
     path('stats', views.patient_stats),
     path('doctors', views.get_doctors),
     path('doctors/<uuid:doctor_id>', views.get_doctor),
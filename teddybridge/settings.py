@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from corsheaders.defaults import default_headers as default_cors_headers
 from dotenv import load_dotenv
 from rest_framework.authentication import SessionAuthentication
 
@@ -30,8 +31,10 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'teddybridge.apps.core.db_routing.ReplicaRoutingMiddleware',  # No-op without DATABASE_REPLICA_URLS
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'teddybridge.apps.core.sharding.ShardRoutingMiddleware',  # No-op without DATABASE_SHARD_URLS
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,6 +61,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'teddybridge.wsgi.application'
+ASGI_APPLICATION = 'teddybridge.asgi.application'
+
+# Serve the AI/transcription endpoints with async views (requires the ASGI entry point, see DEPLOYMENT_GUIDE.md)
+ASYNC_VIEWS = os.getenv('DJANGO_ASYNC_VIEWS', 'False') == 'True'
 
 # Database Configuration
 # Use PostgreSQL in production (Render) if DATABASE_URL is set, otherwise use SQLite for local development
@@ -82,8 +89,52 @@ else:
         }
     }
 
+DATABASE_ROUTERS = []
+
+# Per-doctor sharding of clinical data (see core/sharding.py): comma-separated URLs of extra shards.
+# 'default' stays a shard too; run `manage.py migrate --database=shardN` for each new one
+DATABASE_SHARD_URLS = [url.strip() for url in os.getenv('DATABASE_SHARD_URLS', '').split(',') if url.strip()]
+SHARD_DATABASES = ['default'] + [f'shard{index}' for index in range(1, len(DATABASE_SHARD_URLS) + 1)] if DATABASE_SHARD_URLS else []
+if DATABASE_SHARD_URLS:
+    import dj_database_url
+    for alias, shard_url in zip(SHARD_DATABASES[1:], DATABASE_SHARD_URLS):
+        DATABASES[alias] = dj_database_url.parse(shard_url, conn_max_age=600, conn_health_checks=True)
+    DATABASE_ROUTERS.append('teddybridge.apps.core.sharding.ShardRouter')
+SHARD_MOVE_GRACE_SECONDS = float(os.getenv('SHARD_MOVE_GRACE_SECONDS', '2'))  # Writes already routed to the old shard finish in this window
+
+# Read replicas (see core/db_routing.py): comma-separated URLs, e.g. a second SQLite file locally
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_DATABASES = [f'replica{index}' for index in range(1, len(DATABASE_REPLICA_URLS) + 1)]
+if DATABASE_REPLICA_URLS:
+    import dj_database_url
+    for alias, replica_url in zip(REPLICA_DATABASES, DATABASE_REPLICA_URLS):
+        DATABASES[alias] = dj_database_url.parse(replica_url, conn_max_age=600, conn_health_checks=True)
+        DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS.append('teddybridge.apps.core.db_routing.ReplicaRouter')
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))  # Reads stay on the primary this long after a session writes
+
 AUTH_USER_MODEL = 'core.User'
 
+# Cache Configuration
+# Use Redis when REDIS_URL is set so cached data (and its invalidation) is shared by all workers,
+# otherwise fall back to a per-process in-memory cache for local development
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'teddybridge',
+        }
+    }
+
 AUTHENTICATION_BACKENDS = [
     'teddybridge.apps.core.backends.EmailAuthBackend',  # Custom backend for email auth
     'django.contrib.auth.backends.ModelBackend',  # Fallback to default backend
@@ -109,6 +160,11 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media storage (see core/storage.py)
+MEDIA_STORAGE_BACKEND = os.getenv('MEDIA_STORAGE_BACKEND', 'teddybridge.apps.core.storage.LocalMediaStorage')
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE', '')  # '', 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd)
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')  # nginx internal location aliased to MEDIA_ROOT
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
@@ -129,6 +185,8 @@ REST_FRAMEWORK = {
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'ETag']  # Cursor for the next page of list endpoints; validators (core/versions.py)
+CORS_ALLOW_HEADERS = (*default_cors_headers, 'if-none-match')  # Conditional GET from clients that send validators themselves
 
 # Session Cookie Configuration
 # For production (HTTPS), use 'None' and Secure=True for cross-origin cookies
@@ -151,3 +209,58 @@ CSRF_COOKIE_SECURE = IS_PRODUCTION  # True for HTTPS, False for HTTP
 
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 ASSEMBLYAI_API_KEY = os.getenv('ASSEMBLYAI_API_KEY')
+
+# Twilio Video (see meetings/twilio_utils.py)
+TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
+TWILIO_API_KEY = os.getenv('TWILIO_API_KEY')
+TWILIO_API_SECRET = os.getenv('TWILIO_API_SECRET')
+TWILIO_TOKEN_TTL = int(os.getenv('TWILIO_TOKEN_TTL', '3600'))  # Lifetime of minted access tokens in seconds
+TWILIO_TOKEN_REFRESH_MARGIN = int(os.getenv('TWILIO_TOKEN_REFRESH_MARGIN', '300'))  # Re-mint cached tokens this long before expiry
+TWILIO_PREFETCH_WINDOW_HOURS = int(os.getenv('TWILIO_PREFETCH_WINDOW_HOURS', '24'))  # Upcoming meetings covered by tokens/prefetch
+
+# Daily.co rooms (see meetings/room_provisioning.py)
+DAILY_API_KEY = os.getenv('DAILY_API_KEY')
+DAILY_API_BASE_URL = os.getenv('DAILY_API_BASE_URL', 'https://api.daily.co/v1')  # Point at a stub server for local testing
+DAILY_REQUEST_TIMEOUT = float(os.getenv('DAILY_REQUEST_TIMEOUT', '10'))  # Seconds per HTTP request
+DAILY_MAX_RETRIES = int(os.getenv('DAILY_MAX_RETRIES', '4'))  # Retries on 429/5xx/connection errors
+DAILY_PROVISION_WORKERS = int(os.getenv('DAILY_PROVISION_WORKERS', '8'))  # Concurrent room requests
+DAILY_PROVISION_BATCH_SIZE = int(os.getenv('DAILY_PROVISION_BATCH_SIZE', '100'))  # Meetings per bulk_update
+
+# Doctor link QR codes (see doctors/qr_service.py)
+QR_TOKEN_TTL_HOURS = int(os.getenv('QR_TOKEN_TTL_HOURS', '24'))  # Lifetime of a link token
+QR_BATCH_MAX = int(os.getenv('QR_BATCH_MAX', '200'))  # Max tokens per printable batch
+QR_BATCH_PROCESS_THRESHOLD = int(os.getenv('QR_BATCH_PROCESS_THRESHOLD', '24'))  # Smaller batches render in-process
+QR_RENDER_PROCESSES = int(os.getenv('QR_RENDER_PROCESSES', '2'))  # Process pool size for batch rendering
+
+# PROMS reports (see doctors/proms_reports.py)
+REPORT_RENDER_PROCESSES = int(os.getenv('REPORT_RENDER_PROCESSES', '2'))  # Process pool size for bulk exports
+REPORT_PROCESS_THRESHOLD = int(os.getenv('REPORT_PROCESS_THRESHOLD', '8'))  # Fewer cache misses render in-process
+
+# Conditional GET (see core/versions.py). Version tokens are replaced on write and never expire with REDIS_URL.
+# Without it each worker (and each cron command) has its own tokens, so a write elsewhere is only noticed when this
+# worker's token expires: keep that short, or clients revalidate stale bodies with 304s indefinitely
+RESOURCE_VERSION_TTL = int(os.getenv('RESOURCE_VERSION_TTL', '15')) if not REDIS_URL else None
+
+# Delta sync (see core/sync.py)
+SYNC_RETENTION_DAYS = int(os.getenv('SYNC_RETENTION_DAYS', '30'))  # Change log kept this long; older tokens get a reset
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', '500'))  # Max change log rows per /api/sync response
+SYNC_SETTLE_SECONDS = int(os.getenv('SYNC_SETTLE_SECONDS', '5'))  # Newer rows wait for the next poll; above insert time plus clock skew
+
+# Transcript storage (see core/transcripts.py)
+TRANSCRIPT_COMPRESSION = os.getenv('TRANSCRIPT_COMPRESSION', 'zlib')  # 'zlib', or 'zstd' (requires the zstandard package)
+
+# Teddy AI assistant
+TEDDY_CONTEXT_TOKEN_BUDGET = int(os.getenv('TEDDY_CONTEXT_TOKEN_BUDGET', '800'))  # Max tokens of per-user context in the system prompt
+# Snapshots are invalidated on write (core/signals.py), so the TTL is only a safety net. Without REDIS_URL the
+# invalidation only reaches the worker that handled the write and the others serve their copy until it expires,
+# so the default drops to a minute; set REDIS_URL for multi-worker deployments
+TEDDY_CONTEXT_TTL = int(os.getenv('TEDDY_CONTEXT_TTL', str(60 * 60 * 6 if REDIS_URL else 60)))
+TEDDY_HISTORY_TOKEN_BUDGET = int(os.getenv('TEDDY_HISTORY_TOKEN_BUDGET', '1500'))  # Max tokens of recent turns replayed per request
+TEDDY_SUMMARY_TOKEN_BUDGET = int(os.getenv('TEDDY_SUMMARY_TOKEN_BUDGET', '300'))  # Max size of the running conversation summary
+TEDDY_RECENT_TURNS_KEPT = int(os.getenv('TEDDY_RECENT_TURNS_KEPT', '4'))  # Messages left verbatim when older turns are summarized
+
+# Clinical note generation (see meetings/note_generation.py)
+NOTES_SINGLE_SHOT_TOKEN_LIMIT = int(os.getenv('NOTES_SINGLE_SHOT_TOKEN_LIMIT', '12000'))  # Larger prompts switch to map-reduce
+NOTES_CHUNK_TOKENS = int(os.getenv('NOTES_CHUNK_TOKENS', '4000'))  # Transcript tokens per map chunk
+NOTES_MAP_MAX_TOKENS = int(os.getenv('NOTES_MAP_MAX_TOKENS', '800'))  # Output budget for each chunk's findings
+NOTES_MAP_WORKERS = int(os.getenv('NOTES_MAP_WORKERS', '4'))  # Concurrent Groq calls during the map step
@@ -1,7 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 
 from teddybridge.apps.core import views as core_views
 from teddybridge.apps.core.urls import user_urlpatterns
@@ -25,7 +24,8 @@ urlpatterns = [
     path('api/surveys/<uuid:survey_id>', survey_views.get_survey),
     path('api/surveys/<uuid:survey_id>/respond', survey_views.submit_survey_response),
     path('api/peers/', include('teddybridge.apps.core.peer_urls')),
+    path('api/sync', core_views.sync_changes),
+    # Media is served through core/storage.py in every environment (Range/ETag, optional sendfile offload)
+    path(f"{settings.MEDIA_URL.strip('/')}/avatars/<str:filename>", core_views.serve_avatar),
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:name>", core_views.serve_media),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)